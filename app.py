@@ -29,5 +29,6 @@ if __name__ == "__main__":
     app.run(
         host=HOST,
         port=PORT,
-        debug=False  # Disable debug in production
+        debug=False,  # Disable debug in production
+        threaded=True  # Conversions of concurrent requests run in parallel
     ) 
\ No newline at end of file
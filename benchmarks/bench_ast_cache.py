@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Measure re-converting one upload with every option set, with and without the AST cache.
+
+Without the cache each option set runs pandoc's DOCX reader again; with it the
+document is parsed once and every option set only renders the cached AST.
+
+Usage:
+    python benchmarks/bench_ast_cache.py [--pages N] [--variant text|images|tables|lists|math]
+"""
+
+import argparse
+import itertools
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from converter import convert_docx_to_latex
+from corpus import VARIANTS, create_variant_docx
+
+
+def convert_all_option_sets(docx_path: str, work_dir: str, label: str, ast_cache_dir: str = None) -> float:
+    start = time.perf_counter()
+    for i, (toc, overleaf, styles, linebreaks) in enumerate(itertools.product((False, True), repeat=4)):
+        success, message = convert_docx_to_latex(
+            docx_path,
+            os.path.join(work_dir, f"{label}_{i}.tex"),
+            generate_toc=toc,
+            extract_media_to_path=os.path.join(work_dir, f"{label}_{i}_media"),
+            overleaf_compatible=overleaf,
+            preserve_styles=styles,
+            preserve_linebreaks=linebreaks,
+            ast_cache_dir=ast_cache_dir
+        )
+        if not success:
+            raise SystemExit(message)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=100, help="size of the generated document")
+    parser.add_argument('--variant', default='text', choices=VARIANTS, help="kind of generated document")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        docx_path = create_variant_docx(os.path.join(work_dir, "source.docx"), args.pages, args.variant)
+        uncached = convert_all_option_sets(docx_path, work_dir, 'uncached')
+        cached = convert_all_option_sets(docx_path, work_dir, 'cached', os.path.join(work_dir, 'ast'))
+
+    print(f"16 option sets, {args.pages}-page {args.variant} document")
+    print(f"{'DOCX reader each time':<24} {uncached:>8.2f}s")
+    print(f"{'cached AST':<24} {cached:>8.2f}s  ({uncached / cached:.2f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the ast_post_processing conversion option.
+
+Converts every synthetic corpus variant in memory with the markup passes
+run on the LaTeX (the default) and with postprocess_filter.lua doing their
+work on pandoc's AST. Reports the best total conversion time of each mode,
+the time spent in the Python post-processing pipeline, and how many lines
+of the two outputs differ.
+
+Usage:
+    python benchmarks/bench_ast_filter.py [--pages N] [--repeat N]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from converter import ConversionOptions, Converter
+from corpus import VARIANTS, create_variant_docx
+
+
+def convert(converter: Converter, data: bytes, ast_post_processing: bool, repeat: int) -> tuple:
+    """Returns (best total seconds, pipeline seconds of that run, LaTeX)."""
+    options = ConversionOptions(overleaf_compatible=True, ast_post_processing=ast_post_processing)
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = converter.convert_bytes(data, options)
+        seconds = time.perf_counter() - start
+        if not result.success:
+            raise SystemExit(f"Conversion failed: {result.message}")
+        if best is None or seconds < best[0]:
+            best = (seconds, sum(stats.seconds for stats in result.pass_stats), result.latex)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=20, help="pages per generated document")
+    parser.add_argument('--repeat', type=int, default=3, help="conversions per mode (best is reported)")
+    args = parser.parse_args()
+
+    converter = Converter()
+    work_dir = tempfile.mkdtemp(prefix='bench_ast_filter_')
+    try:
+        print(f"{'variant':<10} {'regex':>9} {'passes':>9} {'ast':>9} {'passes':>9} {'speedup':>8} {'lines differ':>13}")
+        for variant in VARIANTS:
+            docx_path = os.path.join(work_dir, f'{variant}.docx')
+            create_variant_docx(docx_path, args.pages, variant)
+            with open(docx_path, 'rb') as f:
+                data = f.read()
+
+            regex_seconds, regex_passes, regex_latex = convert(converter, data, False, args.repeat)
+            ast_seconds, ast_passes, ast_latex = convert(converter, data, True, args.repeat)
+            differing = sum(a != b for a, b in zip(regex_latex.splitlines(), ast_latex.splitlines()))
+            differing += abs(len(regex_latex.splitlines()) - len(ast_latex.splitlines()))
+            print(
+                f"{variant:<10} {regex_seconds * 1000:>7.0f}ms {regex_passes * 1000:>7.1f}ms "
+                f"{ast_seconds * 1000:>7.0f}ms {ast_passes * 1000:>7.1f}ms "
+                f"{regex_seconds / ast_seconds:>7.2f}x {differing:>13}"
+            )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Compare per-document conversion latency of the pypandoc and pandoc-server backends.
+
+Usage:
+    python benchmarks/bench_backends.py [--runs N] [--paragraphs N] [docx ...]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from converter import convert_docx_to_latex
+from corpus import create_text_docx
+from pandoc_server import get_default_server
+
+
+def time_backend(backend: str, docx_paths: list, runs: int, work_dir: str) -> list:
+    timings = []
+    for run in range(runs):
+        for i, docx_path in enumerate(docx_paths):
+            latex_path = os.path.join(work_dir, f"{backend}_{run}_{i}.tex")
+            start = time.perf_counter()
+            success, message = convert_docx_to_latex(docx_path, latex_path, backend=backend)
+            timings.append(time.perf_counter() - start)
+            if not success:
+                raise SystemExit(f"{backend} conversion failed: {message}")
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('docx', nargs='*', help="DOCX files to convert (default: generated documents)")
+    parser.add_argument('--runs', type=int, default=10, help="conversions per document and backend")
+    parser.add_argument('--paragraphs', type=int, default=20, help="size of the generated documents")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        docx_paths = args.docx or [
+            create_text_docx(os.path.join(work_dir, "short.docx"), 5),
+            create_text_docx(os.path.join(work_dir, "medium.docx"), args.paragraphs),
+        ]
+
+        # Warm the server so its startup is not counted as conversion latency
+        server = get_default_server()
+        start = time.perf_counter()
+        server.start()
+        print(f"pandoc server startup: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+        results = {}
+        for backend in ('pypandoc', 'server'):
+            results[backend] = time_backend(backend, docx_paths, args.runs, work_dir)
+
+        print(f"\n{'backend':<10} {'median ms':>10} {'mean ms':>10} {'p95 ms':>10}")
+        for backend, timings in results.items():
+            timings = sorted(timings)
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            print(f"{backend:<10} {statistics.median(timings) * 1000:>10.1f} "
+                  f"{statistics.mean(timings) * 1000:>10.1f} {p95 * 1000:>10.1f}")
+
+        speedup = statistics.median(results['pypandoc']) / statistics.median(results['server'])
+        print(f"\nserver backend speedup (median): {speedup:.2f}x")
+
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Measure convert_many() throughput at 1, 2, 4 and 8 worker processes.
+
+Usage:
+    python benchmarks/bench_batch.py [--documents N] [--paragraphs N] [--workers 1 2 4 8]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from converter import convert_many
+from corpus import create_corpus
+
+
+def run_batch(docx_paths: list, max_workers: int, work_dir: str) -> float:
+    output_dir = os.path.join(work_dir, f"out_{max_workers}")
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = [
+        {
+            'docx_path': docx_path,
+            'latex_path': os.path.join(output_dir, f"doc_{i}.tex"),
+            'overleaf_compatible': True,
+        }
+        for i, docx_path in enumerate(docx_paths)
+    ]
+
+    start = time.perf_counter()
+    for job, success, message in convert_many(jobs, max_workers=max_workers):
+        if not success:
+            raise SystemExit(f"{job['docx_path']} failed: {message}")
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--documents', type=int, default=32, help="number of generated documents")
+    parser.add_argument('--paragraphs', type=int, default=200, help="size of each generated document")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8], help="pool sizes to measure")
+    args = parser.parse_args()
+
+    print(f"CPUs available: {os.cpu_count()}")
+    with tempfile.TemporaryDirectory() as work_dir:
+        docx_paths = create_corpus(os.path.join(work_dir, "corpus"), args.documents, args.paragraphs)
+
+        print(f"\n{'workers':>8} {'seconds':>10} {'docs/s':>10} {'speedup':>10}")
+        baseline = None
+        for workers in args.workers:
+            elapsed = run_batch(docx_paths, workers, work_dir)
+            baseline = baseline or elapsed
+            print(f"{workers:>8} {elapsed:>10.2f} {len(docx_paths) / elapsed:>10.2f} {baseline / elapsed:>9.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the start-up cost of docx2latex.py and the converter modules.
+
+Runs each command in a fresh interpreter several times and reports the best
+wall time, next to an empty interpreter for reference. Then lists the
+modules that take longest to import with "import converter" (from python
+-X importtime), which is what every conversion subcommand pays before it
+converts anything.
+
+Usage:
+    python benchmarks/bench_cli_startup.py [--repeat N]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLI = os.path.join(ROOT, 'docx2latex.py')
+
+COMMANDS = [
+    ('python -c pass', [sys.executable, '-c', 'pass']),
+    ('docx2latex.py --help', [sys.executable, CLI, '--help']),
+    ('import converter', [sys.executable, '-c', 'import converter']),
+    ('import conversion_cache', [sys.executable, '-c', 'import conversion_cache']),
+    ('docx2latex.py check', [sys.executable, CLI, 'check']),
+]
+
+
+def best_wall_time(command: list, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def slowest_imports(module: str, count: int) -> list:
+    """(cumulative microseconds, name) of the slowest top-level imports of module."""
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True
+    )
+    imports = []
+    for line in process.stderr.splitlines():
+        parts = line.split('|')
+        # Direct imports of the module are indented by two spaces
+        if len(parts) == 3 and parts[2].startswith('   ') and not parts[2].startswith('    '):
+            imports.append((int(parts[1]), parts[2].strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=10, help="runs per command (best is reported)")
+    args = parser.parse_args()
+
+    # Compiled once up front, so the runs do not include writing bytecode
+    subprocess.run([sys.executable, '-m', 'compileall', '-q', '-l', ROOT], check=True)
+
+    print(f"{'command':<26} {'wall':>9}")
+    for name, command in COMMANDS:
+        print(f"{name:<26} {best_wall_time(command, args.repeat) * 1000:>7.1f}ms")
+
+    print("\nslowest imports of converter (cumulative):")
+    for microseconds, module in slowest_imports('converter', 10):
+        print(f"  {module:<30} {microseconds / 1000:>7.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Per-call overhead of convert_docx_to_latex() against a reused Converter.
+
+Converts the same small generated documents many times, once through the
+module function (which builds the pandoc arguments and the pipeline and lets
+pypandoc probe pandoc's formats on every call) and once through one
+Converter session, and checks that both write the same LaTeX.
+
+Usage:
+    python benchmarks/bench_converter_session.py [--calls N] [--pages N]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from converter import ConversionOptions, Converter, convert_docx_to_latex
+from corpus import create_variant_docx
+
+
+def timed_calls(convert, docx_path: str, latex_path: str, calls: int) -> float:
+    start = time.perf_counter()
+    for _ in range(calls):
+        success, message = convert(docx_path, latex_path)
+        if not success:
+            raise SystemExit(f"Conversion failed: {message}")
+    return (time.perf_counter() - start) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--calls', type=int, default=20, help="conversions per variant")
+    parser.add_argument('--pages', type=int, default=1, help="pages per generated document")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        docx_path = os.path.join(work_dir, 'doc.docx')
+        create_variant_docx(docx_path, args.pages, 'text')
+        function_path = os.path.join(work_dir, 'function.tex')
+        session_path = os.path.join(work_dir, 'session.tex')
+
+        start = time.perf_counter()
+        converter = Converter(ConversionOptions(overleaf_compatible=True))
+        setup = time.perf_counter() - start
+
+        function = timed_calls(
+            lambda docx, latex: convert_docx_to_latex(docx, latex, overleaf_compatible=True),
+            docx_path, function_path, args.calls
+        )
+        session = timed_calls(converter.convert, docx_path, session_path, args.calls)
+
+        with open(function_path, encoding='utf-8') as f, open(session_path, encoding='utf-8') as g:
+            if f.read() != g.read():
+                raise SystemExit("Output mismatch between convert_docx_to_latex() and Converter.convert()")
+
+    print(f"Converter setup:         {setup * 1000:>8.1f}ms (once)")
+    print(f"convert_docx_to_latex(): {function * 1000:>8.1f}ms per call")
+    print(f"Converter.convert():     {session * 1000:>8.1f}ms per call")
+    print(f"saved per call:          {(function - session) * 1000:>8.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Measure re-converting an edited document incrementally against a full conversion.
+
+A generated document is converted once to record its sections, then one
+paragraph is edited and the new version is converted both ways. The two
+outputs are compared byte for byte.
+
+Usage:
+    python benchmarks/bench_incremental.py [--pages N] [--variant text|images|tables|lists|math]
+"""
+
+import argparse
+import io
+import os
+import re
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from converter import convert_docx_to_latex
+from corpus import VARIANTS, create_variant_docx
+
+
+def edit_paragraph(docx_path: str, output_path: str, text: str):
+    """
+    Replace the text of one run in the middle of the document.
+    """
+    with zipfile.ZipFile(docx_path) as source, zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as target:
+        for info in source.infolist():
+            data = source.read(info.filename)
+            if info.filename == 'word/document.xml':
+                xml = data.decode('utf-8')
+                runs = list(re.finditer(r'<w:t(?: [^>]*)?>([^<]*)</w:t>', xml))
+                middle = runs[len(runs) // 2]
+                data = (xml[:middle.start(1)] + text + xml[middle.end(1):]).encode('utf-8')
+            target.writestr(info, data)
+
+
+def timed(docx_path: str, latex_path: str, **kwargs) -> float:
+    start = time.perf_counter()
+    success, message = convert_docx_to_latex(docx_path, latex_path, overleaf_compatible=True, **kwargs)
+    if not success:
+        raise SystemExit(message)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=300, help="size of the generated document")
+    parser.add_argument('--variant', default='text', choices=VARIANTS, help="kind of generated document")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        original = create_variant_docx(os.path.join(work_dir, "original.docx"), args.pages, args.variant)
+        edited = os.path.join(work_dir, "edited.docx")
+        edit_paragraph(original, edited, "This sentence was edited.")
+        state_path = os.path.join(work_dir, "state.json.gz")
+
+        first = timed(original, os.path.join(work_dir, "first.tex"), incremental_state_path=state_path)
+        full = timed(edited, os.path.join(work_dir, "full.tex"))
+        incremental = timed(edited, os.path.join(work_dir, "incremental.tex"), incremental_state_path=state_path)
+
+        with open(os.path.join(work_dir, "full.tex"), 'rb') as a, open(os.path.join(work_dir, "incremental.tex"), 'rb') as b:
+            identical = a.read() == b.read()
+
+    print(f"{args.pages}-page {args.variant} document, one paragraph edited")
+    print(f"{'first conversion':<24} {first:>8.2f}s")
+    print(f"{'full re-conversion':<24} {full:>8.2f}s")
+    print(f"{'incremental':<24} {incremental:>8.2f}s  ({full / incremental:.1f}x)")
+    print(f"outputs identical: {identical}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Measure media extraction with pandoc's --extract-media against docx_media.
+
+Both runs convert the same image-heavy document; the first lets pandoc write
+the images while it renders, the second renders without them and extracts
+the referenced images from the archive with a thread pool.
+
+Usage:
+    python benchmarks/bench_media.py [--pages N] [--workers N]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pypandoc
+
+from converter import _MEDIA_REFERENCE_PATTERN, _pandoc_args, _rewrite_media_references
+from corpus import create_variant_docx
+from docx_media import extract_media
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=100, help="size of the generated document")
+    parser.add_argument('--workers', type=int, default=None, help="extraction threads (default: ThreadPoolExecutor's)")
+    args = parser.parse_args()
+
+    extra_args = _pandoc_args(False, None, True, True, True)
+    with tempfile.TemporaryDirectory() as work_dir:
+        docx_path = create_variant_docx(os.path.join(work_dir, "source.docx"), args.pages, 'images')
+
+        start = time.perf_counter()
+        pypandoc.convert_file(docx_path, 'latex', extra_args=extra_args + [f"--extract-media={os.path.join(work_dir, 'pandoc')}"])
+        pandoc_extract = time.perf_counter() - start
+
+        start = time.perf_counter()
+        latex = pypandoc.convert_file(docx_path, 'latex', extra_args=extra_args)
+        render = time.perf_counter() - start
+        targets = [match.group(2) for match in _MEDIA_REFERENCE_PATTERN.finditer(latex)]
+        start = time.perf_counter()
+        name_map = extract_media(docx_path, targets, os.path.join(work_dir, 'archive'), args.workers)
+        _rewrite_media_references(latex, name_map, os.path.join(work_dir, 'archive'))
+        extract = time.perf_counter() - start
+
+    print(f"{args.pages}-page images document, {len(set(targets))} images, {len(set(name_map.values()))} distinct")
+    print(f"{'pandoc --extract-media':<24} {pandoc_extract:>8.2f}s")
+    print(f"{'render + docx_media':<24} {render + extract:>8.2f}s  (extraction {extract:.3f}s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the minimal_preamble conversion option.
+
+Converts every synthetic corpus variant with and without minimal_preamble
+and reports the packages each preamble loads and how many were dropped.
+When a TeX engine is installed, both outputs are compiled and the best
+compile time of each is reported; the images are kept next to the .tex so
+the graphics are compiled as well.
+
+Usage:
+    python benchmarks/bench_minimal_preamble.py [--pages N] [--engine pdflatex] [--repeat N]
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from converter import PostProcessingPipeline, convert_docx_to_latex
+from corpus import VARIANTS, create_variant_docx
+from latex_preamble import split_document
+
+
+def convert(docx_path: str, latex_path: str, minimal_preamble: bool) -> tuple:
+    """Returns (packages loaded, packages dropped)."""
+    pipeline = PostProcessingPipeline()
+    success, message = convert_docx_to_latex(
+        docx_path, latex_path,
+        extract_media_to_path=os.path.join(os.path.dirname(latex_path), 'media'),
+        overleaf_compatible=True,
+        pipeline=pipeline,
+        minimal_preamble=minimal_preamble
+    )
+    if not success:
+        raise SystemExit(f"Conversion of {docx_path} failed: {message}")
+    with open(latex_path, 'r', encoding='utf-8') as f:
+        preamble, _ = split_document(f.read())
+    stats = pipeline.stats.get('drop_unused_packages')
+    return len(preamble.packages), stats.matches if stats else 0
+
+
+def compile_seconds(engine: str, latex_path: str, repeat: int) -> float:
+    """Best wall-clock time of repeat compiles, or None if the document does not compile."""
+    directory, name = os.path.split(latex_path)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        process = subprocess.run(
+            [engine, '-interaction=batchmode', '-halt-on-error', name],
+            cwd=directory,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        timings.append(time.perf_counter() - start)
+        if process.returncode != 0:
+            return None
+    return min(timings)
+
+
+def format_seconds(seconds: float) -> str:
+    return f"{seconds:.2f}s" if seconds is not None else 'failed'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=10, help="pages per generated document")
+    parser.add_argument('--engine', default='pdflatex', help="TeX engine used to compile the output")
+    parser.add_argument('--repeat', type=int, default=3, help="compiles per document (best is reported)")
+    args = parser.parse_args()
+
+    engine = shutil.which(args.engine)
+    if not engine:
+        print(f"{args.engine} not found: compile times are not measured\n")
+
+    work_dir = tempfile.mkdtemp(prefix='bench_minimal_preamble_')
+    try:
+        print(f"{'variant':<10} {'packages':>9} {'minimal':>8} {'dropped':>8} {'compile':>9} {'minimal':>9} {'speedup':>8}")
+        for variant in VARIANTS:
+            docx_path = os.path.join(work_dir, f'{variant}.docx')
+            create_variant_docx(docx_path, args.pages, variant)
+            results = {}
+            for minimal_preamble in (False, True):
+                directory = os.path.join(work_dir, f'{variant}_{"minimal" if minimal_preamble else "full"}')
+                os.makedirs(directory)
+                latex_path = os.path.join(directory, f'{variant}.tex')
+                packages, dropped = convert(docx_path, latex_path, minimal_preamble)
+                seconds = compile_seconds(engine, latex_path, args.repeat) if engine else None
+                results[minimal_preamble] = (packages, dropped, seconds)
+
+            (full_packages, _, full_seconds), (minimal_packages, dropped, minimal_seconds) = results[False], results[True]
+            if engine:
+                speedup = f"{full_seconds / minimal_seconds:.2f}x" if full_seconds and minimal_seconds else '-'
+                timings = f"{format_seconds(full_seconds):>9} {format_seconds(minimal_seconds):>9} {speedup:>8}"
+            else:
+                timings = f"{'-':>9} {'-':>9} {'-':>8}"
+            print(f"{variant:<10} {full_packages:>9} {minimal_packages:>8} {dropped:>8} {timings}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the duplicate-math detector in converter.py.
+
+Generates a math-heavy LaTeX body (prose with inline and display equations,
+some of them preceded by the plain-text fallback Pandoc emits for them), runs
+_fix_mixed_mathematical_expressions() on growing prefixes of it and checks
+that exactly the inserted fallbacks are removed. Time per megabyte stays flat
+as the input grows if the detector runs in linear time.
+
+Usage:
+    python benchmarks/bench_mixed_math.py [--size-mb N] [--fallbacks F] [--repeat N]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from converter import _fix_mixed_mathematical_expressions
+
+WORDS = ["the", "signal", "of", "each", "beat", "is", "estimated", "where", "and", "we", "obtain", "with", "interval"]
+NAMES = "abfghmstxyRT"
+INDICES = "ijknqr"
+
+
+def equation(rnd: random.Random) -> tuple:
+    """A random (plain-text fallback, LaTeX) pair in the shapes Word equations take."""
+    v, w, x = rnd.choice(NAMES), rnd.choice(NAMES), rnd.choice(NAMES)
+    i, j, n = rnd.choice(INDICES), rnd.choice(INDICES), rnd.choice(INDICES)
+    shapes = [
+        (f"{v}{i},{j}={w}[{n}{i},{j}]", f"{v}_{{{i},{j}}} = {w}[{n}_{{{i},{j}}}]"),
+        (f"∆{v}{i}={v}{i}-{v}{j}", f"\\Delta {v}_{{{i}}} = {v}_{{{i}}} - {v}_{{{j}}}"),
+        (f"{v}¯{i}=1|{w}|∑{n}∈{w}{x}[{n}]", f"\\bar {v}_{i} = \\frac{{1}}{{|{w}|}}\\sum_{{{n} \\in {w}}} {x}[{n}]"),
+        (f"{v}med=median{{{w}{i}}}", f"{v}_{{\\mathrm{{med}}}} = \\mathrm{{median}}\\{{{w}_{i}\\}}"),
+        (f"{v}={w}2+α{x}", f"{v} = {w}^{{2}} + \\alpha {x}"),
+    ]
+    return rnd.choice(shapes)
+
+
+def generate_document(size_bytes: int, fallback_rate: float, seed: int = 0) -> tuple:
+    """
+    Returns (document, expected, fallbacks): the body with fallbacks, the body
+    without them, and how many were inserted.
+    """
+    rnd = random.Random(seed)
+    document, expected = [], []
+    fallbacks = total = 0
+    while total < size_bytes:
+        sentence = ' '.join(rnd.choice(WORDS) for _ in range(rnd.randint(4, 12)))
+        plain, latex = equation(rnd)
+        math = f"\\({latex}\\)" if rnd.random() < 0.7 else f"\\[\n{latex}\n\\]\n"
+        piece = f"{sentence} {math} "
+        expected.append(piece)
+        if rnd.random() < fallback_rate:
+            piece = f"{sentence} {plain}{math} "
+            fallbacks += 1
+        document.append(piece)
+        total += len(piece)
+        if rnd.random() < 0.1:
+            document.append("\n\n")
+            expected.append("\n\n")
+    return ''.join(document), ''.join(expected), fallbacks
+
+
+def best_of(content: str, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _fix_mixed_mathematical_expressions(content)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size-mb', type=float, default=10.0, help="size of the largest generated body")
+    parser.add_argument('--fallbacks', type=float, default=0.3, help="share of equations preceded by a fallback")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per size (best is reported)")
+    args = parser.parse_args()
+
+    print(f"{'size':>10} {'equations removed':>18} {'time':>9} {'per MB':>9}")
+    for fraction in (0.125, 0.25, 0.5, 1.0):
+        size = int(args.size_mb * fraction * 1024 * 1024)
+        document, expected, fallbacks = generate_document(size, args.fallbacks)
+        if _fix_mixed_mathematical_expressions(document) != expected:
+            raise SystemExit(f"Output mismatch: the {fallbacks} inserted fallbacks were not removed exactly")
+
+        seconds = best_of(document, args.repeat)
+        megabytes = len(document.encode('utf-8')) / 1e6
+        print(f"{megabytes:>8.1f}MB {fallbacks:>18} {seconds:>8.2f}s {seconds / megabytes * 1000:>7.0f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Measure how parallel body post-processing scales with the number of workers.
+
+Uses the same generated large .tex as bench_streaming.py and checks that every
+worker count produces output identical to the serial in-memory result.
+
+Usage:
+    python benchmarks/bench_parallel_postprocess.py [--size-mb N] [--workers 1 2 4 8]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_streaming import build_large_tex
+from converter import _apply_post_processing
+
+OPTIONS = (True, True, True, None)
+
+
+def run(source_path: str, latex_path: str, **kwargs) -> float:
+    shutil.copy(source_path, latex_path)
+    start = time.perf_counter()
+    _apply_post_processing(latex_path, *OPTIONS, **kwargs)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size-mb', type=float, default=20, help="size of the .tex to post-process")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8], help="worker counts to measure")
+    args = parser.parse_args()
+
+    print(f"CPUs available: {os.cpu_count()}")
+    with tempfile.TemporaryDirectory() as work_dir:
+        source_path = build_large_tex(work_dir, args.size_mb)
+        print(f"document: {os.path.getsize(source_path) / (1024 * 1024):.1f} MB\n")
+
+        serial_path = os.path.join(work_dir, "serial.tex")
+        serial = run(source_path, serial_path, streaming=False)
+        with open(serial_path, 'rb') as f:
+            expected = f.read()
+
+        print(f"{'workers':>8} {'seconds':>10} {'speedup':>10} {'identical':>10}")
+        print(f"{'serial':>8} {serial:>10.2f} {1:>9.2f}x {'-':>10}")
+        for workers in args.workers:
+            latex_path = os.path.join(work_dir, f"parallel_{workers}.tex")
+            elapsed = run(source_path, latex_path, workers=workers)
+            with open(latex_path, 'rb') as f:
+                identical = f.read() == expected
+            print(f"{workers:>8} {elapsed:>10.2f} {serial / elapsed:>9.2f}x {str(identical):>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark for section-parallel pandoc conversion (pandoc_workers).
+
+Generates a long document of one corpus variant and converts it with
+convert_docx_to_latex() using 1, 2, 4, ... pandoc processes, up to
+--max-workers. Reports the best wall time of each worker count, the speedup
+over a single process, the CPU time pandoc used (what the parts add over
+one process) and whether the LaTeX is identical. The speedup is bounded by
+the number of CPU cores, which is printed first.
+
+Usage:
+    python benchmarks/bench_parallel_sections.py [--pages N] [--variant NAME] [--max-workers N] [--repeat N]
+"""
+
+import argparse
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from converter import convert_docx_to_latex
+from corpus import VARIANTS, create_variant_docx
+
+
+def convert(docx_path: str, latex_path: str, workers: int, repeat: int) -> tuple:
+    """Returns (best seconds, pandoc CPU seconds of that run, LaTeX)."""
+    best = None
+    for _ in range(repeat):
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        start = time.perf_counter()
+        success, message = convert_docx_to_latex(
+            docx_path, latex_path, overleaf_compatible=True, pandoc_workers=workers
+        )
+        seconds = time.perf_counter() - start
+        if not success:
+            raise SystemExit(f"Conversion failed: {message}")
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu = usage.ru_utime + usage.ru_stime - children.ru_utime - children.ru_stime
+        if best is None or seconds < best[0]:
+            best = (seconds, cpu)
+    with open(latex_path, 'r', encoding='utf-8') as f:
+        return best + (f.read(),)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=600, help="pages of the generated document")
+    parser.add_argument('--variant', choices=VARIANTS, default='text', help="corpus variant")
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1, help="largest worker count")
+    parser.add_argument('--repeat', type=int, default=1, help="conversions per worker count (best is reported)")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='bench_parallel_sections_')
+    try:
+        docx_path = os.path.join(work_dir, f'{args.variant}.docx')
+        create_variant_docx(docx_path, args.pages, args.variant)
+        latex_path = os.path.join(work_dir, 'out.tex')
+
+        worker_counts = [1]
+        while worker_counts[-1] * 2 <= args.max_workers:
+            worker_counts.append(worker_counts[-1] * 2)
+        if worker_counts[-1] < args.max_workers:
+            worker_counts.append(args.max_workers)
+
+        print(f"{os.cpu_count()} CPU cores, {args.pages} pages ({args.variant})\n")
+        print(f"{'workers':>7} {'time':>9} {'speedup':>8} {'pandoc cpu':>11} {'identical':>10}")
+        reference = None
+        for workers in worker_counts:
+            seconds, cpu, latex = convert(docx_path, latex_path, workers, args.repeat)
+            if reference is None:
+                reference = (seconds, latex)
+            print(
+                f"{workers:>7} {seconds:>8.2f}s {reference[0] / seconds:>7.2f}x "
+                f"{cpu:>10.2f}s {str(latex == reference[1]):>10}"
+            )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
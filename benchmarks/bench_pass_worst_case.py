@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Adversarial-input benchmark for the post-processing passes.
+
+For every pass in POST_PROCESSING_PASSES, generates LaTeX built to make it
+backtrack: its trigger followed by unclosed groups and options, arguments
+that are never completed, long runs of math delimiters, and seeded random
+mixtures of LaTeX syntax. Each input is timed at growing sizes; a pass
+whose time grows much faster than its input is reported as superlinear.
+
+With --budget, the whole pipeline is then run on the slowest input with
+that per-pass time budget, to check that overrunning passes are aborted and
+the rest of the pipeline still runs.
+
+Usage:
+    python benchmarks/bench_pass_worst_case.py [--size-kb N] [--steps N] [--budget SECONDS]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from converter import POST_PROCESSING_PASSES, ConversionOptions, PostProcessingPipeline
+from latex_preamble import Preamble
+
+# Seeds for passes without a trigger token
+EXTRA_SEEDS = ['$$', '$\\bar{}$', '\\(', '\n', '\n\\section{', '\\includegraphics{', '\\usepackage{', 'x_', 'a=b']
+FUZZ_ALPHABET = ['{', '}', '[', ']', '$', '$$', '\\', '\n', '\n\n', ' ', 'a', 'A', '=', '_', '^']
+
+# A linear pass takes about growth times longer on an input growth times larger
+SUPERLINEAR_FACTOR = 2.5
+# Below this, timings are too noisy to judge
+MIN_SECONDS = 0.005
+
+
+def families(seed: str) -> dict:
+    """Adversarial repeating units for one seed token."""
+    return {
+        'unclosed group': seed + '{',
+        'missing argument': seed + '{x}',
+        'unclosed second argument': seed + '{x}{',
+        'unclosed option': seed + '[',
+        'bare': seed,
+    }
+
+
+def generate(unit: str, size: int) -> str:
+    return unit * max(1, size // len(unit))
+
+
+def fuzz(seed: str, size: int, rnd_seed: int = 0) -> str:
+    rnd = random.Random(rnd_seed)
+    alphabet = FUZZ_ALPHABET + [seed] * 4
+    parts, total = [], 0
+    while total < size:
+        piece = rnd.choice(alphabet)
+        parts.append(piece)
+        total += len(piece)
+    return ''.join(parts)
+
+
+def inputs(post_pass, size: int) -> dict:
+    seeds = [post_pass.trigger] if post_pass.trigger else EXTRA_SEEDS
+    generated = {}
+    for seed in seeds:
+        for family, unit in families(seed).items():
+            generated[f'{family} {seed!r}'] = generate(unit, size)
+        generated[f'fuzz {seed!r}'] = fuzz(seed, size)
+    return generated
+
+
+def best_of(post_pass, content: str, options: ConversionOptions, repeat: int = 3) -> float:
+    timings = []
+    for _ in range(repeat):
+        # Preamble passes edit a parsed Preamble
+        target = Preamble(content) if post_pass.scope == 'preamble' else content
+        start = time.perf_counter()
+        post_pass.apply(target, options, frozenset())
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size-kb', type=int, default=16, help="smallest input size")
+    parser.add_argument('--steps', type=int, default=3, help="number of doublings of the input size")
+    parser.add_argument('--budget', type=float, default=None, help="per-pass time budget for the pipeline run")
+    args = parser.parse_args()
+
+    options = ConversionOptions(overleaf_compatible=True, preserve_styles=True, preserve_linebreaks=True, extract_media_to_path='media')
+    size = args.size_kb * 1024
+    growth = 2 ** args.steps
+    superlinear = []
+    slowest = (0.0, None, None)
+    print(f"{'pass':<24} {'worst input':<44} {'small':>9} {'large':>9} {'growth':>7}")
+    for post_pass in POST_PROCESSING_PASSES:
+        worst = (0.0, None, 0.0, 0.0)
+        for name, small_input in inputs(post_pass, size).items():
+            small = best_of(post_pass, small_input, options)
+            large_input = inputs(post_pass, size * growth)[name]
+            large = best_of(post_pass, large_input, options, repeat=1)
+            ratio = large / max(small, 1e-9)
+            if large >= MIN_SECONDS and ratio > worst[0]:
+                worst = (ratio, name, small, large)
+            if large > slowest[0]:
+                slowest = (large, post_pass, large_input)
+        ratio, name, small, large = worst
+        flag = ''
+        if name and ratio > growth * SUPERLINEAR_FACTOR:
+            superlinear.append(post_pass.name)
+            flag = '  SUPERLINEAR'
+        print(f"{post_pass.name:<24} {(name or '-')[:44]:<44} {small * 1000:>7.1f}ms {large * 1000:>7.1f}ms {ratio:>6.1f}x{flag}")
+
+    print(f"\n{len(superlinear)} superlinear of {len(POST_PROCESSING_PASSES)} passes" + (f": {', '.join(superlinear)}" if superlinear else ""))
+
+    if args.budget is not None and slowest[1] is not None:
+        seconds, post_pass, content = slowest
+        pipeline = PostProcessingPipeline(pass_budget=args.budget)
+        start = time.perf_counter()
+        pipeline.run(content, options)
+        elapsed = time.perf_counter() - start
+        print(f"\npipeline on the slowest input ({post_pass.name}, {seconds:.2f}s alone) "
+              f"with a {args.budget}s budget: {elapsed:.2f}s, aborted: {', '.join(pipeline.timed_out_passes) or 'none'}")
+
+    if superlinear:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Compare peak memory and time of in-memory and streaming post-processing.
+
+A generated document is converted with pandoc once; its body is repeated until
+the .tex reaches the requested size, and both post-processing modes are run on
+copies of it. Peak memory is the largest Python heap size seen by tracemalloc,
+measured in a separate run so tracing does not distort the timings.
+
+Usage:
+    python benchmarks/bench_streaming.py [--size-mb N] [--chunk-kb N]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pypandoc
+
+from converter import _apply_post_processing, _pandoc_args, _stream_post_processing
+from corpus import create_text_docx
+
+
+def build_large_tex(work_dir: str, size_mb: float) -> str:
+    docx_path = create_text_docx(os.path.join(work_dir, "source.docx"), 200)
+    raw_path = os.path.join(work_dir, "source.tex")
+    pypandoc.convert_file(docx_path, 'latex', outputfile=raw_path, extra_args=_pandoc_args(False, None, True, True, True))
+
+    with open(raw_path, 'r', encoding='utf-8') as f:
+        preamble, rest = f.read().split('\\begin{document}', 1)
+    body, ending = rest.rsplit('\\end{document}', 1)
+
+    large_path = os.path.join(work_dir, "large.tex")
+    target = size_mb * 1024 * 1024
+    with open(large_path, 'w', encoding='utf-8') as f:
+        f.write(preamble + '\\begin{document}')
+        written = 0
+        while written < target:
+            f.write(body)
+            written += len(body.encode('utf-8'))
+        f.write('\\end{document}' + ending)
+    return large_path
+
+
+def measure(label: str, process, source_path: str, work_dir: str) -> str:
+    """
+    Time one run, then repeat it under tracemalloc for the peak memory.
+    """
+    latex_path = os.path.join(work_dir, f"{label}.tex")
+
+    shutil.copy(source_path, latex_path)
+    start = time.perf_counter()
+    process(latex_path)
+    elapsed = time.perf_counter() - start
+
+    shutil.copy(source_path, latex_path + '.traced')
+    tracemalloc.start()
+    process(latex_path + '.traced')
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{label:<10} {elapsed:>10.2f} {peak / (1024 * 1024):>12.1f}")
+    return latex_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size-mb', type=float, default=50, help="size of the .tex to post-process")
+    parser.add_argument('--chunk-kb', type=int, default=1024, help="streaming chunk size")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        source_path = build_large_tex(work_dir, args.size_mb)
+        print(f"document: {os.path.getsize(source_path) / (1024 * 1024):.1f} MB\n")
+        print(f"{'mode':<10} {'seconds':>10} {'peak MB':>12}")
+
+        options = (True, True, True, None)
+        in_memory = measure(
+            'in-memory', lambda path: _apply_post_processing(path, *options, streaming=False), source_path, work_dir
+        )
+        streaming = measure(
+            'streaming', lambda path: _stream_post_processing(path, *options, chunk_size=args.chunk_kb * 1024),
+            source_path, work_dir
+        )
+
+        with open(in_memory, 'rb') as a, open(streaming, 'rb') as b:
+            identical = a.read() == b.read()
+        print(f"\noutputs identical: {identical}")
+
+
+if __name__ == '__main__':
+    main()
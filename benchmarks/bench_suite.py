@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark over a generated corpus, with regression checks.
+
+Generates one document per page count and variant (see corpus.VARIANTS),
+converts each in a fresh process and records pandoc time, media extraction
+time, post-processing time, peak RSS of the Python process and of pandoc,
+and the output size.
+Results are written as JSON and compared against a baseline, by default
+the reference results committed as benchmarks/baseline.json: any metric that
+grew by more than the threshold is reported and the script exits with
+status 1. Timings are only comparable on a similar machine, so a warning is
+printed when the baseline was recorded with another Python, pandoc or CPU
+count. To update the reference, run the full suite with
+--output benchmarks/baseline.json --no-baseline.
+
+Usage:
+    python benchmarks/bench_suite.py [--pages 1 10 100 1000] [--variants text images ...]
+                                     [--output results.json] [--baseline baseline.json | --no-baseline]
+                                     [--threshold 0.2]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pypandoc
+
+from converter import _apply_post_processing, _extract_referenced_media, _pandoc_args
+from corpus import VARIANTS, create_variant_docx
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+OPTIONS = {'overleaf_compatible': True, 'preserve_styles': True, 'preserve_linebreaks': True}
+
+# Compared against the baseline; all of them are "lower is better"
+METRICS = ('pandoc_seconds', 'media_seconds', 'post_processing_seconds', 'python_peak_rss_mb', 'pandoc_peak_rss_mb', 'output_bytes')
+
+# Time differences below this are treated as noise, whatever the ratio
+MIN_SECONDS_DELTA = 0.05
+
+
+def _python_peak_rss_mb() -> float:
+    """
+    Peak RSS of this process. On Linux ru_maxrss keeps the parent's peak
+    across fork and exec, so it is read from VmHWM, which starts over with
+    the new address space.
+    """
+    try:
+        with open('/proc/self/status', 'r', encoding='ascii') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return _peak_rss_mb(resource.RUSAGE_SELF)
+
+
+def _peak_rss_mb(who: int) -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def measure_document(docx_path: str, work_dir: str) -> dict:
+    """
+    Convert one document and return its metrics. Runs in a fresh process so
+    peak RSS belongs to this document alone.
+    """
+    name = os.path.splitext(os.path.basename(docx_path))[0]
+    latex_path = os.path.join(work_dir, f"{name}.tex")
+    media_path = os.path.join(work_dir, f"{name}_media")
+
+    start = time.perf_counter()
+    latex = pypandoc.convert_file(
+        docx_path, 'latex',
+        extra_args=_pandoc_args(False, None, OPTIONS['overleaf_compatible'],
+                                OPTIONS['preserve_styles'], OPTIONS['preserve_linebreaks'])
+    )
+    pandoc_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    latex = _extract_referenced_media(latex, docx_path, media_path)
+    with open(latex_path, 'w', encoding='utf-8') as f:
+        f.write(latex)
+    media_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    _apply_post_processing(latex_path, OPTIONS['overleaf_compatible'], OPTIONS['preserve_styles'],
+                           OPTIONS['preserve_linebreaks'], media_path)
+    post_processing_seconds = time.perf_counter() - start
+
+    return {
+        'input_bytes': os.path.getsize(docx_path),
+        'pandoc_seconds': round(pandoc_seconds, 4),
+        'media_seconds': round(media_seconds, 4),
+        'post_processing_seconds': round(post_processing_seconds, 4),
+        'python_peak_rss_mb': round(_python_peak_rss_mb(), 1),
+        'pandoc_peak_rss_mb': round(_peak_rss_mb(resource.RUSAGE_CHILDREN), 1),
+        'output_bytes': os.path.getsize(latex_path),
+    }
+
+
+def run_suite(pages: list, variants: list, work_dir: str) -> dict:
+    corpus_dir = os.path.join(work_dir, "corpus")
+    os.makedirs(corpus_dir, exist_ok=True)
+
+    results = {}
+    print(f"{'document':<20} {'pandoc s':>10} {'media s':>10} {'post s':>10} {'py MB':>8} {'pandoc MB':>10} {'out KB':>10}")
+    for page_count in pages:
+        for variant in variants:
+            name = f"{variant}_{page_count}p"
+            docx_path = create_variant_docx(os.path.join(corpus_dir, f"{name}.docx"), page_count, variant)
+            # Measured in a new process, so peak RSS covers this document alone
+            with multiprocessing.get_context('spawn').Pool(1) as pool:
+                metrics = pool.apply(measure_document, (docx_path, work_dir))
+            results[name] = metrics
+            print(f"{name:<20} {metrics['pandoc_seconds']:>10.2f} {metrics['media_seconds']:>10.2f} "
+                  f"{metrics['post_processing_seconds']:>10.2f} "
+                  f"{metrics['python_peak_rss_mb']:>8.1f} {metrics['pandoc_peak_rss_mb']:>10.1f} "
+                  f"{metrics['output_bytes'] / 1024:>10.1f}")
+    return results
+
+
+def environment() -> dict:
+    """
+    The machine details stored with the results, which timings depend on.
+    """
+    return {
+        'python': platform.python_version(),
+        'pandoc': pypandoc.get_pandoc_version(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def find_regressions(results: dict, baseline: dict, threshold: float) -> list:
+    """
+    Return a line per metric that is worse than the baseline by more than threshold.
+    """
+    regressions = []
+    for name, metrics in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for metric in METRICS:
+            old, new = previous.get(metric), metrics[metric]
+            if not old or new <= old * (1 + threshold):
+                continue
+            if metric.endswith('_seconds') and new - old < MIN_SECONDS_DELTA:
+                continue
+            regressions.append(f"{name} {metric}: {old} -> {new} (+{(new / old - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, nargs='+', default=[1, 10, 100, 1000], help="document sizes in pages")
+    parser.add_argument('--variants', nargs='+', default=list(VARIANTS), choices=VARIANTS, help="document variants")
+    parser.add_argument('--output', default='benchmark_results.json', help="where to write the JSON results")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="JSON results of an earlier run to compare against "
+                        "(default: benchmarks/baseline.json)")
+    parser.add_argument('--no-baseline', dest='baseline', action='store_const', const=None,
+                        help="do not compare against a baseline")
+    parser.add_argument('--threshold', type=float, default=0.2, help="allowed relative growth of a metric")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        results = run_suite(args.pages, args.variants, work_dir)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(dict(environment(), documents=results), f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        differences = [
+            f"{key} {baseline.get(key)} (now {value})"
+            for key, value in environment().items() if baseline.get(key) != value
+        ]
+        if differences:
+            print(f"\nWarning: {args.baseline} was recorded with " + ", ".join(differences)
+                  + "; timings and memory may not be comparable")
+        regressions = find_regressions(results, baseline['documents'], args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) above {args.threshold:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"No regressions above {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
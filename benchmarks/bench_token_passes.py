@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the post-processing passes that run as token visitors.
+
+Every corpus variant is converted with pandoc once; the bodies, with
+highlighting, colors, figures, references and Unicode symbols added, are
+repeated until the text reaches the requested size. The visitor passes the
+pipeline runs with preserve_linebreaks off are then timed two ways: one
+after another, each scanning the whole text, and together on a single scan
+with apply_visitors(). Both must produce the same text.
+
+Usage:
+    python benchmarks/bench_token_passes.py [--size-mb N] [--repeat N]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pypandoc
+
+from converter import ConversionOptions, PostProcessingPipeline, _pandoc_args
+from corpus import VARIANTS, create_variant_docx
+from latex_tokens import apply_visitors
+
+MARKUP = (
+    "\n\nA \\hl{highlighted} and \\textcolor{red}{colored \\textbf{bold}} word, "
+    "\\colorbox{yellow}{a box} and \\ul{underlined text}; see Figure \\ref{fig:one} and Table \\ref{tab:two}.\n\n"
+    "\\begin{figure}\n\\includegraphics{media/image1.png}\n\\caption{A figure}\\label{fig:one}\n\\end{figure}\n\n"
+    "Symbols α ≤ β, x ∈ ℝ and ∑ in text; in math $α + β ≥ γ$ and \\(x ≠ y\\) — with odd\u2009spaces.\n\n"
+)
+
+
+def build_body(work_dir: str, size_mb: float) -> str:
+    bodies = []
+    for variant in VARIANTS:
+        docx_path = os.path.join(work_dir, f'{variant}.docx')
+        create_variant_docx(docx_path, 2, variant)
+        latex = pypandoc.convert_file(docx_path, 'latex', extra_args=_pandoc_args(False, None, True, True, False))
+        bodies.append(latex.split('\\begin{document}', 1)[-1].rsplit('\\end{document}', 1)[0])
+    unit = MARKUP.join(bodies) + MARKUP
+    return unit * max(1, int(size_mb * 1024 * 1024 / len(unit)))
+
+
+def best_of(function, repeat: int) -> tuple:
+    """(best seconds, result of the last run)"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def run_separately(passes: list, content: str, options: ConversionOptions) -> tuple:
+    """Each pass on its own scan; returns (text, seconds per pass)."""
+    seconds = []
+    for post_pass in passes:
+        start = time.perf_counter()
+        content = post_pass.apply(content, options, frozenset())[0]
+        seconds.append(time.perf_counter() - start)
+    return content, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size-mb', type=float, default=10.0, help="size of the generated body")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per mode (best is reported)")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='bench_token_passes_')
+    try:
+        content = build_body(work_dir, args.size_mb)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    options = ConversionOptions(overleaf_compatible=True, preserve_linebreaks=False)
+    passes = [post_pass for post_pass in PostProcessingPipeline().active_passes(options) if post_pass.visitor]
+    visitors = [post_pass.visitor for post_pass in passes]
+
+    separate, (separate_text, pass_seconds) = best_of(lambda: run_separately(passes, content, options), args.repeat)
+    shared, (shared_text, visitor_results) = best_of(lambda: apply_visitors(content, visitors, options), args.repeat)
+    if separate_text != shared_text:
+        raise SystemExit("Output mismatch between separate and shared scans")
+
+    print(f"input size: {len(content) / 1e6:.1f} M characters, {len(passes)} visitor passes\n")
+    print(f"{'pass':<20} {'separate':>10} {'shared':>10} {'matches':>8}")
+    for post_pass, seconds, result in zip(passes, pass_seconds, visitor_results):
+        print(f"{post_pass.name:<20} {seconds * 1000:>8.1f}ms {result.seconds * 1000:>8.1f}ms {result.matches:>8}")
+    print(f"{'total':<20} {separate * 1000:>8.1f}ms {shared * 1000:>8.1f}ms")
+    print(f"\nspeedup: {separate / shared:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
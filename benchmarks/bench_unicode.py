@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the single-pass Unicode conversion in converter.py.
+
+Compares _convert_unicode_math_characters() against the previous approach (one
+str.replace per table entry followed by the regex and cleanup passes) and checks
+that both produce identical output. The generated text separates the symbols
+with spaces and keeps them out of math, where the two approaches agree.
+
+Usage:
+    python benchmarks/bench_unicode.py [--size-mb N] [--repeat N]
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from converter import (
+    _UNICODE_DASHES,
+    _UNICODE_SPACES,
+    _UNICODE_TO_LATEX,
+    _convert_unicode_math_characters,
+)
+
+
+def multi_pass_conversion(content: str) -> str:
+    """The replace-per-character implementation this benchmark compares against."""
+    for unicode_char, latex_cmd in _UNICODE_TO_LATEX.items():
+        if unicode_char in content:
+            content = content.replace(unicode_char, latex_cmd)
+    content = re.sub(r'[\u2000-\u200F\u2028-\u202F\u205F\u3000]', ' ', content)
+    content = re.sub(r'[\u2010-\u2015]', '-', content)
+    content = re.sub(r'[\u2212]', '-', content)
+    content = re.sub(r'\$\\bar\{\}\$([a-zA-Z])', r'$\\bar{\1}$', content)
+    content = re.sub(r'([a-zA-Z])\$\\bar\{\}\$', r'$\\bar{\1}$', content)
+
+    for unicode_space in _UNICODE_SPACES:
+        content = content.replace(unicode_space, ' ')
+    for unicode_dash in _UNICODE_DASHES:
+        if unicode_dash in ['\u2013', '\u2014']:
+            content = content.replace(unicode_dash, '--')
+        else:
+            content = content.replace(unicode_dash, '-')
+    content = re.sub(r'[\u2000-\u200F\u2028-\u202F\u205F\u3000]', ' ', content)
+    content = re.sub(r'[\u2010-\u2015\u2212]', '-', content)
+    return content
+
+
+def generate_text(size_bytes: int, seed: int = 0) -> str:
+    """French-like prose sprinkled with math symbols, Greek letters and odd spaces."""
+    rnd = random.Random(seed)
+    words = ["résumé", "thèse", "signal", "fréquence", "analyse", "the", "of", "and", "mesure", "écart"]
+    specials = list(_UNICODE_TO_LATEX) + _UNICODE_SPACES + _UNICODE_DASHES + ["$$x$$", "ˉx"]
+    parts = []
+    total = 0
+    while total < size_bytes:
+        piece = rnd.choice(specials) if rnd.random() < 0.05 else rnd.choice(words)
+        parts.append(piece)
+        total += len(piece) + 1
+    return ' '.join(parts)
+
+
+def best_of(function, content: str, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(content)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size-mb', type=float, default=5.0, help="size of the generated text")
+    parser.add_argument('--repeat', type=int, default=5, help="runs per implementation (best is reported)")
+    args = parser.parse_args()
+
+    content = generate_text(int(args.size_mb * 1024 * 1024))
+
+    if multi_pass_conversion(content) != _convert_unicode_math_characters(content):
+        raise SystemExit("Output mismatch between single-pass and multi-pass conversion")
+
+    multi = best_of(multi_pass_conversion, content, args.repeat)
+    single = best_of(_convert_unicode_math_characters, content, args.repeat)
+
+    print(f"input size:  {len(content) / 1e6:.1f} M characters")
+    print(f"multi-pass:  {multi * 1000:.1f} ms")
+    print(f"single-pass: {single * 1000:.1f} ms")
+    print(f"speedup:     {multi / single:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Synthetic DOCX documents for the benchmark scripts.
+"""
+
+import io
+import os
+import random
+
+from docx import Document
+from docx.shared import Inches
+from PIL import Image, ImageDraw
+
+# Document variants understood by create_variant_docx()
+VARIANTS = ('text', 'images', 'tables', 'lists', 'math')
+
+# Roughly one printed page of running text
+_PARAGRAPHS_PER_PAGE = 5
+
+_SENTENCE = "The quick brown fox jumps over the lazy dog while the committee reviews the quarterly figures. "
+
+_MATH_SENTENCES = (
+    "Let α, β and γ be angles with α + β ≤ γ and θ ≠ π.",
+    "The sum ∑ xᵢ over i ∈ ℕ converges when |x| < 1, so x² + y² ≥ 0.",
+    "For all ε > 0 there is δ > 0 such that |f(x) − f(y)| < ε ⇒ |x − y| < δ.",
+    "The integral ∫ e^(−λt) dt equals 1/λ and Δ ≈ √(σ² + μ²).",
+    "Hence a → b, b ↔ c and ∀x ∃y with x ⊂ y ∪ z and y ∩ z = ∅.",
+)
+
+
+def create_text_docx(filename: str, paragraphs: int = 20, title: str = "Benchmark Document"):
+    """
+    Create a plain DOCX with a heading, paragraphs and a short list.
+    """
+    doc = Document()
+    doc.add_heading(title, level=1)
+    for i in range(paragraphs):
+        if i and i % 10 == 0:
+            doc.add_heading(f"Section {i // 10}", level=2)
+        doc.add_paragraph(
+            f"Paragraph {i}: the quick brown fox jumps over the lazy dog. "
+            "Mathematical symbols such as α, β, ≤ and ∑ appear in running text."
+        )
+    doc.add_paragraph("First numbered item", style='List Number')
+    doc.add_paragraph("Second numbered item", style='List Number')
+    doc.add_paragraph("First bullet point", style='List Bullet')
+    doc.save(filename)
+    return filename
+
+
+def create_corpus(directory: str, count: int, paragraphs: int = 20) -> list:
+    """
+    Create ``count`` text documents in ``directory`` and return their paths.
+    """
+    os.makedirs(directory, exist_ok=True)
+    return [
+        create_text_docx(os.path.join(directory, f"doc_{i:03d}.docx"), paragraphs, f"Benchmark Document {i}")
+        for i in range(count)
+    ]
+
+
+def create_variant_docx(filename: str, pages: int, variant: str = 'text', seed: int = 0):
+    """
+    Create a DOCX of roughly ``pages`` pages in one of the VARIANTS.
+
+    Every variant keeps a heading per page so pandoc output has the usual
+    section structure; the page content is running text, one generated image,
+    one table, nested lists or Greek and mathematical characters.
+    """
+    if variant not in VARIANTS:
+        raise ValueError(f"Unknown variant '{variant}', expected one of {', '.join(VARIANTS)}")
+    rng = random.Random(seed)
+    doc = Document()
+    doc.add_heading(f"Benchmark Document ({variant}, {pages} pages)", level=1)
+
+    for page in range(pages):
+        doc.add_heading(f"Section {page + 1}", level=2)
+        if variant == 'text':
+            for i in range(_PARAGRAPHS_PER_PAGE):
+                doc.add_paragraph(f"Paragraph {i}. " + _SENTENCE * 5)
+        elif variant == 'images':
+            doc.add_paragraph(f"Figure {page + 1} shows generated sample data. " + _SENTENCE)
+            doc.add_picture(_create_image(rng), width=Inches(4))
+            doc.add_paragraph(f"Figure {page + 1}: generated sample data.")
+        elif variant == 'tables':
+            doc.add_paragraph(f"Table {page + 1} lists generated measurements.")
+            _add_table(doc, rng, rows=12, columns=5)
+        elif variant == 'lists':
+            for i in range(4):
+                doc.add_paragraph(f"Step {i + 1}: " + _SENTENCE, style='List Number')
+                doc.add_paragraph("Detail for this step. " + _SENTENCE, style='List Bullet 2')
+                doc.add_paragraph("Another detail.", style='List Bullet 2')
+            doc.add_paragraph("Closing remark. " + _SENTENCE, style='List Bullet')
+        else:
+            for i in range(_PARAGRAPHS_PER_PAGE):
+                doc.add_paragraph(" ".join(rng.choice(_MATH_SENTENCES) for _ in range(4)))
+
+    doc.save(filename)
+    return filename
+
+
+def _create_image(rng: random.Random) -> io.BytesIO:
+    """
+    Draw a small PNG chart with random bars, so images differ between pages.
+    """
+    image = Image.new('RGB', (480, 320), 'white')
+    draw = ImageDraw.Draw(image)
+    x = 20
+    while x < 460:
+        height = rng.randint(20, 280)
+        color = (rng.randint(0, 200), rng.randint(0, 200), rng.randint(0, 255))
+        draw.rectangle([x, 300 - height, x + 24, 300], fill=color)
+        x += 32
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    buffer.seek(0)
+    return buffer
+
+
+def _add_table(doc, rng: random.Random, rows: int, columns: int):
+    table = doc.add_table(rows=rows + 1, cols=columns)
+    table.style = 'Table Grid'
+    for column in range(columns):
+        table.cell(0, column).text = f"Column {column + 1}"
+    for row in range(1, rows + 1):
+        for column in range(columns):
+            table.cell(row, column).text = f"{rng.uniform(0, 1000):.2f}"
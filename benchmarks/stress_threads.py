@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Stress test: concurrent conversions on a thread pool must not mix outputs.
+
+Generates documents that each carry a unique marker (and, for the image
+variant, their own random images), converts each one sequentially for
+reference, then converts all of them several times on a thread pool through
+every entry point: convert_docx_to_latex(), convert_docx_bytes(), a
+Converter per thread, a shared AST cache, incremental state and a pass
+budget (which runs passes in child processes off the main thread). While
+the pool runs, another thread keeps changing the working directory.
+
+Every output must equal its reference byte for byte, LaTeX and images. A
+mismatch is reported, together with markers of other documents found in it,
+and the script exits with status 1.
+
+Usage:
+    python benchmarks/stress_threads.py [--documents N] [--threads N] [--rounds N]
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from docx import Document
+
+from converter import (
+    ConversionOptions,
+    Converter,
+    PostProcessingPipeline,
+    convert_docx_bytes,
+    convert_docx_to_latex,
+)
+from corpus import VARIANTS, create_variant_docx
+
+ENTRY_POINTS = ('function', 'bytes', 'session', 'ast_cache', 'incremental', 'pass_budget')
+MARKER_PATTERN = re.compile(r'Stress marker (\d+)')
+
+_sessions = threading.local()
+
+
+def create_documents(directory: str, count: int, pages: int) -> list:
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f'doc_{i}.docx')
+        create_variant_docx(path, pages, VARIANTS[i % len(VARIANTS)], seed=i)
+        document = Document(path)
+        document.add_paragraph(f"Stress marker {i}")
+        document.save(path)
+        paths.append(path)
+    return paths
+
+
+def convert(entry_point: str, docx_path: str, output_dir: str, shared_dir: str) -> tuple:
+    """Convert one document; returns (LaTeX, {image name: bytes})."""
+    os.makedirs(output_dir)
+    latex_path = os.path.join(output_dir, 'out.tex')
+    media_path = os.path.join(output_dir, 'media_out')
+    options = ConversionOptions(overleaf_compatible=True, extract_media_to_path=media_path)
+    name = os.path.splitext(os.path.basename(docx_path))[0]
+
+    if entry_point == 'bytes':
+        with open(docx_path, 'rb') as f:
+            result = convert_docx_bytes(f.read(), ConversionOptions(overleaf_compatible=True))
+        if not result.success:
+            raise RuntimeError(result.message)
+        return result.latex, {os.path.basename(path): data for path, data in result.media.items()}
+
+    if entry_point == 'session':
+        if not hasattr(_sessions, 'converter'):
+            _sessions.converter = Converter()
+        success, message = _sessions.converter.convert(docx_path, latex_path, options)
+    else:
+        keywords = {}
+        if entry_point == 'ast_cache':
+            keywords['ast_cache_dir'] = os.path.join(shared_dir, 'ast')
+        elif entry_point == 'incremental':
+            keywords['incremental_state_path'] = os.path.join(shared_dir, 'incremental', f'{name}.json.gz')
+        elif entry_point == 'pass_budget':
+            keywords['pipeline'] = PostProcessingPipeline(pass_budget=30)
+        success, message = convert_docx_to_latex(
+            docx_path, latex_path, extract_media_to_path=media_path, overleaf_compatible=True, **keywords
+        )
+    if not success:
+        raise RuntimeError(message)
+
+    with open(latex_path, 'r', encoding='utf-8') as f:
+        latex = f.read()
+    media = {}
+    for root, _, names in os.walk(media_path):
+        for image in names:
+            with open(os.path.join(root, image), 'rb') as f:
+                media[image] = f.read()
+    return latex, media
+
+
+def change_directories(directories: list, stop: threading.Event) -> int:
+    changes = 0
+    while not stop.is_set():
+        os.chdir(directories[changes % len(directories)])
+        changes += 1
+        time.sleep(0.001)
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--documents', type=int, default=10, help="number of generated documents")
+    parser.add_argument('--threads', type=int, default=8, help="thread pool size")
+    parser.add_argument('--rounds', type=int, default=2, help="conversions of each document per entry point")
+    parser.add_argument('--pages', type=int, default=2, help="pages per generated document")
+    args = parser.parse_args()
+
+    original_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir:
+        documents = create_documents(work_dir, args.documents, args.pages)
+        shared_dir = os.path.join(work_dir, 'shared')
+
+        expected = {}
+        for i, docx_path in enumerate(documents):
+            for entry_point in ENTRY_POINTS:
+                output_dir = os.path.join(work_dir, 'reference', f'{i}_{entry_point}')
+                expected[i, entry_point] = convert(entry_point, docx_path, output_dir, shared_dir)
+
+        jobs = [
+            (i, entry_point, run)
+            for i in range(len(documents)) for entry_point in ENTRY_POINTS for run in range(args.rounds)
+        ]
+        random.Random(0).shuffle(jobs)
+        directories = [tempfile.mkdtemp(dir=work_dir) for _ in range(3)]
+        stop = threading.Event()
+        changer = ThreadPoolExecutor(max_workers=1)
+        changes = changer.submit(change_directories, directories, stop)
+
+        start = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=args.threads) as executor:
+                futures = {
+                    executor.submit(
+                        convert, entry_point, documents[i],
+                        os.path.join(work_dir, 'stress', f'{i}_{entry_point}_{run}'), shared_dir
+                    ): (i, entry_point)
+                    for i, entry_point, run in jobs
+                }
+                mismatches = 0
+                for future, (i, entry_point) in futures.items():
+                    latex, media = future.result()
+                    if (latex, media) == expected[i, entry_point]:
+                        continue
+                    mismatches += 1
+                    foreign = sorted({int(n) for n in MARKER_PATTERN.findall(latex)} - {i})
+                    print(f"MISMATCH document {i} via {entry_point}"
+                          + (f": contains markers of documents {foreign}" if foreign else ""))
+        finally:
+            stop.set()
+            changer.shutdown()
+            os.chdir(original_dir)
+        elapsed = time.perf_counter() - start
+
+    print(f"{len(jobs)} conversions on {args.threads} threads in {elapsed:.1f}s "
+          f"({changes.result()} working directory changes meanwhile): {mismatches} mismatches")
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,327 @@
+"""
+Content-addressed cache for DOCX to LaTeX conversion results.
+
+Entries are keyed by the SHA-256 of the input document, a canonical hash of the
+conversion options (including the post-processing passes that run), the
+pandoc version, the contents of the Lua filters and CACHE_FORMAT_VERSION.
+Each entry stores the post-processed .tex and the extracted media on disk;
+the least recently used entries are evicted when the cache grows beyond its
+byte budget. Media is linked rather
+than copied into and out of entries, and with a MediaStore every image is
+kept once across entries and conversions.
+"""
+
+import hashlib
+import json
+import os
+import posixpath
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+
+from converter import (
+    LINEBREAK_FILTER_PATH, POST_PROCESSING_PASSES, POSTPROCESS_FILTER_PATH, PostProcessingPipeline,
+    _file_hash, _fix_image_paths_for_overleaf, convert_docx_to_latex
+)
+from docx_media import MediaOptimizer
+from media_store import MediaStore, link_tree
+
+# Part of every key, so entries stored by older code are no longer hits.
+# Bump it with every change to the output of a conversion (converter.py,
+# latex_tokens.py, latex_preamble.py, docx_media.py or the Lua filters).
+CACHE_FORMAT_VERSION = 1
+
+# Stands in for the media extraction path inside cached .tex files
+_MEDIA_PATH_PLACEHOLDER = '\x00MEDIA_PATH\x00'
+
+
+class ConversionCache:
+    """
+    Caches convert_docx_to_latex() results in a directory with LRU eviction.
+
+    Usage:
+        cache = ConversionCache('temp/cache', max_bytes=512 * 1024 * 1024)
+        success, message = cache.convert(docx_path, latex_path, ...)
+        print(cache.stats())
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 512 * 1024 * 1024, media_store: MediaStore = None):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = max_bytes
+        # Converted media is deduplicated into this store before it is cached
+        self.media_store = media_store
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._pandoc_version = None
+        self._lock = threading.Lock()
+        # key -> entry size in bytes, least recently used first
+        self._entries = OrderedDict()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load_index()
+
+    def convert(
+        self,
+        docx_path: str,
+        latex_path: str,
+        generate_toc: bool = False,
+        extract_media_to_path: str = None,
+        latex_template_path: str = None,
+        overleaf_compatible: bool = False,
+        preserve_styles: bool = True,
+        preserve_linebreaks: bool = True,
+        backend: str = 'pypandoc',
+        post_processing_workers: int = 1,
+        pipeline: PostProcessingPipeline = None,
+        ast_cache_dir: str = None,
+        incremental_state_path: str = None,
+        media_optimizer: MediaOptimizer = None,
+        minimal_preamble: bool = False,
+        ast_post_processing: bool = False,
+        pandoc_workers: int = 1
+    ) -> tuple[bool, str]:
+        """
+        Same as convert_docx_to_latex(), but served from the cache when possible.
+
+        ast_cache_dir, incremental_state_path and pandoc_workers do not change
+        the output and are not part of the key.
+        """
+        with open(docx_path, 'rb') as f:
+            docx_bytes = f.read()
+
+        key = self.key_for(
+            docx_bytes,
+            generate_toc=generate_toc,
+            overleaf_compatible=overleaf_compatible,
+            preserve_styles=preserve_styles,
+            preserve_linebreaks=preserve_linebreaks,
+            minimal_preamble=minimal_preamble,
+            ast_post_processing=ast_post_processing,
+            latex_template_path=latex_template_path,
+            passes=_active_passes(pipeline),
+            media_signature=_media_signature(extract_media_to_path, overleaf_compatible),
+            media_optimization=media_optimizer.key if media_optimizer and extract_media_to_path else None
+        )
+
+        cached = self._restore(key, latex_path, extract_media_to_path)
+        if cached is not None:
+            return True, cached
+
+        with self._lock:
+            self.misses += 1
+
+        success, message = convert_docx_to_latex(
+            docx_path,
+            latex_path,
+            generate_toc=generate_toc,
+            extract_media_to_path=extract_media_to_path,
+            latex_template_path=latex_template_path,
+            overleaf_compatible=overleaf_compatible,
+            preserve_styles=preserve_styles,
+            preserve_linebreaks=preserve_linebreaks,
+            backend=backend,
+            post_processing_workers=post_processing_workers,
+            pipeline=pipeline,
+            ast_cache_dir=ast_cache_dir,
+            incremental_state_path=incremental_state_path,
+            media_optimizer=media_optimizer,
+            minimal_preamble=minimal_preamble,
+            ast_post_processing=ast_post_processing,
+            pandoc_workers=pandoc_workers
+        )
+        # Output with passes aborted for time is not what the key promises
+        if success and pipeline and pipeline.timed_out_passes:
+            print(f"Not caching conversion of {docx_path}: post-processing passes were aborted")
+        elif success:
+            if self.media_store and extract_media_to_path and os.path.isdir(extract_media_to_path):
+                self.media_store.ingest(extract_media_to_path)
+            try:
+                self._store(key, message, latex_path, extract_media_to_path)
+            except OSError as e:
+                # A failed cache write must not fail the conversion
+                print(f"Warning: Failed to store conversion in cache: {e}")
+        return success, message
+
+    def key_for(self, docx_bytes: bytes, **options) -> str:
+        """
+        Build the cache key for a document and a set of conversion options.
+        """
+        template_path = options.pop('latex_template_path', None)
+        if template_path and os.path.isfile(template_path):
+            with open(template_path, 'rb') as f:
+                options['template'] = hashlib.sha256(f.read()).hexdigest()
+        else:
+            options['template'] = template_path
+        options['pandoc_version'] = self.pandoc_version()
+        options['format_version'] = CACHE_FORMAT_VERSION
+        options['filters'] = [_file_hash(LINEBREAK_FILTER_PATH), _file_hash(POSTPROCESS_FILTER_PATH)]
+
+        canonical_options = json.dumps(options, sort_keys=True, separators=(',', ':'))
+        document_hash = hashlib.sha256(docx_bytes).hexdigest()
+        options_hash = hashlib.sha256(canonical_options.encode('utf-8')).hexdigest()
+        return hashlib.sha256(f'{document_hash}:{options_hash}'.encode('ascii')).hexdigest()
+
+    def pandoc_version(self) -> str:
+        if self._pandoc_version is None:
+            import pypandoc
+            try:
+                self._pandoc_version = pypandoc.get_pandoc_version()
+            except OSError:
+                self._pandoc_version = 'unknown'
+        return self._pandoc_version
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and the current cache size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'size_bytes': sum(self._entries.values()),
+                'max_bytes': self.max_bytes,
+            }
+
+    def clear(self):
+        """Remove every cached entry."""
+        with self._lock:
+            for key in list(self._entries):
+                self._remove_entry(key)
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def _load_index(self):
+        """Rebuild the LRU index from the entries already on disk."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            entry_dir = os.path.join(self.cache_dir, name)
+            if name.startswith('.tmp-'):
+                # Left over from an interrupted store
+                shutil.rmtree(entry_dir, ignore_errors=True)
+            elif os.path.isfile(os.path.join(entry_dir, 'entry.json')):
+                entries.append((os.path.getmtime(entry_dir), name, _directory_size(entry_dir)))
+        for _, name, size in sorted(entries):
+            self._entries[name] = size
+
+    def _restore(self, key: str, latex_path: str, extract_media_to_path: str):
+        """
+        Link a cached entry to the requested paths. Returns the message, or None on a miss.
+        """
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        entry_dir = self._entry_dir(key)
+        try:
+            with open(os.path.join(entry_dir, 'entry.json'), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            with open(os.path.join(entry_dir, 'document.tex'), 'r', encoding='utf-8') as f:
+                content = f.read()
+
+            if extract_media_to_path:
+                content = content.replace(_MEDIA_PATH_PLACEHOLDER, extract_media_to_path)
+                cached_media = os.path.join(entry_dir, 'media')
+                if os.path.isdir(cached_media):
+                    link_tree(cached_media, extract_media_to_path)
+
+            with open(latex_path, 'w', encoding='utf-8') as f:
+                f.write(content)
+            os.utime(entry_dir)
+        except (OSError, ValueError):
+            # Damaged entry: drop it and convert again
+            with self._lock:
+                self.hits -= 1
+                self._remove_entry(key)
+            return None
+
+        return entry['message']
+
+    def _store(self, key: str, message: str, latex_path: str, extract_media_to_path: str):
+        staging_dir = os.path.join(self.cache_dir, f'.tmp-{uuid.uuid4().hex}')
+        os.makedirs(staging_dir)
+        try:
+            with open(latex_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            if extract_media_to_path:
+                content = content.replace(extract_media_to_path, _MEDIA_PATH_PLACEHOLDER)
+                if os.path.isdir(extract_media_to_path):
+                    link_tree(extract_media_to_path, os.path.join(staging_dir, 'media'))
+
+            with open(os.path.join(staging_dir, 'document.tex'), 'w', encoding='utf-8') as f:
+                f.write(content)
+            with open(os.path.join(staging_dir, 'entry.json'), 'w', encoding='utf-8') as f:
+                json.dump({'message': message}, f)
+
+            size = _directory_size(staging_dir)
+            with self._lock:
+                if key in self._entries:
+                    # Stored concurrently by another request
+                    shutil.rmtree(staging_dir, ignore_errors=True)
+                    return
+                os.rename(staging_dir, self._entry_dir(key))
+                self._entries[key] = size
+                self._evict()
+        except BaseException:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+
+    def _evict(self):
+        """Drop least recently used entries until the cache fits its budget."""
+        total = sum(self._entries.values())
+        while total > self.max_bytes and len(self._entries) > 1:
+            key, size = next(iter(self._entries.items()))
+            self._remove_entry(key)
+            self.evictions += 1
+            total -= size
+
+    def _remove_entry(self, key: str):
+        self._entries.pop(key, None)
+        if self.media_store:
+            try:
+                self.media_store.release(os.path.join(self._entry_dir(key), 'media'))
+            except OSError as e:
+                print(f"Warning: Failed to release cached media: {e}")
+        shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+
+def _active_passes(pipeline: PostProcessingPipeline) -> list:
+    """
+    Names of the post-processing passes a pipeline runs, in order.
+
+    Passes are identified by name, so a custom pass must not reuse the name
+    of a built-in one.
+    """
+    passes = pipeline.passes if pipeline else POST_PROCESSING_PASSES
+    disabled = pipeline.disabled if pipeline else ()
+    return [post_pass.name for post_pass in passes if post_pass.name not in disabled]
+
+
+def _media_signature(extract_media_to_path: str, overleaf_compatible: bool):
+    """
+    Describe how the media path appears in the converted .tex.
+
+    Cached .tex files store the extraction path as a placeholder, so the path
+    itself is not part of the key. The Overleaf fixes can, however, rewrite
+    image paths depending on the directory name, so the signature is the image
+    reference those fixes produce for this path.
+    """
+    if not extract_media_to_path:
+        return None
+    probe = '\\includegraphics{' + posixpath.join(extract_media_to_path, 'media/image.png') + '}'
+    if overleaf_compatible:
+        probe = _fix_image_paths_for_overleaf(probe, extract_media_to_path)
+    return probe.replace(extract_media_to_path, _MEDIA_PATH_PLACEHOLDER)
+
+
+def _directory_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
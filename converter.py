@@ -1,7 +1,52 @@
-import pypandoc
+import gzip
+import hashlib
+import json
 import os
+import posixpath
 import re
+import shutil
+import signal
+import subprocess
 import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from dataclasses import dataclass, field, fields, replace
+from functools import partial
+from operator import attrgetter
+from typing import Callable
+
+from docx_media import MediaOptimizer, extract_media, read_media, write_media
+from docx_sections import build_marked_docx, document_marker, section_marker, split_docx
+from latex_preamble import Preamble, split_document
+from latex_tokens import Token, TokenDocument, TokenVisitor, apply_visitors
+from pandoc_server import PandocServerError, get_default_server
+
+# Lua filter shipped next to this module; used when preserve_linebreaks is set
+LINEBREAK_FILTER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'linebreak_filter.lua')
+# Lua filter that does the markup post-processing on the AST; used when ast_post_processing is set
+POSTPROCESS_FILTER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'postprocess_filter.lua')
+# Oldest pandoc Converter accepts: --lua-filter needs pandoc 2.0
+MIN_PANDOC_VERSION = (2, 0)
+# pandoc runs in a fresh scratch directory named with this prefix, never in
+# the process working directory; every path it is given is absolute
+PANDOC_WORKDIR_PREFIX = 'docx2latex-'
+
+# .tex files at least this large are post-processed in chunks of about
+# STREAM_CHUNK_SIZE characters instead of as one string
+STREAMING_THRESHOLD_BYTES = 32 * 1024 * 1024
+STREAM_CHUNK_SIZE = 1024 * 1024
+# Smaller chunks for parallel post-processing, so mid-sized documents still
+# spread over several worker processes
+PARALLEL_CHUNK_SIZE = 256 * 1024
+
+# Incremental conversion state keeps the sections of this many option sets per document
+INCREMENTAL_RECORDS_PER_DOCUMENT = 8
 
 def convert_docx_to_latex(
     docx_path: str,
@@ -11,569 +56,2281 @@ def convert_docx_to_latex(
     latex_template_path: str = None,
     overleaf_compatible: bool = False,
     preserve_styles: bool = True,
-    preserve_linebreaks: bool = True
+    preserve_linebreaks: bool = True,
+    backend: str = 'pypandoc',
+    post_processing_workers: int = 1,
+    pipeline: 'PostProcessingPipeline' = None,
+    ast_cache_dir: str = None,
+    incremental_state_path: str = None,
+    media_optimizer: MediaOptimizer = None,
+    minimal_preamble: bool = False,
+    ast_post_processing: bool = False,
+    pandoc_workers: int = 1
 ) -> tuple[bool, str]:
     """
-    Converts a DOCX file to a LaTeX file using pypandoc with enhanced features.
+    Converts a DOCX file to a LaTeX file using pypandoc with enhanced features.
+
+    Args:
+        docx_path: Path to the input .docx file.
+        latex_path: Path to save the output .tex file.
+        generate_toc: If True, attempts to generate a Table of Contents.
+        extract_media_to_path: If specified, path to extract media to (e.g., "./media").
+        latex_template_path: If specified, path to a custom Pandoc LaTeX template file.
+        overleaf_compatible: If True, makes images work in Overleaf with relative paths.
+        preserve_styles: If True, preserves document styles like centering and alignment.
+        preserve_linebreaks: If True, preserves line breaks and proper list formatting.
+        backend: 'pypandoc' starts a new pandoc process per call; 'server' sends the
+            conversion to a long-lived local `pandoc server` and falls back to
+            pypandoc if the server is unavailable.
+        post_processing_workers: Number of processes for post-processing the document
+            body. Values above 1 split the body into chunks; the output is identical.
+        pipeline: Post-processing pipeline to run; after the call its stats
+            attribute holds the per-pass statistics. Defaults to all passes.
+        ast_cache_dir: If specified, the parsed document is kept in this directory as
+            a gzip-compressed pandoc JSON AST, and converting the same DOCX again
+            (with any options) renders from it instead of running the DOCX reader.
+            Applies to the pypandoc backend.
+        incremental_state_path: If specified, the LaTeX of each section (from one
+            top-level heading to the next) is kept in this file, and converting a new
+            version of the same document only runs pandoc on the sections that
+            changed. Applies to the pypandoc backend.
+        media_optimizer: If specified, extracted images are downscaled and
+            recompressed by it; after the call its stats attribute holds the
+            totals for this document.
+        minimal_preamble: If True, the packages the conversion adds to the
+            preamble are kept only if the document uses them; the message
+            reports how many were dropped.
+        ast_post_processing: If True, the post-processing passes that edit
+            markup (Unicode symbols, highlighting, figures, references) are
+            done by a Lua filter while pandoc holds the document, and the
+            pipeline skips them. pandoc server cannot run Lua filters, so the
+            pypandoc backend is used.
+        pandoc_workers: Number of pandoc processes for the document. Values
+            above 1 split it at its headings into that many parts of about
+            equal size, convert them in parallel and join their LaTeX under
+            one preamble; the output is identical. Applies to the pypandoc
+            backend without ast_cache_dir and incremental_state_path.
+
+    Returns:
+        A tuple (success: bool, message: str).
+    """
+    # pypandoc is imported where it is used: it pulls in urllib and ssl for
+    # its downloader, which would slow every import of this module
+    import pypandoc
+    
+    if pipeline is None:
+        pipeline = PostProcessingPipeline()
+    # Resolved once, so a working directory change by another thread cannot
+    # redirect the conversion; image references keep extract_media_to_path as given
+    docx_path = os.path.abspath(docx_path)
+    latex_path = os.path.abspath(latex_path)
+    if backend == 'server' and not ast_post_processing:
+        try:
+            _convert_with_pandoc_server(
+                docx_path, latex_path, generate_toc, extract_media_to_path,
+                latex_template_path, overleaf_compatible, preserve_styles, preserve_linebreaks, media_optimizer
+            )
+            _apply_post_processing(latex_path, overleaf_compatible, preserve_styles, preserve_linebreaks, extract_media_to_path, workers=post_processing_workers, pipeline=pipeline, minimal_preamble=minimal_preamble)
+            return True, _conversion_message(overleaf_compatible, preserve_styles, preserve_linebreaks, _packages_dropped(pipeline, minimal_preamble))
+        except PandocServerError as e:
+            print(f"Warning: pandoc server backend failed, falling back to pypandoc: {e}")
+        except OSError as e:
+            return False, f"Conversion failed: {e}"
+
+    extra_args = _pandoc_args(
+        generate_toc, latex_template_path,
+        overleaf_compatible, preserve_styles, preserve_linebreaks, ast_post_processing
+    )
+    if preserve_linebreaks:
+        # Use original Word doc as reference for formatting
+        extra_args.append("--reference-doc=" + docx_path)
+
+    try:
+        # Perform conversion
+        if incremental_state_path:
+            _convert_incrementally(
+                docx_path, latex_path, generate_toc, extract_media_to_path, latex_template_path,
+                overleaf_compatible, preserve_styles, preserve_linebreaks, incremental_state_path, ast_cache_dir,
+                media_optimizer, ast_post_processing
+            )
+        elif ast_cache_dir:
+            _convert_from_cached_ast(
+                docx_path, latex_path, generate_toc, extract_media_to_path, latex_template_path,
+                overleaf_compatible, preserve_styles, preserve_linebreaks, ast_cache_dir, media_optimizer,
+                ast_post_processing
+            )
+        elif pandoc_workers > 1:
+            with open(docx_path, 'rb') as f:
+                docx_bytes = f.read()
+            render = partial(
+                _render_docx_bytes,
+                generate_toc=generate_toc,
+                latex_template_path=latex_template_path,
+                overleaf_compatible=overleaf_compatible,
+                preserve_styles=preserve_styles,
+                preserve_linebreaks=preserve_linebreaks,
+                ast_post_processing=ast_post_processing
+            )
+            latex = _render_in_parallel(docx_bytes, render, pandoc_workers)
+            if extract_media_to_path:
+                latex = _extract_referenced_media(latex, docx_bytes, extract_media_to_path, media_optimizer)
+            with open(latex_path, 'w', encoding='utf-8') as f:
+                f.write(latex)
+        elif extract_media_to_path:
+            # Images are copied out of the archive rather than by --extract-media
+            with tempfile.TemporaryDirectory(prefix=PANDOC_WORKDIR_PREFIX) as workdir:
+                latex = pypandoc.convert_file(docx_path, 'latex', extra_args=extra_args, cworkdir=workdir)
+            latex = _extract_referenced_media(latex, docx_path, extract_media_to_path, media_optimizer)
+            with open(latex_path, 'w', encoding='utf-8') as f:
+                f.write(latex)
+        else:
+            with tempfile.TemporaryDirectory(prefix=PANDOC_WORKDIR_PREFIX) as workdir:
+                pypandoc.convert_file(docx_path, 'latex', outputfile=latex_path, extra_args=extra_args, cworkdir=workdir)
+        
+        # Apply post-processing enhancements (always applied for Unicode conversion)
+        _apply_post_processing(latex_path, overleaf_compatible, preserve_styles, preserve_linebreaks, extract_media_to_path, workers=post_processing_workers, pipeline=pipeline, minimal_preamble=minimal_preamble, ast_post_processing=ast_post_processing)
+        
+        return True, _conversion_message(overleaf_compatible, preserve_styles, preserve_linebreaks, _packages_dropped(pipeline, minimal_preamble))
+        
+    except RuntimeError as e:
+        return False, f"RuntimeError: Could not execute Pandoc. Please ensure Pandoc is installed and in your system's PATH. Error: {e}"
+    except Exception as e:
+        return False, f"Conversion failed: {e}"
+
+@dataclass
+class ConversionOptions:
+    """
+    Options for convert_docx_bytes(), matching the convert_docx_to_latex() arguments.
+    """
+    generate_toc: bool = False
+    overleaf_compatible: bool = False
+    preserve_styles: bool = True
+    preserve_linebreaks: bool = True
+    latex_template_path: str = None
+    # If specified, media is also written below this directory, as with
+    # convert_docx_to_latex(); otherwise nothing is written to disk.
+    extract_media_to_path: str = None
+    # Keep only the added packages the document uses
+    minimal_preamble: bool = False
+    # Edit markup with the Lua filter on pandoc's AST instead of the markup passes
+    ast_post_processing: bool = False
+
+@dataclass
+class ConversionResult:
+    """
+    Result of an in-memory conversion.
+
+    Attributes:
+        success: Whether the conversion succeeded.
+        message: Status or error message.
+        latex: The post-processed LaTeX document.
+        media: Media manifest mapping each image path used in the LaTeX
+            (e.g. "media/image1.png") to the image bytes.
+        pass_stats: PassStats for every post-processing pass that ran.
+    """
+    success: bool
+    message: str
+    latex: str = ''
+    media: dict = field(default_factory=dict)
+    pass_stats: list = field(default_factory=list)
+
+def convert_docx_bytes(
+    data: bytes,
+    options: ConversionOptions = None,
+    pipeline: 'PostProcessingPipeline' = None,
+    media_optimizer: MediaOptimizer = None
+) -> ConversionResult:
+    """
+    Converts DOCX bytes to LaTeX entirely in memory.
+
+    The document is piped to pandoc's stdin, the LaTeX is read from stdout and
+    post-processed in memory, and images are read straight from the DOCX
+    archive. Nothing is written to disk unless options.extract_media_to_path
+    is set.
+
+    Args:
+        data: Raw contents of the .docx file.
+        options: Conversion options; defaults to ConversionOptions().
+        pipeline: Post-processing pipeline to run; defaults to all passes.
+        media_optimizer: If specified, the images in the media manifest are
+            downscaled and recompressed by it.
+
+    Returns:
+        A ConversionResult with the LaTeX text and the media manifest.
+    """
+    import pypandoc
+    
+    if options is None:
+        options = ConversionOptions()
+    if pipeline is None:
+        pipeline = PostProcessingPipeline()
+
+    # Media is resolved from the archive below, so pandoc only needs to
+    # reference it; --reference-doc only affects docx output and is omitted.
+    extra_args = ["--from=docx"] + _pandoc_args(
+        options.generate_toc, options.latex_template_path,
+        options.overleaf_compatible, options.preserve_styles, options.preserve_linebreaks,
+        options.ast_post_processing
+    )
+    try:
+        pandoc_path = pypandoc.get_pandoc_path()
+    except OSError as e:
+        return ConversionResult(False, f"RuntimeError: Could not execute Pandoc. Please ensure Pandoc is installed and in your system's PATH. Error: {e}")
+    return _convert_bytes(data, options, pipeline, media_optimizer, [pandoc_path, "--to=latex"] + extra_args)
+
+def _convert_bytes(
+    data: bytes,
+    options: ConversionOptions,
+    pipeline: 'PostProcessingPipeline',
+    media_optimizer: MediaOptimizer,
+    pandoc_command: list
+) -> ConversionResult:
+    """
+    Body of convert_docx_bytes() and Converter.convert_bytes(), given the pandoc command line.
+    """
+    try:
+        with tempfile.TemporaryDirectory(prefix=PANDOC_WORKDIR_PREFIX) as workdir:
+            process = subprocess.run(
+                pandoc_command,
+                input=data,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                cwd=workdir
+            )
+    except OSError as e:
+        return ConversionResult(False, f"RuntimeError: Could not execute Pandoc. Please ensure Pandoc is installed and in your system's PATH. Error: {e}")
+    if process.returncode != 0:
+        return ConversionResult(False, f"Conversion failed: {process.stderr.decode('utf-8', 'replace').strip()}")
+
+    latex = process.stdout.decode('utf-8')
+
+    try:
+        matches = list(_MEDIA_REFERENCE_PATTERN.finditer(latex))
+        name_map, media = read_media(data, [match.group(2) for match in matches])
+        if media_optimizer:
+            renamed, media = media_optimizer.optimize(media, _printed_sizes(matches, name_map))
+            name_map = {target: renamed.get(name, name) for target, name in name_map.items()}
+        if options.extract_media_to_path:
+            write_media(media, options.extract_media_to_path)
+        latex = _rewrite_media_references(latex, name_map, options.extract_media_to_path)
+    except (OSError, KeyError, zipfile.BadZipFile) as e:
+        return ConversionResult(False, f"Conversion failed: {e}")
+
+    # Failing passes are skipped and reported by the pipeline
+    latex = pipeline.run(latex, options)
+
+    message = _conversion_message(
+        options.overleaf_compatible, options.preserve_styles, options.preserve_linebreaks,
+        _packages_dropped(pipeline, options.minimal_preamble)
+    )
+    return ConversionResult(True, message, latex, media, list(pipeline.stats.values()))
+
+# Image paths as pandoc emits them when media is not extracted
+_MEDIA_REFERENCE_PATTERN = re.compile(r'(\\includegraphics(?:\[[^\]]*\])?\{)(media/[^{}]+)\}')
+
+class Converter:
+    """
+    Conversion session that does the per-process setup once.
+
+    Creating a Converter resolves the pandoc binary, checks its version
+    against MIN_PANDOC_VERSION and checks that the Lua filters are in
+    place; it raises RuntimeError if either is unusable. The pandoc arguments
+    of each option set are built on first use and kept, pandoc is run
+    directly (without pypandoc's per-call format probing) and one
+    post-processing pipeline is reused, so each call only converts.
+
+    A Converter is meant to be held by one worker (process or thread) and
+    used for one conversion at a time. After each call, pipeline.stats holds
+    the statistics of that conversion.
+
+    Usage:
+        converter = Converter(ConversionOptions(overleaf_compatible=True))
+        success, message = converter.convert('a.docx', 'a.tex')
+        result = converter.convert_bytes(docx_bytes)
+    """
+
+    def __init__(
+        self,
+        options: ConversionOptions = None,
+        disabled_passes=(),
+        pass_budget: float = None,
+        media_optimizer: MediaOptimizer = None,
+        post_processing_workers: int = 1,
+        pandoc_workers: int = 1
+    ):
+        """
+        Args:
+            options: Default options for convert() and convert_bytes();
+                defaults to ConversionOptions().
+            disabled_passes: Names of post-processing passes not to run.
+            pass_budget: Per-pass time budget, as for PostProcessingPipeline.
+            media_optimizer: If specified, extracted images are downscaled
+                and recompressed by it.
+            post_processing_workers: As for convert_docx_to_latex().
+            pandoc_workers: As for convert_docx_to_latex(); applies to convert().
+        """
+        import pypandoc
+        
+        self.options = options or ConversionOptions()
+        self.media_optimizer = media_optimizer
+        self.post_processing_workers = post_processing_workers
+        self.pandoc_workers = pandoc_workers
+        self.pipeline = PostProcessingPipeline(disabled=disabled_passes, pass_budget=pass_budget)
+        try:
+            self.pandoc_path = pypandoc.get_pandoc_path()
+            self.pandoc_version = pypandoc.get_pandoc_version()
+        except OSError as e:
+            raise RuntimeError(f"Could not execute Pandoc. Please ensure Pandoc is installed and in your system's PATH. Error: {e}")
+        if _version_tuple(self.pandoc_version) < MIN_PANDOC_VERSION:
+            raise RuntimeError(
+                f"Pandoc {self.pandoc_version} is too old, version "
+                f"{'.'.join(map(str, MIN_PANDOC_VERSION))} or later is required"
+            )
+        for filter_path in (LINEBREAK_FILTER_PATH, POSTPROCESS_FILTER_PATH):
+            if not os.path.isfile(filter_path):
+                raise RuntimeError(f"Lua filter not found: {filter_path}")
+        # Option set -> pandoc arguments
+        self._arguments = {}
+
+    def convert(self, docx_path: str, latex_path: str, options: ConversionOptions = None) -> tuple[bool, str]:
+        """
+        Same as convert_docx_to_latex() with the pypandoc backend.
+
+        options defaults to the session options; extract_media_to_path,
+        minimal_preamble and ast_post_processing are taken from it as well.
+        """
+        options = options or self.options
+        docx_path = os.path.abspath(docx_path)
+        latex_path = os.path.abspath(latex_path)
+        extra_args = self._pandoc_args(options)
+        if options.preserve_linebreaks:
+            # Use original Word doc as reference for formatting
+            extra_args = extra_args + ["--reference-doc=" + docx_path]
+        self.pipeline.stats = {}
+        
+        try:
+            if self.pandoc_workers > 1:
+                with open(docx_path, 'rb') as f:
+                    docx_bytes = f.read()
+                render = partial(
+                    _render_docx_bytes,
+                    generate_toc=options.generate_toc,
+                    latex_template_path=options.latex_template_path,
+                    overleaf_compatible=options.overleaf_compatible,
+                    preserve_styles=options.preserve_styles,
+                    preserve_linebreaks=options.preserve_linebreaks,
+                    ast_post_processing=options.ast_post_processing,
+                    pandoc_path=self.pandoc_path
+                )
+                latex = _render_in_parallel(docx_bytes, render, self.pandoc_workers)
+            else:
+                latex = _run_pandoc(['--from=docx', '--to=latex', docx_path] + extra_args, None, self.pandoc_path)
+            if options.extract_media_to_path:
+                latex = _extract_referenced_media(latex, docx_path, options.extract_media_to_path, self.media_optimizer)
+            with open(latex_path, 'w', encoding='utf-8') as f:
+                f.write(latex)
+            
+            _apply_post_processing(
+                latex_path, options.overleaf_compatible, options.preserve_styles, options.preserve_linebreaks,
+                options.extract_media_to_path, workers=self.post_processing_workers, pipeline=self.pipeline,
+                minimal_preamble=options.minimal_preamble, ast_post_processing=options.ast_post_processing
+            )
+            
+            return True, _conversion_message(
+                options.overleaf_compatible, options.preserve_styles, options.preserve_linebreaks,
+                _packages_dropped(self.pipeline, options.minimal_preamble)
+            )
+        
+        except RuntimeError as e:
+            return False, f"RuntimeError: Could not execute Pandoc. Please ensure Pandoc is installed and in your system's PATH. Error: {e}"
+        except Exception as e:
+            return False, f"Conversion failed: {e}"
+
+    def convert_bytes(self, data: bytes, options: ConversionOptions = None) -> ConversionResult:
+        """
+        Same as convert_docx_bytes(); options defaults to the session options.
+        """
+        options = options or self.options
+        self.pipeline.stats = {}
+        command = [self.pandoc_path, "--to=latex", "--from=docx"] + self._pandoc_args(options)
+        return _convert_bytes(data, options, self.pipeline, self.media_optimizer, command)
+
+    def _pandoc_args(self, options: ConversionOptions) -> list:
+        key = (
+            options.generate_toc, options.latex_template_path,
+            options.overleaf_compatible, options.preserve_styles, options.preserve_linebreaks,
+            options.ast_post_processing
+        )
+        if key not in self._arguments:
+            self._arguments[key] = _pandoc_args(*key)
+        return self._arguments[key]
+
+def _version_tuple(version: str) -> tuple:
+    """
+    (major, minor) of a version string such as "3.1.11".
+    """
+    return tuple(int(part) for part in re.findall(r'\d+', version)[:2])
+
+def convert_many(jobs, max_workers: int = None):
+    """
+    Converts many documents in parallel on a process pool.
+
+    Each job is a dict of convert_docx_to_latex() keyword arguments, e.g.
+    {"docx_path": "a.docx", "latex_path": "a.tex", "overleaf_compatible": True}.
+    At most max_workers conversions run at once and jobs are read lazily from
+    the iterable, so generators of any length are fine.
+    Each worker process converts on one Converter session, except for jobs
+    with arguments other than the ConversionOptions fields.
+
+    Args:
+        jobs: Iterable of job dicts.
+        max_workers: Number of worker processes; defaults to the CPU count.
+
+    Yields:
+        A tuple (job, success: bool, message: str) for each job, in completion
+        order. A failing or crashing document only fails its own job.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    jobs = iter(jobs)
+    # Jobs whose worker process died, with the number of attempts so far
+    retries = []
+    pending = {}
+    executor = ProcessPoolExecutor(max_workers=max_workers)
+    
+    try:
+        while True:
+            # Keep the pool busy without queueing every job up front
+            while len(pending) < max_workers * 2:
+                if retries:
+                    if pending:
+                        # Retried jobs run alone, so a second crash pins down the culprit
+                        break
+                    job, attempts = retries.pop()
+                else:
+                    job = next(jobs, None)
+                    if job is None:
+                        break
+                    attempts = 0
+                try:
+                    pending[executor.submit(_convert_job, job)] = (job, attempts)
+                except BrokenProcessPool:
+                    retries.append((job, attempts))
+                    executor = _restart_pool(executor, max_workers, pending, retries)
+            
+            if not pending:
+                break
+            
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            pool_broken = False
+            for future in done:
+                job, attempts = pending.pop(future)
+                try:
+                    success, message = future.result()
+                except BrokenProcessPool as e:
+                    # A worker crashed (e.g. out of memory) and took the pool with it.
+                    # Retry once on a fresh pool so the other documents are not lost.
+                    pool_broken = True
+                    if attempts == 0:
+                        retries.append((job, 1))
+                        continue
+                    success, message = False, f"Conversion failed: worker process crashed: {e}"
+                except Exception as e:
+                    success, message = False, f"Conversion failed: {e}"
+                yield job, success, message
+            
+            if pool_broken:
+                executor = _restart_pool(executor, max_workers, pending, retries)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def _restart_pool(executor: ProcessPoolExecutor, max_workers: int, pending: dict, retries: list) -> ProcessPoolExecutor:
+    """
+    Replaces a broken process pool; jobs still pending on it are queued for retry.
+    """
+    for job, attempts in pending.values():
+        retries.append((job, attempts + 1))
+    pending.clear()
+    executor.shutdown(wait=False)
+    return ProcessPoolExecutor(max_workers=max_workers)
+
+# Job keys a Converter session handles; other jobs use convert_docx_to_latex()
+_SESSION_JOB_KEYS = frozenset(['docx_path', 'latex_path'] + [option.name for option in fields(ConversionOptions)])
+# Converter of this worker process, created by its first job
+_job_converter = None
+
+def _convert_job(job: dict) -> tuple[bool, str]:
+    """Process pool entry point for convert_many()."""
+    global _job_converter
+    if not _SESSION_JOB_KEYS.issuperset(job):
+        return convert_docx_to_latex(**job)
+    if _job_converter is None:
+        _job_converter = Converter()
+    options = ConversionOptions(**{key: value for key, value in job.items() if key not in ('docx_path', 'latex_path')})
+    return _job_converter.convert(job['docx_path'], job['latex_path'], options)
+
+def _pandoc_args(
+    generate_toc: bool,
+    latex_template_path: str,
+    overleaf_compatible: bool,
+    preserve_styles: bool,
+    preserve_linebreaks: bool,
+    ast_post_processing: bool = False
+) -> list:
+    """
+    Build the Pandoc command-line options shared by the conversion entry points.
+
+    Media is never extracted by pandoc; see _extract_referenced_media().
+    """
+    extra_args = []
+    
+    # Ensure standalone document (not fragment)
+    extra_args.append("--standalone")
+    
+    # Basic options
+    if generate_toc:
+        extra_args.append("--toc")
+    if latex_template_path and os.path.isfile(latex_template_path):
+        extra_args.append(f"--template={os.path.abspath(latex_template_path)}")
+    elif latex_template_path:
+        pass  # Template not found, Pandoc will handle the error
+
+    # Enhanced features
+    if overleaf_compatible:
+        extra_args.append("--default-image-extension=png")
+    
+    if preserve_styles:
+        extra_args.extend([
+            "--from=docx+styles",
+            "--wrap=preserve",
+            "--columns=72",
+            "--strip-comments"  # Remove comments that might cause highlighting
+        ])
+    
+    if preserve_linebreaks:
+        extra_args.extend([
+            "--preserve-tabs",
+            "--wrap=preserve",
+            # Minimal Lua filter that preserves Word's original line breaks
+            f"--lua-filter={LINEBREAK_FILTER_PATH}"
+        ])
+    
+    if ast_post_processing:
+        extra_args.append(f"--lua-filter={POSTPROCESS_FILTER_PATH}")
+
+    return extra_args
+
+def _extract_referenced_media(latex: str, docx, extract_media_to_path: str, media_optimizer: MediaOptimizer = None) -> str:
+    """
+    Write the images referenced as media/... below extract_media_to_path and
+    point the references at the written files.
+    """
+    matches = list(_MEDIA_REFERENCE_PATTERN.finditer(latex))
+    name_map = extract_media(docx, [match.group(2) for match in matches], extract_media_to_path)
+    if media_optimizer and name_map:
+        renamed = media_optimizer.optimize_directory(extract_media_to_path, _printed_sizes(matches, name_map))
+        name_map = {target: renamed.get(name, name) for target, name in name_map.items()}
+    return _rewrite_media_references(latex, name_map, extract_media_to_path)
+
+_DIMENSION_PATTERN = re.compile(r'\b(width|height)=([0-9]*\.?[0-9]+)(in|cm|mm|pt|bp)\b')
+_INCHES_PER_UNIT = {'in': 1.0, 'cm': 1 / 2.54, 'mm': 1 / 25.4, 'pt': 1 / 72.27, 'bp': 1 / 72}
+
+def _printed_sizes(matches: list, name_map: dict) -> dict:
+    """
+    The printed (width, height) in inches of every image reference, keyed by
+    the written image name; None where the size is not given in absolute units.
+    """
+    sizes = {}
+    for match in matches:
+        dimensions = {
+            name: float(value) * _INCHES_PER_UNIT[unit]
+            for name, value, unit in _DIMENSION_PATTERN.findall(match.group(1))
+        }
+        sizes.setdefault(name_map[match.group(2)], []).append((dimensions.get('width'), dimensions.get('height')))
+    return sizes
+
+def _rewrite_media_references(latex: str, name_map: dict, extract_media_to_path: str = None) -> str:
+    """
+    Point media/... image references at the files named in name_map, below
+    extract_media_to_path if given.
+    """
+    if not name_map:
+        return latex
+    prefix = extract_media_to_path or ''
+    return _MEDIA_REFERENCE_PATTERN.sub(
+        lambda match: match.group(1) + posixpath.join(prefix, name_map[match.group(2)]) + '}',
+        latex
+    )
+
+def _conversion_message(overleaf_compatible: bool, preserve_styles: bool, preserve_linebreaks: bool, packages_dropped: int = None) -> str:
+    """
+    Generate the status message for a successful conversion.
+
+    packages_dropped is the count reported for minimal_preamble, None without it.
+    """
+    enhancements = []
+    if overleaf_compatible:
+        enhancements.append("Overleaf compatibility")
+    if preserve_styles:
+        enhancements.append("style preservation")
+    if preserve_linebreaks:
+        enhancements.append("line break preservation")
+    if packages_dropped is not None:
+        enhancements.append(f"minimal preamble ({packages_dropped} unused packages dropped)")
+    
+    if enhancements:
+        enhancement_msg = f" with {', '.join(enhancements)}"
+    else:
+        enhancement_msg = ""
+        
+    return f"Conversion successful{enhancement_msg}!"
+
+def _packages_dropped(pipeline: 'PostProcessingPipeline', minimal_preamble: bool) -> int:
+    """
+    Number of packages minimal_preamble dropped in the last run of pipeline, or None without it.
+    """
+    if not minimal_preamble:
+        return None
+    stats = pipeline.stats.get('drop_unused_packages')
+    return stats.matches if stats else 0
+
+def _convert_with_pandoc_server(
+    docx_path: str,
+    latex_path: str,
+    generate_toc: bool,
+    extract_media_to_path: str,
+    latex_template_path: str,
+    overleaf_compatible: bool,
+    preserve_styles: bool,
+    preserve_linebreaks: bool,
+    media_optimizer: MediaOptimizer = None
+):
+    """
+    Run the Pandoc step of the conversion on the shared `pandoc server` process.
+
+    Mirrors the command-line options used by the pypandoc path. Raises
+    PandocServerError if the server cannot handle the request.
+    """
+    options = {'standalone': True}
+    if generate_toc:
+        options['table-of-contents'] = True
+    if latex_template_path and os.path.isfile(latex_template_path):
+        # The server takes the template text rather than a path
+        with open(latex_template_path, 'r', encoding='utf-8') as f:
+            options['template'] = f.read()
+    if overleaf_compatible:
+        options['default-image-extension'] = 'png'
+    if preserve_styles:
+        options.update({'wrap': 'preserve', 'columns': 72, 'strip-comments': True})
+    if preserve_linebreaks:
+        options['wrap'] = 'preserve'
+
+    with open(docx_path, 'rb') as f:
+        docx_bytes = f.read()
+
+    latex = get_default_server().convert_docx(
+        docx_bytes,
+        from_format='docx+styles' if preserve_styles else 'docx',
+        options=options,
+        preserve_linebreaks=preserve_linebreaks
+    )
+    if extract_media_to_path:
+        latex = _extract_referenced_media(latex, docx_bytes, extract_media_to_path, media_optimizer)
+
+    with open(latex_path, 'w', encoding='utf-8') as f:
+        f.write(latex)
+
+def _run_pandoc(args: list, input_bytes: bytes, pandoc_path: str = None) -> str:
+    """
+    Run pandoc with input on stdin and return its stdout.
+    """
+    import pypandoc
+    
+    with tempfile.TemporaryDirectory(prefix=PANDOC_WORKDIR_PREFIX) as workdir:
+        process = subprocess.run(
+            [pandoc_path or pypandoc.get_pandoc_path()] + args,
+            input=input_bytes,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=workdir
+        )
+    if process.returncode != 0:
+        raise RuntimeError(f"Pandoc died with exitcode {process.returncode}: {process.stderr.decode('utf-8', 'replace').strip()}")
+    return process.stdout.decode('utf-8')
+
+def _read_docx_ast(docx_bytes: bytes, reader: str, ast_cache_dir: str) -> str:
+    """
+    Return the pandoc JSON AST of a DOCX document.
+
+    The AST is read from ast_cache_dir if it was parsed before with the same
+    reader and pandoc version; otherwise the DOCX reader runs once and its
+    output is stored there gzip-compressed.
+    """
+    import pypandoc
+    
+    key = hashlib.sha256(docx_bytes)
+    key.update(f':{reader}:{pypandoc.get_pandoc_version()}'.encode('utf-8'))
+    ast_path = os.path.join(ast_cache_dir, f'{key.hexdigest()}.json.gz')
+    
+    try:
+        with gzip.open(ast_path, 'rt', encoding='utf-8') as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+    except (OSError, EOFError) as e:
+        print(f"Warning: Discarding damaged cached AST {ast_path}: {e}")
+    
+    ast_json = _run_pandoc([f'--from={reader}', '--to=json'], docx_bytes)
+    
+    # Written under a unique name and renamed, so concurrent readers never see a partial file
+    os.makedirs(ast_cache_dir, exist_ok=True)
+    staging_path = f'{ast_path}.{uuid.uuid4().hex}.tmp'
+    with gzip.open(staging_path, 'wt', encoding='utf-8') as f:
+        f.write(ast_json)
+    os.replace(staging_path, ast_path)
+    return ast_json
+
+def _convert_from_cached_ast(
+    docx_path: str,
+    latex_path: str,
+    generate_toc: bool,
+    extract_media_to_path: str,
+    latex_template_path: str,
+    overleaf_compatible: bool,
+    preserve_styles: bool,
+    preserve_linebreaks: bool,
+    ast_cache_dir: str,
+    media_optimizer: MediaOptimizer = None,
+    ast_post_processing: bool = False
+):
+    """
+    Run the Pandoc step of the conversion from a cached JSON AST.
+
+    Only the LaTeX writer (and the Lua filters) runs per call.
+    """
+    with open(docx_path, 'rb') as f:
+        docx_bytes = f.read()
+    latex = _render_docx_bytes(
+        docx_bytes, generate_toc, latex_template_path, overleaf_compatible,
+        preserve_styles, preserve_linebreaks, ast_cache_dir, ast_post_processing
+    )
+    if extract_media_to_path:
+        latex = _extract_referenced_media(latex, docx_bytes, extract_media_to_path, media_optimizer)
+    
+    with open(latex_path, 'w', encoding='utf-8') as f:
+        f.write(latex)
+
+def _pandoc_writer_args(
+    generate_toc: bool,
+    latex_template_path: str,
+    overleaf_compatible: bool,
+    preserve_styles: bool,
+    preserve_linebreaks: bool,
+    ast_post_processing: bool = False
+) -> list:
+    """
+    The _pandoc_args() options without the reader.
+    """
+    return [
+        arg for arg in _pandoc_args(
+            generate_toc, latex_template_path,
+            overleaf_compatible, preserve_styles, preserve_linebreaks, ast_post_processing
+        )
+        if not arg.startswith('--from=')
+    ]
+
+def _render_docx_bytes(
+    docx_bytes: bytes,
+    generate_toc: bool,
+    latex_template_path: str,
+    overleaf_compatible: bool,
+    preserve_styles: bool,
+    preserve_linebreaks: bool,
+    ast_cache_dir: str = None,
+    ast_post_processing: bool = False,
+    pandoc_path: str = None
+) -> str:
+    """
+    Convert DOCX bytes to LaTeX with pandoc, leaving image paths as media/...
+    """
+    reader = 'docx+styles' if preserve_styles else 'docx'
+    writer_args = _pandoc_writer_args(
+        generate_toc, latex_template_path, overleaf_compatible, preserve_styles, preserve_linebreaks,
+        ast_post_processing
+    )
+    if ast_cache_dir:
+        ast_json = _read_docx_ast(docx_bytes, reader, ast_cache_dir)
+        return _run_pandoc(['--from=json', '--to=latex'] + writer_args, ast_json.encode('utf-8'), pandoc_path)
+    return _run_pandoc([f'--from={reader}', '--to=latex'] + writer_args, docx_bytes, pandoc_path)
+
+def _convert_incrementally(
+    docx_path: str,
+    latex_path: str,
+    generate_toc: bool,
+    extract_media_to_path: str,
+    latex_template_path: str,
+    overleaf_compatible: bool,
+    preserve_styles: bool,
+    preserve_linebreaks: bool,
+    state_path: str,
+    ast_cache_dir: str = None,
+    media_optimizer: MediaOptimizer = None,
+    ast_post_processing: bool = False
+):
+    """
+    Run the Pandoc step of the conversion, rendering only the changed sections.
+
+    The LaTeX of every section is kept in state_path together with the
+    fingerprints from docx_sections. Sections whose fingerprint is unchanged
+    are reused and pandoc only runs on a DOCX holding the changed sections and
+    the context they depend on. Whatever can affect the whole document (front
+    matter, headings, styles, numbering definitions, the LaTeX features the
+    preamble is built for) triggers a full render instead.
+    """
+    import pypandoc
+    
+    with open(docx_path, 'rb') as f:
+        docx_bytes = f.read()
+    render = partial(
+        _render_docx_bytes,
+        generate_toc=generate_toc,
+        latex_template_path=latex_template_path,
+        overleaf_compatible=overleaf_compatible,
+        preserve_styles=preserve_styles,
+        preserve_linebreaks=preserve_linebreaks,
+        ast_post_processing=ast_post_processing
+    )
+    
+    latex = None
+    try:
+        split = split_docx(docx_bytes)
+        if split.sections:
+            options_key = json.dumps([
+                generate_toc, _file_hash(latex_template_path), overleaf_compatible,
+                preserve_styles, preserve_linebreaks, ast_post_processing, pypandoc.get_pandoc_version(),
+                # Sections are stored as rendered through the filters, so a changed filter invalidates them
+                _file_hash(LINEBREAK_FILTER_PATH), _file_hash(POSTPROCESS_FILTER_PATH)
+            ])
+            latex = _render_sections(docx_bytes, split, render, state_path, options_key, ast_cache_dir)
+    except ValueError as e:
+        print(f"Warning: Incremental conversion unavailable, converting the whole document: {e}")
+    if latex is None:
+        latex = render(docx_bytes, ast_cache_dir=ast_cache_dir)
+    
+    if extract_media_to_path:
+        latex = _extract_referenced_media(latex, docx_bytes, extract_media_to_path, media_optimizer)
+    
+    with open(latex_path, 'w', encoding='utf-8') as f:
+        f.write(latex)
+
+def _render_sections(docx_bytes: bytes, split, render: Callable, state_path: str, options_key: str, ast_cache_dir: str) -> str:
+    """
+    Assemble the document from stored and newly rendered sections.
+
+    Raises ValueError if pandoc's output cannot be cut at the section markers.
+    """
+    marker = document_marker(docx_bytes)
+    fingerprints = [section.fingerprint for section in split.sections]
+    state = _load_incremental_state(state_path)
+    record = state.pop(options_key, None)
+    
+    sections = None
+    if record and record['global'] == split.global_fingerprint and len(record['sections']) == len(fingerprints):
+        sections = record['sections']
+        changed = [index for index, fingerprint in enumerate(fingerprints) if fingerprint != sections[index][0]]
+        if changed:
+            rendered = render(build_marked_docx(docx_bytes, split, marker, changed))
+            _, fragments, _ = _cut_sections(rendered, marker, changed)
+            for index in changed:
+                sections[index] = [fingerprints[index], fragments[index], _latex_features(fragments[index])]
+            features = sorted(set().union(*(section[2] for section in sections)))
+            if features != record['features']:
+                # The preamble pandoc writes depends on the features in use
+                sections = None
+    
+    if sections is None:
+        rendered = render(build_marked_docx(docx_bytes, split, marker), ast_cache_dir=ast_cache_dir)
+        head, fragments, tail = _cut_sections(rendered, marker, range(len(fingerprints)), full=True)
+        sections = [
+            [fingerprint, fragments[index], _latex_features(fragments[index])]
+            for index, fingerprint in enumerate(fingerprints)
+        ]
+        record = {
+            'global': split.global_fingerprint,
+            'head': head,
+            'tail': tail,
+            'sections': sections,
+            'features': sorted(set().union(*(section[2] for section in sections))),
+        }
+    
+    # Most recently used option sets last
+    state[options_key] = record
+    while len(state) > INCREMENTAL_RECORDS_PER_DOCUMENT:
+        state.pop(next(iter(state)))
+    _save_incremental_state(state_path, state)
+    
+    return record['head'] + '\n\n'.join(section[1] for section in sections) + record['tail']
+
+def _cut_sections(latex: str, marker: str, indexes, full: bool = False) -> tuple:
+    """
+    Cut pandoc's output of a marked DOCX into (head, {index: LaTeX}, tail).
+
+    Each start marker is removed with the blank line after it and each end
+    marker with the blank line before it. With full=True consecutive sections
+    must be separated by nothing but their markers, so that head, the sections
+    joined by blank lines and tail add up to the output without markers.
+    """
+    indexes = list(indexes)
+    positions = {}
+    for match in re.finditer(re.escape(marker) + r'[SE]\d+', latex):
+        if match.group(0) in positions:
+            raise ValueError("Section marker appears more than once in the output")
+        positions[match.group(0)] = match
+    expected = {section_marker(marker, index, end) for index in indexes for end in (False, True)}
+    if set(positions) != expected:
+        raise ValueError("Section markers are missing from the output")
+    
+    def start_of(index: int) -> tuple:
+        match = positions[section_marker(marker, index)]
+        if latex[match.start() - 1:match.start()] != '\n' or latex[match.end():match.end() + 2] != '\n\n':
+            raise ValueError("Section marker is not a paragraph of its own")
+        return match.start(), match.end() + 2
+    
+    def end_of(index: int) -> tuple:
+        match = positions[section_marker(marker, index, end=True)]
+        if latex[match.start() - 2:match.start()] != '\n\n' or latex[match.end():match.end() + 1] != '\n':
+            raise ValueError("Section marker is not a paragraph of its own")
+        return match.start() - 2, match.end()
+    
+    fragments = {}
+    for position, index in enumerate(indexes):
+        start, end = start_of(index)[1], end_of(index)[0]
+        if end <= start:
+            raise ValueError("Section rendered as empty output")
+        fragments[index] = latex[start:end]
+        if full and position + 1 < len(indexes) and latex[end_of(index)[1]:start_of(indexes[position + 1])[0]] != '\n\n':
+            raise ValueError("Unexpected output between sections")
+    
+    return latex[:start_of(indexes[0])[0]], fragments, latex[end_of(indexes[-1])[1]:]
+
+def _render_in_parallel(docx_bytes: bytes, render: Callable, workers: int) -> str:
+    """
+    Convert a DOCX with up to workers pandoc processes, one per part of its sections.
+
+    The sections (from one heading to the next) are divided into consecutive
+    parts of about equal size. Each part is rendered from a DOCX holding it
+    and the context it depends on (see build_marked_docx()): the headings of
+    the whole document, so identifiers, numbering and the table of contents
+    come out the same, the list items its lists continue from and the links
+    to its bookmarks. The first part also keeps the front matter, and its
+    output before the first section is the head of the document.
+
+    The preamble pandoc writes depends on the LaTeX features in use. If the
+    other parts use features the first one does not, the head is rendered
+    once more from the front matter and the sections that use them. Documents
+    that cannot be cut at their sections are converted whole.
+    """
+    try:
+        split = split_docx(docx_bytes)
+        if len(split.sections) < 2:
+            return render(docx_bytes)
+        marker = document_marker(docx_bytes)
+        parts = _partition_sections(split, workers)
+        
+        def render_part(indexes: list, keep_front: bool = False) -> tuple:
+            rendered = render(build_marked_docx(docx_bytes, split, marker, indexes, keep_front=keep_front))
+            return rendered, _cut_sections(rendered, marker, indexes)
+        
+        with ThreadPoolExecutor(max_workers=len(parts)) as executor:
+            futures = [executor.submit(render_part, indexes, position == 0) for position, indexes in enumerate(parts)]
+            results = [future.result() for future in futures]
+        
+        first, (head, _, _) = results[0]
+        tail = results[-1][1][2]
+        fragments = {}
+        for _, (_, part_fragments, _) in results:
+            fragments.update(part_fragments)
+        features = {index: set(_latex_features(fragment)) for index, fragment in fragments.items()}
+        head_features = set(_latex_features(_document_body(head)))
+        needed = head_features.union(*features.values())
+        if not needed.issubset(_latex_features(_document_body(first))):
+            # Few sections use features the first part does not, so this render is small
+            cover = [0]
+            missing = needed - head_features - features[0]
+            while missing:
+                index = max(features, key=lambda index: len(features[index] & missing))
+                cover.append(index)
+                missing -= features[index]
+            rendered, (head, _, _) = render_part(sorted(cover), keep_front=True)
+            if not needed.issubset(_latex_features(_document_body(rendered))):
+                raise ValueError("No render covers the LaTeX features of the document")
+        return head + '\n\n'.join(fragments[index] for index in range(len(split.sections))) + tail
+    except ValueError as e:
+        print(f"Warning: Section-parallel conversion unavailable, converting the whole document: {e}")
+        return render(docx_bytes)
+
+def _partition_sections(split, parts: int) -> list:
+    """
+    Divide the section indexes into up to parts consecutive runs of about
+    equal size; the front matter counts towards the first run.
+    """
+    sizes = [sum(len(block.xml) for block in section.blocks) for section in split.sections]
+    done = sum(len(block.xml) for block in split.front)
+    total = done + sum(sizes)
+    runs = [[]]
+    for index, size in enumerate(sizes):
+        if runs[-1] and done >= total * len(runs) / parts:
+            runs.append([])
+        runs[-1].append(index)
+        done += size
+    return runs
+
+def _document_body(latex: str) -> str:
+    """
+    The part of pandoc's output from \\begin{document} on.
+    """
+    start = latex.find('\\begin{document}')
+    if start < 0:
+        raise ValueError("Output has no \\begin{document}")
+    return latex[start:]
+
+_LATEX_COMMAND_PATTERN = re.compile(r'\\(?:begin\{([^}]*)\}|([A-Za-z@]+))')
+_LATEX_LANGUAGE_PATTERN = re.compile(r'\\(?:foreignlanguage|begin\{otherlanguage\*?\})(?:\[[^\]]*\])?\{([^}]*)\}')
+
+def _latex_features(latex: str) -> list:
+    """
+    Commands, environments and languages used in a LaTeX fragment.
+    """
+    features = {
+        'begin:' + match.group(1) if match.group(1) is not None else match.group(2)
+        for match in _LATEX_COMMAND_PATTERN.finditer(latex)
+    }
+    features.update('language:' + language for language in _LATEX_LANGUAGE_PATTERN.findall(latex))
+    return sorted(features)
+
+def _file_hash(path: str) -> str:
+    if not path or not os.path.isfile(path):
+        return path
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def _load_incremental_state(state_path: str) -> dict:
+    try:
+        with gzip.open(state_path, 'rt', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, EOFError, ValueError) as e:
+        print(f"Warning: Discarding damaged incremental conversion state {state_path}: {e}")
+        return {}
+
+def _save_incremental_state(state_path: str, state: dict):
+    directory = os.path.dirname(os.path.abspath(state_path))
+    os.makedirs(directory, exist_ok=True)
+    staging_path = f'{state_path}.{uuid.uuid4().hex}.tmp'
+    with gzip.open(staging_path, 'wt', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(staging_path, state_path)
+
+def _apply_post_processing(latex_path: str, overleaf_compatible: bool, preserve_styles: bool, preserve_linebreaks: bool, extract_media_to_path: str = None, streaming: bool = None, workers: int = 1, pipeline: 'PostProcessingPipeline' = None, minimal_preamble: bool = False, ast_post_processing: bool = False):
+    """
+    Apply post-processing enhancements to the generated LaTeX file.
+
+    With streaming=True the file is processed in bounded memory by
+    _stream_post_processing(); by default that happens for files of at least
+    STREAMING_THRESHOLD_BYTES. With workers > 1 the body chunks are processed
+    in parallel, which always uses the chunked path.
+    """
+    try:
+        if workers > 1:
+            _stream_post_processing(
+                latex_path, overleaf_compatible, preserve_styles, preserve_linebreaks, extract_media_to_path,
+                chunk_size=PARALLEL_CHUNK_SIZE, workers=workers, pipeline=pipeline, minimal_preamble=minimal_preamble,
+                ast_post_processing=ast_post_processing
+            )
+            return
+        if streaming is None:
+            streaming = os.path.getsize(latex_path) >= STREAMING_THRESHOLD_BYTES
+        if streaming:
+            _stream_post_processing(latex_path, overleaf_compatible, preserve_styles, preserve_linebreaks, extract_media_to_path, pipeline=pipeline, minimal_preamble=minimal_preamble, ast_post_processing=ast_post_processing)
+            return
+        
+        with open(latex_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        
+        content = _post_process(content, overleaf_compatible, preserve_styles, preserve_linebreaks, extract_media_to_path, pipeline, minimal_preamble, ast_post_processing)
+        
+        # Write back the processed content
+        with open(latex_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+            
+    except Exception as e:
+        # Post-processing failures shouldn't break the conversion
+        print(f"Warning: Post-processing failed: {e}")
+
+def _post_process(content: str, overleaf_compatible: bool, preserve_styles: bool, preserve_linebreaks: bool, extract_media_to_path: str = None, pipeline: 'PostProcessingPipeline' = None, minimal_preamble: bool = False, ast_post_processing: bool = False) -> str:
+    """
+    Apply post-processing enhancements to LaTeX content in memory.
+
+    Runs the passes in POST_PROCESSING_PASSES; pass a PostProcessingPipeline
+    to disable passes or to read the per-pass statistics afterwards.
+    """
+    if pipeline is None:
+        pipeline = PostProcessingPipeline()
+    options = ConversionOptions(
+        overleaf_compatible=overleaf_compatible,
+        preserve_styles=preserve_styles,
+        preserve_linebreaks=preserve_linebreaks,
+        extract_media_to_path=extract_media_to_path,
+        minimal_preamble=minimal_preamble,
+        ast_post_processing=ast_post_processing
+    )
+    return pipeline.run(content, options)
+
+def _first_argument(line: str) -> str:
+    r"""
+    Extract the first argument of a command line, e.g. the package name from a \usepackage line.
+    """
+    return line.split('{')[1].split('}')[0]
+
+def _apply_preamble_pass(preamble_pass: Callable, content: str, tokens: tuple = ()) -> str:
+    """
+    Run a preamble pass on a whole document, outside of a PostProcessingPipeline.
+    """
+    preamble, body = split_document(content)
+    body_tokens = set()
+    _collect_tokens(body, tokens, body_tokens)
+    return preamble_pass(preamble, None, body_tokens)[0].text + body
+
+# Core packages that Pandoc might not include but are often needed
+_COMPILATION_PACKAGES = [
+    r'\usepackage[utf8]{inputenc}',  # UTF-8 input encoding
+    r'\usepackage[T1]{fontenc}',     # Font encoding
+    r'\usepackage{graphicx}',        # For images
+    r'\usepackage{longtable}',       # For tables
+    r'\usepackage{booktabs}',        # Better table formatting
+    r'\usepackage{hyperref}',        # For links (if not already included)
+    r'\usepackage{amsmath}',         # Mathematical formatting
+    r'\usepackage{amssymb}',         # Mathematical symbols
+    r'\usepackage{textcomp}',        # Additional text symbols
+]
+
+# Unicode character definitions to handle any remaining problematic characters
+_UNICODE_DEFINITIONS = [
+    r'\DeclareUnicodeCharacter{2003}{ }  % Em space',
+    r'\DeclareUnicodeCharacter{2002}{ }  % En space',
+    r'\DeclareUnicodeCharacter{2009}{ }  % Thin space',
+    r'\DeclareUnicodeCharacter{200A}{ }  % Hair space',
+    r'\DeclareUnicodeCharacter{2004}{ }  % Three-per-em space',
+    r'\DeclareUnicodeCharacter{2005}{ }  % Four-per-em space',
+    r'\DeclareUnicodeCharacter{2006}{ }  % Six-per-em space',
+    r'\DeclareUnicodeCharacter{2008}{ }  % Punctuation space',
+    r'\DeclareUnicodeCharacter{202F}{ }  % Narrow no-break space',
+    r'\DeclareUnicodeCharacter{2212}{-}  % Unicode minus sign',
+    r'\DeclareUnicodeCharacter{2010}{-}  % Hyphen',
+    r'\DeclareUnicodeCharacter{2011}{-}  % Non-breaking hyphen',
+    r'\DeclareUnicodeCharacter{2013}{--} % En dash',
+    r'\DeclareUnicodeCharacter{2014}{---}% Em dash',
+]
+
+def _inject_essential_packages(content: str) -> str:
+    """
+    Inject essential packages that are always needed for compilation.
+    """
+    return _apply_preamble_pass(_essential_packages_pass, content)
+
+def _essential_packages_pass(preamble: Preamble, options: 'ConversionOptions', body_tokens: set) -> tuple[Preamble, int]:
+    """
+    Pipeline pass behind _inject_essential_packages().
+
+    Adds the _COMPILATION_PACKAGES the preamble does not load and the
+    _UNICODE_DEFINITIONS it does not declare.
+    """
+    inserted = 0
+    insert_pos = preamble.documentclass_end()
+    
+    if insert_pos >= 0:
+        packages_to_insert = [package for package in _COMPILATION_PACKAGES if not preamble.loads(_first_argument(package))]
+        
+        if packages_to_insert:
+            preamble.insert_block(insert_pos, '% Essential packages for compilation', packages_to_insert)
+            inserted += len(packages_to_insert)
+        
+        # Insert Unicode definitions after packages but before \begin{document}
+        definitions = [definition for definition in _UNICODE_DEFINITIONS if not preamble.declares(_first_argument(definition))]
+        if preamble.complete and definitions:
+            preamble.insert_block(len(preamble), '% Unicode character definitions for LaTeX compatibility', definitions, '\n')
+            inserted += 1
+    
+    return preamble, inserted
+
+# Unicode characters and their LaTeX equivalents
+_UNICODE_TO_LATEX = {
+    # Mathematical operators
+    'Δ': r'$\Delta$',           # U+0394 - Greek capital letter delta
+    'δ': r'$\delta$',           # U+03B4 - Greek small letter delta
+    '∑': r'$\sum$',             # U+2211 - N-ary summation
+    '∏': r'$\prod$',            # U+220F - N-ary product
+    '∫': r'$\int$',             # U+222B - Integral
+    '∂': r'$\partial$',         # U+2202 - Partial differential
+    '∇': r'$\nabla$',           # U+2207 - Nabla
+    '√': r'$\sqrt{}$',          # U+221A - Square root
+    '∞': r'$\infty$',           # U+221E - Infinity
+    
+    # Relations and equality
+    '≈': r'$\approx$',          # U+2248 - Almost equal to
+    '≠': r'$\neq$',             # U+2260 - Not equal to
+    '≤': r'$\leq$',             # U+2264 - Less-than or equal to
+    '≥': r'$\geq$',             # U+2265 - Greater-than or equal to
+    '±': r'$\pm$',              # U+00B1 - Plus-minus sign
+    '∓': r'$\mp$',              # U+2213 - Minus-or-plus sign
+    '×': r'$\times$',           # U+00D7 - Multiplication sign
+    '÷': r'$\div$',             # U+00F7 - Division sign
+    '⋅': r'$\cdot$',            # U+22C5 - Dot operator
+    
+    # Set theory and logic
+    '∈': r'$\in$',              # U+2208 - Element of
+    '∉': r'$\notin$',           # U+2209 - Not an element of
+    '⊂': r'$\subset$',          # U+2282 - Subset of
+    '⊃': r'$\supset$',          # U+2283 - Superset of
+    '⊆': r'$\subseteq$',        # U+2286 - Subset of or equal to
+    '⊇': r'$\supseteq$',        # U+2287 - Superset of or equal to
+    '∪': r'$\cup$',             # U+222A - Union
+    '∩': r'$\cap$',             # U+2229 - Intersection
+    '∅': r'$\emptyset$',        # U+2205 - Empty set
+    '∀': r'$\forall$',          # U+2200 - For all
+    '∃': r'$\exists$',          # U+2203 - There exists
+    
+    # Special symbols
+    '∣': r'$|$',                # U+2223 - Divides
+    '∥': r'$\parallel$',        # U+2225 - Parallel to
+    '⊥': r'$\perp$',            # U+22A5 - Up tack (perpendicular)
+    '∠': r'$\angle$',           # U+2220 - Angle
+    '°': r'$^\circ$',           # U+00B0 - Degree sign
+    
+    # Arrows
+    '→': r'$\rightarrow$',      # U+2192 - Rightwards arrow
+    '←': r'$\leftarrow$',       # U+2190 - Leftwards arrow
+    '↔': r'$\leftrightarrow$',  # U+2194 - Left right arrow
+    '⇒': r'$\Rightarrow$',      # U+21D2 - Rightwards double arrow
+    '⇐': r'$\Leftarrow$',       # U+21D0 - Leftwards double arrow
+    '⇔': r'$\Leftrightarrow$',  # U+21D4 - Left right double arrow
+    
+    # Accents and diacritics
+    'ˉ': r'$\bar{}$',           # U+02C9 - Modifier letter macron
+    'ˆ': r'$\hat{}$',           # U+02C6 - Modifier letter circumflex accent
+    'ˇ': r'$\check{}$',         # U+02C7 - Caron
+    '˜': r'$\tilde{}$',         # U+02DC - Small tilde
+    '˙': r'$\dot{}$',           # U+02D9 - Dot above
+    '¨': r'$\ddot{}$',          # U+00A8 - Diaeresis
+    
+    # Special minus and spaces - using explicit Unicode escape sequences
+    '−': r'-',                  # U+2212 - Minus sign (convert to regular hyphen)
+    '\u2003': r' ',             # U+2003 - Em space (convert to regular space)
+    '\u2009': r' ',             # U+2009 - Thin space (convert to regular space)
+    '\u2002': r' ',             # U+2002 - En space (convert to regular space)
+    '\u2004': r' ',             # U+2004 - Three-per-em space
+    '\u2005': r' ',             # U+2005 - Four-per-em space
+    '\u2006': r' ',             # U+2006 - Six-per-em space
+    '\u2008': r' ',             # U+2008 - Punctuation space
+    '\u200A': r' ',             # U+200A - Hair space
+    '\u202F': r' ',             # U+202F - Narrow no-break space
+    
+    # Greek letters (commonly used in math)
+    'α': r'$\alpha$',           # U+03B1
+    'β': r'$\beta$',            # U+03B2
+    'γ': r'$\gamma$',           # U+03B3
+    'Γ': r'$\Gamma$',           # U+0393
+    'ε': r'$\varepsilon$',      # U+03B5
+    'ζ': r'$\zeta$',            # U+03B6
+    'η': r'$\eta$',             # U+03B7
+    'θ': r'$\theta$',           # U+03B8
+    'Θ': r'$\Theta$',           # U+0398
+    'ι': r'$\iota$',            # U+03B9
+    'κ': r'$\kappa$',           # U+03BA
+    'λ': r'$\lambda$',          # U+03BB
+    'Λ': r'$\Lambda$',          # U+039B
+    'μ': r'$\mu$',              # U+03BC
+    'ν': r'$\nu$',              # U+03BD
+    'ξ': r'$\xi$',              # U+03BE
+    'Ξ': r'$\Xi$',              # U+039E
+    'π': r'$\pi$',              # U+03C0
+    'Π': r'$\Pi$',              # U+03A0
+    'ρ': r'$\rho$',             # U+03C1
+    'σ': r'$\sigma$',           # U+03C3
+    'Σ': r'$\Sigma$',           # U+03A3
+    'τ': r'$\tau$',             # U+03C4
+    'υ': r'$\upsilon$',         # U+03C5
+    'Υ': r'$\Upsilon$',         # U+03A5
+    'φ': r'$\varphi$',          # U+03C6
+    'Φ': r'$\Phi$',             # U+03A6
+    'χ': r'$\chi$',             # U+03C7
+    'ψ': r'$\psi$',             # U+03C8
+    'Ψ': r'$\Psi$',             # U+03A8
+    'ω': r'$\omega$',           # U+03C9
+    'Ω': r'$\Omega$',           # U+03A9
+}
+
+# Further problematic Unicode spaces and dashes
+_UNICODE_SPACES = [
+    '\u00A0',  # Non-breaking space
+    '\u1680',  # Ogham space mark
+    '\u2000',  # En quad
+    '\u2001',  # Em quad
+    '\u2002',  # En space
+    '\u2003',  # Em space
+    '\u2004',  # Three-per-em space
+    '\u2005',  # Four-per-em space
+    '\u2006',  # Six-per-em space
+    '\u2007',  # Figure space
+    '\u2008',  # Punctuation space
+    '\u2009',  # Thin space
+    '\u200A',  # Hair space
+    '\u200B',  # Zero width space
+    '\u202F',  # Narrow no-break space
+    '\u205F',  # Medium mathematical space
+    '\u3000',  # Ideographic space
+]
+
+_UNICODE_DASHES = [
+    '\u2010',  # Hyphen
+    '\u2011',  # Non-breaking hyphen
+    '\u2012',  # Figure dash
+    '\u2013',  # En dash
+    '\u2014',  # Em dash
+    '\u2015',  # Horizontal bar
+    '\u2212',  # Minus sign
+]
+
+def _build_unicode_replacements() -> dict:
+    """
+    Merge the Unicode tables into a single character -> replacement mapping.
+
+    Earlier entries win, so the result is the same as applying the dictionary,
+    the space/dash ranges and the cleanup lists one after another.
+    """
+    replacements = dict(_UNICODE_TO_LATEX)
+    
+    # All Unicode spaces
+    for code in list(range(0x2000, 0x2010)) + list(range(0x2028, 0x2030)) + [0x205F, 0x3000]:
+        replacements.setdefault(chr(code), ' ')
+    
+    # Various Unicode dashes and the minus sign
+    for code in list(range(0x2010, 0x2016)) + [0x2212]:
+        replacements.setdefault(chr(code), '-')
+    
+    # Spaces outside the ranges above (non-breaking space, Ogham space mark)
+    for unicode_space in _UNICODE_SPACES:
+        replacements.setdefault(unicode_space, ' ')
+    
+    # En and em dashes are already mapped to '-' by the range above
+    for unicode_dash in _UNICODE_DASHES:
+        replacements.setdefault(unicode_dash, '--' if unicode_dash in ['\u2013', '\u2014'] else '-')
+    
+    return replacements
+
+# Built once at import; a single alternation scan is much faster than one
+# str.replace per character (and than str.translate on non-ASCII text).
+_UNICODE_REPLACEMENTS = _build_unicode_replacements()
+_UNICODE_PATTERN = re.compile('[' + ''.join(re.escape(char) for char in _UNICODE_REPLACEMENTS) + ']')
+
+# Replacements that are math, without their $ delimiters
+_UNICODE_MATH = {char: replacement[1:-1] for char, replacement in _UNICODE_REPLACEMENTS.items() if replacement.startswith('$')}
+_MACRON = 'ˉ'
+_ASCII_LETTERS = frozenset('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ')
+
+def _convert_unicode_math_characters(content: str) -> str:
+    """
+    Convert Unicode mathematical characters, spaces and dashes to their LaTeX
+    equivalents in a single pass over the document.
+    """
+    return _unicode_pass(content, None, frozenset())[0]
+
+def _unicode_pass(content: str, options: 'ConversionOptions', body_tokens: set) -> tuple[str, int]:
+    """
+    Pipeline pass behind _convert_unicode_math_characters().
+    """
+    return _visitor_pass(_UNICODE_VISITOR, content, options, body_tokens)
+
+def _visit_unicode_character(document: TokenDocument, token: Token, options: 'ConversionOptions') -> int:
+    """
+    Replace one Unicode character (see _UNICODE_VISITOR).
+
+    Inside math, math symbols become the bare command. In text they are put
+    in $...$, and a run of adjacent symbols shares one pair of dollars
+    instead of producing $$ between them. A macron (ˉ) next to a letter
+    becomes a bar over that letter: the letter after it if there is one,
+    otherwise the letter before it.
+    """
+    text = document.text
+    start, end = token.start, token.end
+    command = _UNICODE_MATH.get(token.name)
+    if command is None:
+        document.replace(start, end, _UNICODE_REPLACEMENTS[token.name])
+        return 1
+    
+    if token.name == _MACRON:
+        if text[end:end + 1] in _ASCII_LETTERS:
+            command = '\\bar{' + text[end] + '}'
+            end += 1
+        elif start and text[start - 1] in _ASCII_LETTERS and text[start - 2:start - 1] != _MACRON:
+            command = '\\bar{' + text[start - 1] + '}'
+            start -= 1
+    
+    if token.math:
+        # Keep a command name from running into a letter that follows it
+        if command[-1].isalpha() and text[end:end + 1].isalpha():
+            command += ' '
+        document.replace(start, end, command)
+        return 1
+    
+    # Open math unless the symbol before this one left it open, and close it
+    # unless the symbol after this one continues it. Symbols that took a
+    # letter for a bar neither continue nor are continued.
+    before, after = text[start - 1:start], text[end:end + 1]
+    if not (start == token.start and before in _UNICODE_MATH):
+        # "{}" keeps the dollar from joining one that closes math before it into $$
+        closes_before = before == '$' or before in _UNICODE_MATH or (before in _ASCII_LETTERS and text[start - 2:start - 1] == _MACRON)
+        command = ('{}$' if closes_before else '$') + command
+    if not (end == token.end and after in _UNICODE_MATH):
+        command += '${}' if after == '$' else '$'
+    document.replace(start, end, command)
+    return 1
+
+# Converts every character of _UNICODE_REPLACEMENTS, knowing whether it is in math
+_UNICODE_VISITOR = TokenVisitor(_visit_unicode_character, characters=''.join(_UNICODE_REPLACEMENTS))
+
+# Duplicated math: for some equations Pandoc emits a plain-text rendering of the
+# formula (e.g. "Tmed=median{RRk}") directly before its LaTeX version. Both are
+# normalized to a sequence of symbols (whitespace dropped; LaTeX markup such as
+# "_", "^", groups and \mathrm removed; \Delta and ∆ both mapped to Δ; \bar h as
+# h¯, the way Word writes it) and a plain-text run whose symbols are a prefix of
+# the LaTeX that follows is deleted.
+#
+# The scan visits every LaTeX math token once. The plain text considered for each
+# is the text since the previous one, and the LaTeX normalized for it is at most
+# that long, so the detector runs in linear time.
+
+# LaTeX tokens a math expression can start at: math delimiters, control sequences,
+# sub- and superscripts
+_MATH_SYNTAX_PATTERN = re.compile(r'\\[A-Za-z]+|\\.|\$\$?|[_^]', re.DOTALL)
+_MATH_TOKEN_PATTERN = re.compile(r'\\[A-Za-z]+|\\.|\$\$?|\s+|.', re.DOTALL)
+_MATH_OPENERS = {'\\(': '\\)', '\\[': '\\]', '$': '$', '$$': '$$'}
+
+# A fallback is a formula: it has a relation, is not a word or two, and is part of one paragraph
+_MATH_RELATIONS = '=<>≤≥≠≈≡∈∉⊂⊆⊃⊇∼≅→⇒⇔↔'
+_MATH_RELATION_PATTERN = re.compile(f'[{_MATH_RELATIONS}]')
+_MATH_FALLBACK_MIN_SYMBOLS = 4
+_MATH_FALLBACK_MAX_CHARS = 400
+
+# Letters in front of "_" or "^" that may belong to the subscripted name (e.g. RR_k)
+_MATH_BASE_MAX_CHARS = 4
+
+# Symbols after which a match would cut an expression short (x=1 in x=1+y)
+_MATH_CONTINUATIONS = '+-*/=<>'
+
+# Characters written differently in plain text and LaTeX output
+_MATH_SYMBOL_EQUIVALENTS = {'∆': 'Δ', '−': '-', '·': '⋅', '∙': '⋅', 'ˉ': '¯', '\u0304': '¯'}
+
+_MATH_COMMAND_SYMBOLS = {
+    'alpha': 'α', 'beta': 'β', 'gamma': 'γ', 'delta': 'δ', 'epsilon': 'ϵ', 'varepsilon': 'ε',
+    'zeta': 'ζ', 'eta': 'η', 'theta': 'θ', 'vartheta': 'ϑ', 'iota': 'ι', 'kappa': 'κ',
+    'lambda': 'λ', 'mu': 'μ', 'nu': 'ν', 'xi': 'ξ', 'pi': 'π', 'rho': 'ρ', 'sigma': 'σ',
+    'tau': 'τ', 'upsilon': 'υ', 'phi': 'ϕ', 'varphi': 'φ', 'chi': 'χ', 'psi': 'ψ', 'omega': 'ω',
+    'Gamma': 'Γ', 'Delta': 'Δ', 'Theta': 'Θ', 'Lambda': 'Λ', 'Xi': 'Ξ', 'Pi': 'Π',
+    'Sigma': 'Σ', 'Upsilon': 'Υ', 'Phi': 'Φ', 'Psi': 'Ψ', 'Omega': 'Ω',
+    'sum': '∑', 'prod': '∏', 'int': '∫', 'oint': '∮', 'sqrt': '√', 'partial': '∂', 'nabla': '∇',
+    'infty': '∞', 'in': '∈', 'notin': '∉', 'subset': '⊂', 'subseteq': '⊆', 'supset': '⊃',
+    'supseteq': '⊇', 'cup': '∪', 'cap': '∩', 'emptyset': '∅', 'forall': '∀', 'exists': '∃',
+    'leq': '≤', 'le': '≤', 'geq': '≥', 'ge': '≥', 'neq': '≠', 'ne': '≠', 'approx': '≈',
+    'equiv': '≡', 'sim': '∼', 'cong': '≅', 'pm': '±', 'mp': '∓', 'times': '×', 'div': '÷',
+    'cdot': '⋅', 'ast': '∗', 'to': '→', 'rightarrow': '→', 'leftarrow': '←', 'Rightarrow': '⇒',
+    'Leftrightarrow': '⇔', 'leftrightarrow': '↔', 'mid': '|', 'vert': '|', 'lbrace': '{',
+    'rbrace': '}', 'langle': '⟨', 'rangle': '⟩', 'ldots': '…', 'dots': '…', 'cdots': '⋯',
+}
+_MATH_ACCENTS = {
+    'bar': '¯', 'overline': '¯', 'hat': '\u0302', 'widehat': '\u0302', 'tilde': '\u0303',
+    'widetilde': '\u0303', 'dot': '\u0307', 'ddot': '\u0308', 'vec': '\u20d7',
+}
+# Spelled out in plain text
+_MATH_FUNCTION_NAMES = frozenset([
+    'sin', 'cos', 'tan', 'cot', 'sec', 'csc', 'arcsin', 'arccos', 'arctan', 'sinh', 'cosh',
+    'tanh', 'log', 'ln', 'exp', 'lim', 'max', 'min', 'sup', 'inf', 'arg', 'det', 'dim', 'gcd', 'Pr',
+])
+# Markup with no plain-text counterpart; their arguments are kept
+_MATH_TRANSPARENT_COMMANDS = frozenset([
+    'mathrm', 'mathit', 'mathbf', 'mathsf', 'mathtt', 'mathcal', 'mathbb', 'mathfrak', 'boldsymbol',
+    'text', 'textrm', 'textit', 'textbf', 'operatorname', 'frac', 'dfrac', 'tfrac', 'left', 'right',
+    'big', 'Big', 'bigg', 'Bigg', 'displaystyle', 'limits', 'nolimits', 'quad', 'qquad',
+])
+_MATH_SPACING = frozenset([',', ';', ':', '!', ' '])
+_MATH_ESCAPES = {'{': '{', '}': '}', '[': '[', ']': ']', '_': '_', '%': '%', '&': '&', '#': '#', '$': '$'}
+
+def _math_symbols(content: str, pos: int, limit: int, closing: str = None) -> tuple:
+    """
+    Normalize the LaTeX math starting at pos into at most limit symbols.
+    
+    Returns:
+        A tuple (symbols, depths, joined, ended): the group depth each symbol
+        was written at, whether it directly follows the previous one (no space
+        or markup in between), and whether the expression ended before the
+        limit was reached (at closing, if given).
+    """
+    symbols, depths, joined = [], [], []
+    depth = 0
+    separated = True
+    # Accents are written after their argument: a single token or a group
+    accent, group_accents = None, []
+    
+    def emit(symbol: str):
+        nonlocal accent, separated
+        symbols.append(symbol)
+        depths.append(depth)
+        joined.append(not separated)
+        separated = False
+        if accent:
+            symbols.append(accent)
+            depths.append(depth)
+            joined.append(True)
+            accent = None
+    
+    # Control sequences are the longest tokens that produce no symbol
+    end = min(len(content), pos + 16 * (limit + 1))
+    for match in _MATH_TOKEN_PATTERN.finditer(content, pos, end):
+        if len(symbols) >= limit:
+            return symbols, depths, joined, False
+        token = match.group()
+        if len(token) > 1 or token in '}~' or token.isspace():
+            # Commands, closed groups and spaces separate the symbols around them;
+            # sub- and superscripts are joined to their base
+            separated = True
+        if token == closing:
+            return symbols, depths, joined, True
+        if token[0] == '\\':
+            name = token[1:]
+            if name in _MATH_COMMAND_SYMBOLS:
+                emit(_MATH_COMMAND_SYMBOLS[name])
+            elif name in _MATH_ACCENTS:
+                accent = _MATH_ACCENTS[name]
+            elif name in _MATH_FUNCTION_NAMES:
+                for letter in name:
+                    emit(letter)
+            elif name in _MATH_ESCAPES:
+                emit(_MATH_ESCAPES[name])
+            elif name == '\\' or name in ('(', ')'):
+                # A line break, or math starting or ending in undelimited LaTeX
+                break
+            elif name not in _MATH_TRANSPARENT_COMMANDS and name not in _MATH_SPACING:
+                emit(token)
+        elif token == '{':
+            if accent:
+                group_accents.append((accent, depth))
+                accent = None
+            depth += 1
+        elif token == '}':
+            if not depth:
+                break
+            depth -= 1
+            if group_accents and group_accents[-1][1] == depth:
+                symbols.append(group_accents.pop()[0])
+                depths.append(depth)
+                joined.append(True)
+        elif token[0] == '$' or token.count('\n') > 1:
+            break
+        elif not token.isspace() and token not in '_^~':
+            emit(_MATH_SYMBOL_EQUIVALENTS.get(token, token))
+    else:
+        if end < len(content):
+            return symbols, depths, joined, False
+    # Ended without the closing delimiter only if none was expected
+    return symbols, depths, joined, closing is None
+
+def _plain_symbols(content: str, start: int, end: int) -> tuple:
+    """
+    Normalize the plain text content[start:end] into (symbols, positions).
+    """
+    symbols, positions = [], []
+    for index in range(start, end):
+        char = _MATH_SYMBOL_EQUIVALENTS.get(content[index], content[index])
+        if not char.isspace():
+            symbols.append(char)
+            positions.append(index)
+    return symbols, positions
+
+def _suffix_prefix_lengths(text: list, pattern: list) -> list:
+    """
+    Lengths n, longest first, for which text ends with pattern[:n] (KMP).
+    """
+    failure = [0] * len(pattern)
+    k = 0
+    for i in range(1, len(pattern)):
+        while k and pattern[i] != pattern[k]:
+            k = failure[k - 1]
+        if pattern[i] == pattern[k]:
+            k += 1
+        failure[i] = k
+    
+    k = 0
+    for symbol in text:
+        while k and (k == len(pattern) or symbol != pattern[k]):
+            k = failure[k - 1]
+        if k < len(pattern) and symbol == pattern[k]:
+            k += 1
+    
+    lengths = []
+    while k:
+        lengths.append(k)
+        k = failure[k - 1]
+    return lengths
+
+def _is_word_character(char: str) -> bool:
+    return char.isascii() and char.isalnum()
+
+def _math_fallback_start(content: str, lower: int, split: int, closing: str, math_start: int) -> int:
+    """
+    Start of the plain-text fallback ending at split whose symbols match the
+    LaTeX at math_start, or -1 if there is none.
+    
+    Text before lower (the previous LaTeX token) is not considered. With a
+    closing delimiter the fallback must match the whole expression.
+    """
+    lower = max(lower, split - _MATH_FALLBACK_MAX_CHARS)
+    paragraph = content.rfind('\n\n', lower, split)
+    if paragraph != -1:
+        lower = paragraph + 2
+    if split - lower < _MATH_FALLBACK_MIN_SYMBOLS or not _MATH_RELATION_PATTERN.search(content, lower, split):
+        return -1
+    if _is_word_character(content[math_start]):
+        # The fallback starts with the same name and has a relation after it
+        first = content.find(content[math_start], lower, split)
+        if first == -1 or not _MATH_RELATION_PATTERN.search(content, first, split):
+            return -1
+    
+    plain, positions = _plain_symbols(content, lower, split)
+    latex, depths, joined, ended = _math_symbols(content, math_start, len(plain) + 1, closing)
+    if closing:
+        lengths = [len(latex)] if ended and plain[len(plain) - len(latex):] == latex else []
+    else:
+        lengths = _suffix_prefix_lengths(plain[-len(latex):], latex[:len(plain)])
+    
+    for length in lengths:
+        if length < _MATH_FALLBACK_MIN_SYMBOLS:
+            break
+        start = positions[-length]
+        if start > 0 and _is_word_character(content[start - 1]) and _is_word_character(content[start]):
+            continue
+        if not _MATH_RELATION_PATTERN.search(content, start, split):
+            continue
+        if length < len(latex) and (
+            depths[length] and depths[length - 1] or latex[length] in _MATH_CONTINUATIONS
+            or joined[length] and _is_word_character(latex[length]) and _is_word_character(latex[length - 1])
+        ):
+            continue
+        if not ended and length == len(latex):
+            continue
+        return start
+    return -1
+
+def _fix_mixed_mathematical_expressions(content: str) -> str:
+    """
+    Removes duplicated plain-text versions of mathematical expressions
+    that Pandoc sometimes generates alongside the LaTeX version by deleting
+    the plain text part when it is immediately followed by the LaTeX part.
+    """
+    return _mixed_math_pass(content, None, frozenset())[0]
+
+def _mixed_math_pass(content: str, options: 'ConversionOptions', body_tokens: set) -> tuple[str, int]:
+    """
+    Pipeline pass behind _fix_mixed_mathematical_expressions().
+    """
+    removals = []
+    previous_end = 0
+    closing = None
+    for match in _MATH_SYNTAX_PATTERN.finditer(content):
+        token, start = match.group(), match.start()
+        if token == closing:
+            closing = None
+        elif token in _MATH_OPENERS:
+            if closing is None:
+                closing = _MATH_OPENERS[token]
+                # Fallback in front of a math environment
+                fallback = _math_fallback_start(content, previous_end, start, closing, match.end())
+                if fallback != -1:
+                    removals.append((fallback, start))
+        elif token[0] != '\\' or token[1:] not in _MATH_ESCAPES:
+            # Fallback in front of undelimited LaTeX or inside a math environment.
+            # A subscripted name starts before the "_"
+            splits = [start]
+            if token in '_^':
+                splits = []
+                split = start - 1
+                while split >= max(previous_end, start - _MATH_BASE_MAX_CHARS) and content[split].isalnum():
+                    splits.append(split)
+                    split -= 1
+            for split in splits:
+                fallback = _math_fallback_start(content, previous_end, split, None, split)
+                if fallback != -1:
+                    removals.append((fallback, split))
+                    break
+        previous_end = match.end()
+    
+    if not removals:
+        return content, 0
+    parts = []
+    position = 0
+    for start, end in removals:
+        parts.append(content[position:start])
+        position = end
+    parts.append(content[position:])
+    return ''.join(parts), len(removals)
+
+# --- Post-processing pipeline ---
+
+@dataclass
+class PostProcessingPass:
+    """
+    A named post-processing step, run by PostProcessingPipeline.
+
+    Attributes:
+        name: Name used in statistics and to disable the pass.
+        scope: "body" passes only depend on local context and may run on chunks
+            of the document; "preamble" passes edit the preamble based on what
+            the whole document contains.
+        apply: Function (content, options, body_tokens) -> (content, matches).
+            Body passes get and return a string. Preamble passes get the
+            document's Preamble (see latex_preamble), edit it and return it;
+            body_tokens is the set of the pass's tokens found in the body.
+        enabled: Predicate on ConversionOptions; None means always enabled.
+        trigger: Token the pass cannot match without. The pass is skipped when
+            the document does not contain it; None means the pass always runs.
+        tokens: For preamble passes, the strings the pass looks for in the body.
+        visitor: For body passes that edit markup, the TokenVisitor (see
+            latex_tokens) that apply runs on its own scan of the content.
+            The pipeline runs consecutive visitor passes on a single scan.
+            With ast_post_processing, postprocess_filter.lua does their work
+            in pandoc and they do not run.
+    """
+    name: str
+    scope: str
+    apply: Callable
+    enabled: Callable = None
+    trigger: str = None
+    tokens: tuple = ()
+    visitor: TokenVisitor = None
+
+@dataclass
+class PassStats:
+    """
+    Statistics for one pass, summed over every chunk it ran on.
+    """
+    name: str
+    scope: str
+    runs: int = 0
+    seconds: float = 0.0
+    input_size: int = 0
+    output_size: int = 0
+    matches: int = 0
+    errors: list = field(default_factory=list)
+    # Runs aborted for exceeding the pipeline's pass_budget
+    timeouts: int = 0
+    
+    def add(self, other: 'PassStats'):
+        self.runs += other.runs
+        self.seconds += other.seconds
+        self.input_size += other.input_size
+        self.output_size += other.output_size
+        self.matches += other.matches
+        self.errors.extend(other.errors)
+        self.timeouts += other.timeouts
+
+class PassTimeoutError(Exception):
+    """
+    Raised inside a post-processing pass that ran past the pipeline's pass_budget.
+    """
 
-    Args:
-        docx_path: Path to the input .docx file.
-        latex_path: Path to save the output .tex file.
-        generate_toc: If True, attempts to generate a Table of Contents.
-        extract_media_to_path: If specified, path to extract media to (e.g., "./media").
-        latex_template_path: If specified, path to a custom Pandoc LaTeX template file.
-        overleaf_compatible: If True, makes images work in Overleaf with relative paths.
-        preserve_styles: If True, preserves document styles like centering and alignment.
-        preserve_linebreaks: If True, preserves line breaks and proper list formatting.
+# Passes are aborted from a SIGALRM handler, which Windows does not have
+_CAN_ABORT_PASSES = hasattr(signal, 'setitimer')
 
-    Returns:
-        A tuple (success: bool, message: str).
+@contextmanager
+def _time_limit(seconds: float):
     """
-    extra_args = []
+    Raise PassTimeoutError in the block once it has run for seconds.
     
-    # Ensure standalone document (not fragment)
-    extra_args.append("--standalone")
+    Signal handlers run on the main thread only, so elsewhere (and without
+    SIGALRM, or with seconds=None) the block runs without a limit.
+    """
+    if seconds is None or not _CAN_ABORT_PASSES or threading.current_thread() is not threading.main_thread():
+        yield
+        return
     
-    # Basic options
-    if generate_toc:
-        extra_args.append("--toc")
-    if extract_media_to_path:
-        extra_args.append(f"--extract-media={extract_media_to_path}")
-    if latex_template_path and os.path.isfile(latex_template_path):
-        extra_args.append(f"--template={latex_template_path}")
-    elif latex_template_path:
-        pass  # Template not found, Pandoc will handle the error
-
-    # Enhanced features
-    if overleaf_compatible:
-        extra_args.extend([
-            "--resource-path=./",
-            "--default-image-extension=png"
-        ])
+    armed = True
     
-    if preserve_styles:
-        extra_args.extend([
-            "--from=docx+styles",
-            "--wrap=preserve",
-            "--columns=72",
-            "--strip-comments"  # Remove comments that might cause highlighting
-        ])
+    def expire(signum, frame):
+        if armed:
+            raise PassTimeoutError(f"exceeded the time budget of {seconds}s")
     
-    if preserve_linebreaks:
-        extra_args.extend([
-            "--preserve-tabs",
-            "--wrap=preserve",
-            "--reference-doc=" + docx_path  # Use original Word doc as reference for formatting
-        ])
-        
-        # Create minimal Lua filter that preserves Word's original line breaks
-        lua_filter_content = '''
-function Para(elem)
-  -- Preserve all line breaks exactly as they appear in Word
-  -- This maintains Word's original pagination and formatting
-  local new_content = {}
-  
-  for i, item in ipairs(elem.content) do
-    if item.t == "SoftBreak" then
-      -- Convert all soft breaks to line breaks to match Word's formatting
-      table.insert(new_content, pandoc.LineBreak())
-    else
-      table.insert(new_content, item)
-    end
-  end
-  
-  elem.content = new_content
-  return elem
-end
-
-function LineBlock(elem)
-  -- Preserve line blocks exactly as they are
-  return elem
-end
-
-function Span(elem)
-  -- Remove unwanted highlighting and formatting
-  if elem.attributes and elem.attributes.style then
-    -- Remove background colors and highlighting
-    local style = elem.attributes.style
-    if string.find(style, "background") or string.find(style, "highlight") then
-      elem.attributes.style = nil
-    end
-  end
-  return elem
-end
-
-function Div(elem)
-  -- Remove unwanted div formatting that causes highlighting
-  if elem.attributes and elem.attributes.style then
-    local style = elem.attributes.style
-    if string.find(style, "background") or string.find(style, "highlight") then
-      elem.attributes.style = nil
-    end
-  end
-  return elem
-end
-
-function RawBlock(elem)
-  -- Preserve raw LaTeX blocks
-  if elem.format == "latex" then
-    return elem
-  end
-end
-'''
-        
-        # Create temporary Lua filter file
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.lua', delete=False) as f:
-            f.write(lua_filter_content)
-            lua_filter_path = f.name
-        
-        extra_args.append(f"--lua-filter={lua_filter_path}")
-
+    previous_handler = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
     try:
-        # Perform conversion
-        pypandoc.convert_file(docx_path, 'latex', outputfile=latex_path, extra_args=extra_args)
-        
-        # Clean up temporary Lua filter if created
-        if preserve_linebreaks and 'lua_filter_path' in locals():
-            try:
-                os.unlink(lua_filter_path)
-            except OSError:
-                pass
-        
-        # Apply post-processing enhancements (always applied for Unicode conversion)
-        _apply_post_processing(latex_path, overleaf_compatible, preserve_styles, preserve_linebreaks, extract_media_to_path)
-        
-        # Generate status message
-        enhancements = []
-        if overleaf_compatible:
-            enhancements.append("Overleaf compatibility")
-        if preserve_styles:
-            enhancements.append("style preservation")
-        if preserve_linebreaks:
-            enhancements.append("line break preservation")
-        
-        if enhancements:
-            enhancement_msg = f" with {', '.join(enhancements)}"
-        else:
-            enhancement_msg = ""
-            
-        return True, f"Conversion successful{enhancement_msg}!"
-        
-    except RuntimeError as e:
-        # Clean up temporary Lua filter if created
-        if preserve_linebreaks and 'lua_filter_path' in locals():
-            try:
-                os.unlink(lua_filter_path)
-            except OSError:
-                pass
-        return False, f"RuntimeError: Could not execute Pandoc. Please ensure Pandoc is installed and in your system's PATH. Error: {e}"
-    except Exception as e:
-        # Clean up temporary Lua filter if created
-        if preserve_linebreaks and 'lua_filter_path' in locals():
-            try:
-                os.unlink(lua_filter_path)
-            except OSError:
-                pass
-        return False, f"Conversion failed: {e}"
+        yield
+    finally:
+        armed = False
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
 
-def _apply_post_processing(latex_path: str, overleaf_compatible: bool, preserve_styles: bool, preserve_linebreaks: bool, extract_media_to_path: str = None):
-    """
-    Apply post-processing enhancements to the generated LaTeX file.
+class PostProcessingPipeline:
     """
-    try:
-        with open(latex_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # Always inject essential packages for compilation compatibility
-        content = _inject_essential_packages(content)
-        
-        # Fix mixed mathematical expressions first to remove duplicated text
-        content = _fix_mixed_mathematical_expressions(content)
-        
-        # Convert Unicode mathematical characters to LaTeX equivalents (always applied)
-        content = _convert_unicode_math_characters(content)
-        
-        # Apply additional Unicode cleanup as a safety net
-        content = _additional_unicode_cleanup(content)
-        
-        # Apply overleaf compatibility fixes
-        if overleaf_compatible:
-            content = _fix_image_paths_for_overleaf(content, extract_media_to_path)
-        
-        # Apply style preservation enhancements
-        if preserve_styles:
-            content = _inject_latex_packages(content)
-            content = _add_centering_commands(content)
-        
-        # Apply line break preservation fixes
-        if preserve_linebreaks:
-            content = _fix_line_breaks_and_spacing(content)
-        
-        # Remove unwanted formatting and highlighting
-        content = _remove_unwanted_formatting(content)
-        
-        # Fix common LaTeX compilation issues
-        content = _fix_compilation_issues(content)
-        
-        # Write back the processed content
-        with open(latex_path, 'w', encoding='utf-8') as f:
-            f.write(content)
-            
-    except Exception as e:
-        # Post-processing failures shouldn't break the conversion
-        print(f"Warning: Post-processing failed: {e}")
+    Runs the registered post-processing passes and records per-pass statistics.
 
-def _inject_essential_packages(content: str) -> str:
-    """
-    Inject essential packages that are always needed for compilation.
+    Usage:
+        pipeline = PostProcessingPipeline(disabled={'remove_ul'})
+        convert_docx_to_latex(docx_path, latex_path, pipeline=pipeline)
+        for stats in pipeline.stats.values():
+            print(stats.name, stats.seconds, stats.matches)
+
+    A pass that raises is skipped (the error is printed and recorded in its
+    statistics) and the remaining passes still run. Passes must be picklable
+    to be used with post_processing_workers > 1.
+    
+    With pass_budget set, a pass that runs longer than that many seconds on
+    one input (the document or a chunk of it) is aborted the same way and
+    counted in its statistics' timeouts. Passes are interrupted by SIGALRM,
+    which only the main thread receives: called from another thread, the
+    pipeline runs the passes in a child process. Without SIGALRM (Windows)
+    the budget is not enforced.
     """
-    # Core packages that Pandoc might not include but are often needed
-    essential_packages = [
-        r'\usepackage[utf8]{inputenc}',  # UTF-8 input encoding
-        r'\usepackage[T1]{fontenc}',     # Font encoding
-        r'\usepackage{graphicx}',        # For images
-        r'\usepackage{longtable}',       # For tables
-        r'\usepackage{booktabs}',        # Better table formatting
-        r'\usepackage{hyperref}',        # For links (if not already included)
-        r'\usepackage{amsmath}',         # Mathematical formatting
-        r'\usepackage{amssymb}',         # Mathematical symbols
-        r'\usepackage{textcomp}',        # Additional text symbols
-    ]
     
-    documentclass_pattern = r'\\documentclass(?:\[[^\]]*\])?\{[^}]+\}'
-    documentclass_match = re.search(documentclass_pattern, content)
+    def __init__(self, passes: list = None, disabled=(), pass_budget: float = None):
+        self.passes = list(POST_PROCESSING_PASSES if passes is None else passes)
+        self.disabled = set(disabled)
+        self.pass_budget = pass_budget
+        # name -> PassStats, in the order the passes first ran
+        self.stats = {}
+        self._trigger_pattern = _build_trigger_pattern(self.passes)
     
-    if documentclass_match:
-        insert_pos = documentclass_match.end()
-        
-        packages_to_insert = []
-        for package in essential_packages:
-            package_name = package.split('{')[1].split('}')[0].split(']')[0]  # Extract package name
-            if f'usepackage' not in content or package_name not in content:
-                packages_to_insert.append(package)
-        
-        if packages_to_insert:
-            package_block = '\n% Essential packages for compilation\n' + '\n'.join(packages_to_insert) + '\n'
-            content = content[:insert_pos] + package_block + content[insert_pos:]
-        
-        # Add Unicode character definitions to handle any remaining problematic characters
-        unicode_definitions = r'''
-% Unicode character definitions for LaTeX compatibility
-\DeclareUnicodeCharacter{2003}{ }  % Em space
-\DeclareUnicodeCharacter{2002}{ }  % En space
-\DeclareUnicodeCharacter{2009}{ }  % Thin space
-\DeclareUnicodeCharacter{200A}{ }  % Hair space
-\DeclareUnicodeCharacter{2004}{ }  % Three-per-em space
-\DeclareUnicodeCharacter{2005}{ }  % Four-per-em space
-\DeclareUnicodeCharacter{2006}{ }  % Six-per-em space
-\DeclareUnicodeCharacter{2008}{ }  % Punctuation space
-\DeclareUnicodeCharacter{202F}{ }  % Narrow no-break space
-\DeclareUnicodeCharacter{2212}{-}  % Unicode minus sign
-\DeclareUnicodeCharacter{2010}{-}  % Hyphen
-\DeclareUnicodeCharacter{2011}{-}  % Non-breaking hyphen
-\DeclareUnicodeCharacter{2013}{--} % En dash
-\DeclareUnicodeCharacter{2014}{---}% Em dash
-'''
-        
-        # Insert Unicode definitions after packages but before \begin{document}
-        begin_doc_match = re.search(r'\\begin\{document\}', content)
-        if begin_doc_match:
-            insert_pos_unicode = begin_doc_match.start()
-            content = content[:insert_pos_unicode] + unicode_definitions + '\n' + content[insert_pos_unicode:]
+    def active_passes(self, options: 'ConversionOptions') -> list:
+        return [
+            post_pass for post_pass in self.passes
+            if post_pass.name not in self.disabled and (post_pass.enabled is None or post_pass.enabled(options))
+            and not (options.ast_post_processing and post_pass.visitor is not None)
+        ]
     
-    return content
+    def run(self, content: str, options: 'ConversionOptions', body_tokens: dict = None) -> str:
+        """
+        Run all active passes on content.
 
-def _convert_unicode_math_characters(content: str) -> str:
-    """
-    Convert Unicode mathematical characters to their LaTeX equivalents.
-    """
-    # Dictionary of Unicode characters to LaTeX commands
-    unicode_to_latex = {
-        # Mathematical operators
-        'Δ': r'$\Delta$',           # U+0394 - Greek capital letter delta
-        'δ': r'$\delta$',           # U+03B4 - Greek small letter delta
-        '∑': r'$\sum$',             # U+2211 - N-ary summation
-        '∏': r'$\prod$',            # U+220F - N-ary product
-        '∫': r'$\int$',             # U+222B - Integral
-        '∂': r'$\partial$',         # U+2202 - Partial differential
-        '∇': r'$\nabla$',           # U+2207 - Nabla
-        '√': r'$\sqrt{}$',          # U+221A - Square root
-        '∞': r'$\infty$',           # U+221E - Infinity
-        
-        # Relations and equality
-        '≈': r'$\approx$',          # U+2248 - Almost equal to
-        '≠': r'$\neq$',             # U+2260 - Not equal to
-        '≤': r'$\leq$',             # U+2264 - Less-than or equal to
-        '≥': r'$\geq$',             # U+2265 - Greater-than or equal to
-        '±': r'$\pm$',              # U+00B1 - Plus-minus sign
-        '∓': r'$\mp$',              # U+2213 - Minus-or-plus sign
-        '×': r'$\times$',           # U+00D7 - Multiplication sign
-        '÷': r'$\div$',             # U+00F7 - Division sign
-        '⋅': r'$\cdot$',            # U+22C5 - Dot operator
-        
-        # Set theory and logic
-        '∈': r'$\in$',              # U+2208 - Element of
-        '∉': r'$\notin$',           # U+2209 - Not an element of
-        '⊂': r'$\subset$',          # U+2282 - Subset of
-        '⊃': r'$\supset$',          # U+2283 - Superset of
-        '⊆': r'$\subseteq$',        # U+2286 - Subset of or equal to
-        '⊇': r'$\supseteq$',        # U+2287 - Superset of or equal to
-        '∪': r'$\cup$',             # U+222A - Union
-        '∩': r'$\cap$',             # U+2229 - Intersection
-        '∅': r'$\emptyset$',        # U+2205 - Empty set
-        '∀': r'$\forall$',          # U+2200 - For all
-        '∃': r'$\exists$',          # U+2203 - There exists
-        
-        # Special symbols
-        '∣': r'$|$',                # U+2223 - Divides
-        '∥': r'$\parallel$',        # U+2225 - Parallel to
-        '⊥': r'$\perp$',            # U+22A5 - Up tack (perpendicular)
-        '∠': r'$\angle$',           # U+2220 - Angle
-        '°': r'$^\circ$',           # U+00B0 - Degree sign
-        
-        # Arrows
-        '→': r'$\rightarrow$',      # U+2192 - Rightwards arrow
-        '←': r'$\leftarrow$',       # U+2190 - Leftwards arrow
-        '↔': r'$\leftrightarrow$',  # U+2194 - Left right arrow
-        '⇒': r'$\Rightarrow$',      # U+21D2 - Rightwards double arrow
-        '⇐': r'$\Leftarrow$',       # U+21D0 - Leftwards double arrow
-        '⇔': r'$\Leftrightarrow$',  # U+21D4 - Left right double arrow
-        
-        # Accents and diacritics
-        'ˉ': r'$\bar{}$',           # U+02C9 - Modifier letter macron
-        'ˆ': r'$\hat{}$',           # U+02C6 - Modifier letter circumflex accent
-        'ˇ': r'$\check{}$',         # U+02C7 - Caron
-        '˜': r'$\tilde{}$',         # U+02DC - Small tilde
-        '˙': r'$\dot{}$',           # U+02D9 - Dot above
-        '¨': r'$\ddot{}$',          # U+00A8 - Diaeresis
-        
-        # Special minus and spaces - using explicit Unicode escape sequences
-        '−': r'-',                  # U+2212 - Minus sign (convert to regular hyphen)
-        '\u2003': r' ',             # U+2003 - Em space (convert to regular space)
-        '\u2009': r' ',             # U+2009 - Thin space (convert to regular space)
-        '\u2002': r' ',             # U+2002 - En space (convert to regular space)
-        '\u2004': r' ',             # U+2004 - Three-per-em space
-        '\u2005': r' ',             # U+2005 - Four-per-em space
-        '\u2006': r' ',             # U+2006 - Six-per-em space
-        '\u2008': r' ',             # U+2008 - Punctuation space
-        '\u200A': r' ',             # U+200A - Hair space
-        '\u202F': r' ',             # U+202F - Narrow no-break space
-        
-        # Greek letters (commonly used in math)
-        'α': r'$\alpha$',           # U+03B1
-        'β': r'$\beta$',            # U+03B2
-        'γ': r'$\gamma$',           # U+03B3
-        'Γ': r'$\Gamma$',           # U+0393
-        'ε': r'$\varepsilon$',      # U+03B5
-        'ζ': r'$\zeta$',            # U+03B6
-        'η': r'$\eta$',             # U+03B7
-        'θ': r'$\theta$',           # U+03B8
-        'Θ': r'$\Theta$',           # U+0398
-        'ι': r'$\iota$',            # U+03B9
-        'κ': r'$\kappa$',           # U+03BA
-        'λ': r'$\lambda$',          # U+03BB
-        'Λ': r'$\Lambda$',          # U+039B
-        'μ': r'$\mu$',              # U+03BC
-        'ν': r'$\nu$',              # U+03BD
-        'ξ': r'$\xi$',              # U+03BE
-        'Ξ': r'$\Xi$',              # U+039E
-        'π': r'$\pi$',              # U+03C0
-        'Π': r'$\Pi$',              # U+03A0
-        'ρ': r'$\rho$',             # U+03C1
-        'σ': r'$\sigma$',           # U+03C3
-        'Σ': r'$\Sigma$',           # U+03A3
-        'τ': r'$\tau$',             # U+03C4
-        'υ': r'$\upsilon$',         # U+03C5
-        'Υ': r'$\Upsilon$',         # U+03A5
-        'φ': r'$\varphi$',          # U+03C6
-        'Φ': r'$\Phi$',             # U+03A6
-        'χ': r'$\chi$',             # U+03C7
-        'ψ': r'$\psi$',             # U+03C8
-        'Ψ': r'$\Psi$',             # U+03A8
-        'ω': r'$\omega$',           # U+03C9
-        'Ω': r'$\Omega$',           # U+03A9
-    }
+        body_tokens maps preamble pass names to the tokens found in document
+        text outside content; it is only needed for the preamble chunk of a
+        streamed document.
+        """
+        body_tokens = body_tokens or {}
+        if self.needs_child_process():
+            return self._run_in_child_process(_post_process_document, content, options, body_tokens)[0]
+        # Split once: preamble passes edit the parsed preamble, body passes
+        # run on the preamble text and the body separately
+        preamble, body = split_document(content)
+        scan = lambda: set(self._trigger_pattern.findall(preamble.text)) | set(self._trigger_pattern.findall(body))
+        for passes in _pass_groups(self.active_passes(options), scan):
+            if passes[0].scope == 'preamble':
+                post_pass = passes[0]
+                tokens = set(body_tokens.get(post_pass.name, ()))
+                _collect_tokens(body, post_pass.tokens, tokens)
+                preamble = self._run_pass(post_pass, preamble, options, tokens)
+                continue
+            text = self._run_body_passes(passes, preamble.text, options)
+            if text != preamble.text:
+                preamble.update(text)
+            if body:
+                body = self._run_body_passes(passes, body, options)
+        return preamble.text + body
+    
+    def run_body(self, content: str, options: 'ConversionOptions') -> tuple[str, dict]:
+        """
+        Run the active body passes on a body chunk.
+
+        Instead of running the preamble passes, collects the tokens each of
+        them looks for at its position in the pipeline. Returns the processed
+        chunk and the tokens found, as a body_tokens mapping for run().
+        """
+        if self.needs_child_process():
+            chunk, body_tokens = self._run_in_child_process(_post_process_body_chunk, content, options)
+            return chunk, body_tokens
+        body_tokens = {}
+        scan = lambda: set(self._trigger_pattern.findall(content))
+        for passes in _pass_groups(self.active_passes(options), scan):
+            if passes[0].scope == 'preamble':
+                _collect_tokens(content, passes[0].tokens, body_tokens.setdefault(passes[0].name, set()))
+                continue
+            content = self._run_body_passes(passes, content, options)
+        return content, body_tokens
     
-    # Apply conversions
-    for unicode_char, latex_cmd in unicode_to_latex.items():
-        if unicode_char in content:
-            content = content.replace(unicode_char, latex_cmd)
+    def needs_child_process(self) -> bool:
+        """
+        Whether the passes must run in a child process for pass_budget to be enforced.
+        """
+        return self.pass_budget is not None and _CAN_ABORT_PASSES and threading.current_thread() is not threading.main_thread()
     
-    # Additional aggressive Unicode space cleanup using regex
-    # Handle various Unicode spaces more comprehensively
-    content = re.sub(r'[\u2000-\u200F\u2028-\u202F\u205F\u3000]', ' ', content)  # All Unicode spaces
+    @property
+    def timed_out_passes(self) -> list:
+        """Names of the passes aborted for exceeding pass_budget."""
+        return [stats.name for stats in self.stats.values() if stats.timeouts]
     
-    # Handle specific problematic Unicode characters that might not be in our dictionary
-    content = re.sub(r'[\u2010-\u2015]', '-', content)  # Various Unicode dashes
-    content = re.sub(r'[\u2212]', '-', content)         # Unicode minus sign
+    def merge_stats(self, stats: list):
+        """Add statistics recorded by another pipeline (e.g. in a worker process)."""
+        for pass_stats in stats:
+            if pass_stats.name in self.stats:
+                self.stats[pass_stats.name].add(pass_stats)
+            else:
+                self.stats[pass_stats.name] = pass_stats
     
-    # Handle specific cases where characters might appear in math environments
-    # Fix double math mode (e.g., $\alpha$ inside already math mode)
-    content = re.sub(r'\$\$([^$]+)\$\$', r'$\1$', content)  # Convert display math to inline
-    content = re.sub(r'\$\$([^$]*)\$([^$]*)\$\$', r'$\1\2$', content)  # Fix broken math
+    def _run_body_passes(self, passes: list, content: str, options: 'ConversionOptions') -> str:
+        """
+        Run a group from _pass_groups() on content.
+
+        Visitor passes share one scan. If it raises or runs longer than
+        pass_budget, the passes run one at a time instead, so that only the
+        failing pass is skipped and recorded. A scan aborted for time is
+        only reported: whether a pass timed out is decided by its own run.
+        """
+        if len(passes) == 1:
+            return self._run_pass(passes[0], content, options, frozenset())
+        try:
+            with _time_limit(self.pass_budget):
+                result, visitor_results = apply_visitors(content, [post_pass.visitor for post_pass in passes], options)
+        except Exception as e:
+            if isinstance(e, PassTimeoutError):
+                names = ", ".join(post_pass.name for post_pass in passes)
+                print(f"Warning: Post-processing passes {names} {e} on {len(content)} characters; running them one at a time")
+            for post_pass in passes:
+                content = self._run_pass(post_pass, content, options, frozenset())
+            return content
+        self.merge_stats([
+            PassStats(
+                post_pass.name, post_pass.scope, runs=1, seconds=visitor_result.seconds, input_size=len(content),
+                output_size=len(content) + visitor_result.growth, matches=visitor_result.matches
+            )
+            for post_pass, visitor_result in zip(passes, visitor_results)
+        ])
+        return result
     
-    # Fix bar notation that might have been broken
-    content = re.sub(r'\$\\bar\{\}\$([a-zA-Z])', r'$\\bar{\1}$', content)
-    content = re.sub(r'([a-zA-Z])\$\\bar\{\}\$', r'$\\bar{\1}$', content)
+    def _run_pass(self, post_pass: PostProcessingPass, content, options: 'ConversionOptions', body_tokens: set):
+        pass_stats = PassStats(post_pass.name, post_pass.scope, runs=1, input_size=len(content))
+        # Preamble passes edit the model in place; one that fails leaves the original
+        target = content.copy() if isinstance(content, Preamble) else content
+        start = time.perf_counter()
+        try:
+            with _time_limit(self.pass_budget):
+                result, pass_stats.matches = post_pass.apply(target, options, body_tokens)
+        except PassTimeoutError as e:
+            print(f"Warning: Post-processing pass '{post_pass.name}' {e} on {len(content)} characters and was aborted")
+            pass_stats.timeouts = 1
+            result = content
+        except Exception as e:
+            print(f"Warning: Post-processing pass '{post_pass.name}' failed: {e}")
+            pass_stats.errors.append(str(e))
+            result = content
+        pass_stats.seconds = time.perf_counter() - start
+        pass_stats.output_size = len(result)
+        self.merge_stats([pass_stats])
+        return result
     
-    return content
+    def _run_in_child_process(self, entry_point: Callable, content: str, options: 'ConversionOptions', *args) -> list:
+        """
+        Run a process pool entry point in a new process; returns its results except the pass statistics.
+        """
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(entry_point, content, options, self.passes, self.disabled, self.pass_budget, *args)
+            *result, stats = future.result()
+        self.merge_stats(stats)
+        return result
 
-def _additional_unicode_cleanup(content: str) -> str:
-    """
-    Additional aggressive Unicode cleanup to handle any characters that slip through.
-    """
-    # Convert all common problematic Unicode spaces to regular spaces
-    # This covers a wider range than the dictionary approach
-    unicode_spaces = [
-        '\u00A0',  # Non-breaking space
-        '\u1680',  # Ogham space mark
-        '\u2000',  # En quad
-        '\u2001',  # Em quad
-        '\u2002',  # En space
-        '\u2003',  # Em space
-        '\u2004',  # Three-per-em space
-        '\u2005',  # Four-per-em space
-        '\u2006',  # Six-per-em space
-        '\u2007',  # Figure space
-        '\u2008',  # Punctuation space
-        '\u2009',  # Thin space
-        '\u200A',  # Hair space
-        '\u200B',  # Zero width space
-        '\u202F',  # Narrow no-break space
-        '\u205F',  # Medium mathematical space
-        '\u3000',  # Ideographic space
+# Regex passes are built from (name, pattern, replacement, trigger) tuples and
+# compiled once at import. Each runs as a single subn() over its input.
+#
+# Command arguments are matched as (?:(?!\\command\{)[^}])* rather than [^}]*:
+# an argument does not run into the next occurrence of the same command. A
+# failed match then stops there, instead of every occurrence scanning ahead to
+# the next closing brace, which is quadratic on input such as "\section{"
+# repeated without one (see benchmarks/bench_pass_worst_case.py).
+
+def _regex_pass(pattern: re.Pattern, replacement: str, content: str, options: 'ConversionOptions', body_tokens: set) -> tuple[str, int]:
+    return pattern.subn(replacement, content)
+
+def _compile_passes(passes: list, enabled: Callable = None) -> list:
+    return [
+        PostProcessingPass(name, 'body', partial(_regex_pass, re.compile(pattern), replacement), enabled, trigger)
+        for name, pattern, replacement, trigger in passes
     ]
-    
-    for unicode_space in unicode_spaces:
-        content = content.replace(unicode_space, ' ')
-    
-    # Convert Unicode dashes
-    unicode_dashes = [
-        '\u2010',  # Hyphen
-        '\u2011',  # Non-breaking hyphen
-        '\u2012',  # Figure dash
-        '\u2013',  # En dash
-        '\u2014',  # Em dash
-        '\u2015',  # Horizontal bar
-        '\u2212',  # Minus sign
+
+# Passes that edit markup are token visitors (see latex_tokens), built from
+# (name, visitor, trigger) tuples. Arguments are read as balanced groups, so
+# they may contain braces and nested commands. Run alone, a visitor pass
+# scans its input itself; the pipeline runs consecutive ones on one scan.
+
+def _visitor_pass(visitor: TokenVisitor, content: str, options: 'ConversionOptions', body_tokens: set) -> tuple[str, int]:
+    content, (result,) = apply_visitors(content, [visitor], options)
+    return content, result.matches
+
+def _visitor_passes(passes: list, enabled: Callable = None) -> list:
+    return [
+        PostProcessingPass(name, 'body', partial(_visitor_pass, visitor), enabled, trigger, visitor=visitor)
+        for name, visitor, trigger in passes
     ]
+
+def _remove_command(arguments: int, kept: int, document: TokenDocument, token: Token, options: 'ConversionOptions') -> int:
+    """
+    Remove a command, its optional arguments and the given number of
+    mandatory arguments, keeping the content of the argument at index kept
+    (or nothing if kept is None). A command without all its arguments is
+    left as it is.
+    """
+    position = token.end
+    while document.optional_end(position) >= 0:
+        position = document.optional_end(position)
+    groups = []
+    for _ in range(arguments):
+        end = document.group_end(position)
+        if end < 0:
+            return 0
+        groups.append((position, end))
+        position = end
+    if kept is None:
+        document.delete(token.start, position)
+    else:
+        # Delete around the kept argument, so edits inside it still apply
+        document.delete(token.start, groups[kept][0] + 1)
+        document.delete(groups[kept][1] - 1, position)
+    return 1
+
+def _command_remover(command: str, arguments: int, kept: int = None) -> TokenVisitor:
+    return TokenVisitor(partial(_remove_command, arguments, kept), commands=(command,))
+
+def _without_linebreak_fixes(options: 'ConversionOptions') -> bool:
+    return not options.preserve_linebreaks
+
+_FORMATTING_PASSES = _visitor_passes([
+    # Remove highlighting commands
+    ('remove_colorbox', _command_remover('colorbox', 2, kept=1), r'\colorbox'),
+    ('remove_hl', _command_remover('hl', 1, kept=0), r'\hl'),
+    ('remove_texthl', _command_remover('texthl', 1, kept=0), r'\texthl'),
+    ('remove_hlc', _command_remover('hlc', 1, kept=0), r'\hlc'),
     
-    for unicode_dash in unicode_dashes:
-        if unicode_dash in ['\u2013', '\u2014']:  # En and Em dashes
-            content = content.replace(unicode_dash, '--')
-        else:
-            content = content.replace(unicode_dash, '-')
+    # Remove table cell coloring
+    ('remove_cellcolor', _command_remover('cellcolor', 1), r'\cellcolor'),
+    ('remove_rowcolor', _command_remover('rowcolor', 1), r'\rowcolor'),
+    ('remove_columncolor', _command_remover('columncolor', 1), r'\columncolor'),
+    
+    # Remove text background colors
+    ('remove_textcolor', _command_remover('textcolor', 2, kept=1), r'\textcolor'),
+    ('remove_color', _command_remover('color', 1), r'\color'),
     
-    # Use regex for any remaining problematic characters
-    # Remove or replace any remaining Unicode characters that commonly cause issues
-    content = re.sub(r'[\u2000-\u200F\u2028-\u202F\u205F\u3000]', ' ', content)
-    content = re.sub(r'[\u2010-\u2015\u2212]', '-', content)
+    # Remove box formatting that might cause highlighting
+    ('remove_fcolorbox', _command_remover('fcolorbox', 3, kept=2), r'\fcolorbox'),
+    ('remove_framebox', _command_remover('framebox', 1, kept=0), r'\framebox'),
     
-    return content
+    # Remove soul package highlighting
+    ('remove_sethlcolor', _command_remover('sethlcolor', 1), r'\sethlcolor'),
+    ('remove_ul', _command_remover('ul', 1, kept=0), r'\ul'),  # Remove underline if causing issues
+])
 
-def _fix_mixed_mathematical_expressions(content: str) -> str:
+# Highlight and color removal also runs ahead of the spacing fixes, so that
+# lines emptied by it are collapsed. With line break fixes enabled, these
+# passes run there instead of in the formatting stage.
+_HIGHLIGHT_PASS_NAMES = ('remove_colorbox', 'remove_hl', 'remove_texthl', 'remove_cellcolor', 'remove_rowcolor')
+
+_LINE_BREAK_PASSES = [
+    replace(formatting_pass, enabled=attrgetter('preserve_linebreaks'))
+    for formatting_pass in _FORMATTING_PASSES if formatting_pass.name in _HIGHLIGHT_PASS_NAMES
+] + _compile_passes([
+    # Ensure proper spacing around lists but don't change internal spacing
+    ('space_before_enumerate', r'\n\\begin\{enumerate\}\n\n', r'\n\n\\begin{enumerate}\n', r'\begin{enumerate}'),
+    ('space_after_enumerate', r'\n\n\\end\{enumerate\}\n', r'\n\\end{enumerate}\n\n', r'\end{enumerate}'),
+    ('space_before_itemize', r'\n\\begin\{itemize\}\n\n', r'\n\n\\begin{itemize}\n', r'\begin{itemize}'),
+    ('space_after_itemize', r'\n\n\\end\{itemize\}\n', r'\n\\end{itemize}\n\n', r'\end{itemize}'),
+    
+    # Minimal section spacing - preserve Word's pagination
+    ('section_spacing', r'\n(\\(?:sub)*section\{(?:(?!\\(?:sub)*section\{)[^}])+\})\n\n', r'\n\n\1\n\n', None),
+    
+    # Only remove excessive spacing (3+ line breaks) but preserve double breaks
+    ('collapse_blank_lines', r'\n\n\n+', r'\n\n', None),
+    
+    # Ensure proper spacing around figures and tables
+    ('space_before_figure', r'\n\\begin\{figure\}', r'\n\n\\begin{figure}', r'\begin{figure}'),
+    ('space_after_figure', r'\\end\{figure\}\n([A-Z])', r'\\end{figure}\n\n\1', r'\end{figure}'),
+    ('space_before_table', r'\n\\begin\{table\}', r'\n\n\\begin{table}', r'\begin{table}'),
+    ('space_after_table', r'\\end\{table\}\n([A-Z])', r'\\end{table}\n\n\1', r'\end{table}'),
+], enabled=attrgetter('preserve_linebreaks'))
+
+# Whitespace up to a line end, counting the characters the unicode pass turns
+# into spaces: it edits the same scan, so centering sees them unconverted
+_LINE_END_PATTERN = re.compile('[\\s' + ''.join(re.escape(char) for char, replacement in _UNICODE_REPLACEMENTS.items() if replacement == ' ') + ']*\n')
+
+def _add_centering(document: TokenDocument, token: Token, options: 'ConversionOptions') -> int:
+    r"""
+    Put \centering on its own line after \begin{figure} or \begin{table}
+    and its placement, if the line ends there.
     """
-    Removes duplicated plain-text versions of mathematical expressions
-    that Pandoc sometimes generates alongside the LaTeX version by deleting
-    the plain text part when it is immediately followed by the LaTeX part.
+    position = token.end
+    if document.optional_end(position) >= 0:
+        position = document.optional_end(position)
+    match = _LINE_END_PATTERN.match(document.text, position)
+    if not match:
+        return 0
+    document.replace(position, match.end(), '\n\\centering\n')
+    return 1
+
+def _prefix_reference(prefix: str, label_prefix: str, document: TokenDocument, token: Token, options: 'ConversionOptions') -> int:
+    r"""
+    Put prefix before \ref{label} if the label starts with label_prefix.
     """
+    end = document.group_end(token.end)
+    if end < 0 or end - token.end <= len(label_prefix) + 2 or not document.text.startswith(label_prefix, token.end + 1):
+        return 0
+    document.insert(token.start, prefix)
+    return 1
+
+def _add_float_placement(document: TokenDocument, token: Token, options: 'ConversionOptions') -> int:
+    if document.text.startswith('[', token.end):
+        return 0
+    document.insert(token.end, '[htbp]')
+    return 1
+
+_CENTERING_PASSES = _visitor_passes([
+    # Add \centering to figure environments
+    ('center_figures', TokenVisitor(_add_centering, environments=('figure',)), r'\begin{figure}'),
+    
+    # Add \centering to table environments
+    ('center_tables', TokenVisitor(_add_centering, environments=('table',)), r'\begin{table}'),
+], enabled=attrgetter('preserve_styles'))
+
+_COMPILATION_PASSES = _visitor_passes([
+    # Fix undefined references to figures/tables
+    ('figure_ref_prefix', TokenVisitor(partial(_prefix_reference, 'Figure~', 'fig:'), commands=('ref',)), r'\ref'),
+    ('table_ref_prefix', TokenVisitor(partial(_prefix_reference, 'Table~', 'tab:'), commands=('ref',)), r'\ref'),
     
-    processed_content = content
+    # Ensure proper figure and table placement
+    ('figure_placement', TokenVisitor(_add_float_placement, environments=('figure',)), r'\begin{figure}'),
+    ('table_placement', TokenVisitor(_add_float_placement, environments=('table',)), r'\begin{table}'),
+])
 
-    # A list of compiled regex patterns.
-    # Each pattern matches a plain-text formula but only if it's followed
-    # by its corresponding LaTeX version (using a positive lookahead).
-    patterns_to_remove = [
-        # Pattern for: hq,k=x[nq,k]...h_{q,k} = x[n_{q,k}]...
-        re.compile(r'h[qrs],k=x\[n[qrs],k\](?:,h[qrs],k=x\[n[qrs],k\])*\s*' +
-                   r'(?=h_{q,k}\s*=\s*x\\\[n_{q,k}\\\],)', re.UNICODE),
+def _build_trigger_pattern(*pass_lists) -> re.Pattern:
+    triggers = sorted({post_pass.trigger for passes in pass_lists for post_pass in passes if post_pass.trigger})
+    alternatives = []
+    for trigger in triggers:
+        alternative = re.escape(trigger)
+        if trigger[-1].isalpha():
+            # Whole command names only, so \color does not fire on \colorbox
+            alternative += '(?![a-zA-Z])'
+        alternatives.append(alternative)
+    return re.compile('|'.join(alternatives))
 
-        # Pattern for: ∆hq,r,k=hq,k-hr,k...\Delta h_{q,r,k} = ...
-        re.compile(r'(?:∆h[qrs],[qrs],k=h[qrs],k-h[qrs],k\s*)+' +
-                   r'(?=\\Delta\s*h_{q,r,k})', re.UNICODE),
+_TRIGGER_PATTERN = _build_trigger_pattern(_FORMATTING_PASSES, _LINE_BREAK_PASSES, _CENTERING_PASSES, _COMPILATION_PASSES)
 
-        # Pattern for: RRk=tr,k+1-tr,kRR_k = ...
-        re.compile(r'RRk=tr,k\+1-tr,k\s*' +
-                   r'(?=RR_k\s*=\s*t_{r,k\+1})', re.UNICODE),
+_PREAMBLE_COMMAND_PATTERN = re.compile(r'\\(?:usepackage|title|author|date)')
+_FIRST_USEPACKAGE_PATTERN = re.compile(r'(\\usepackage\{[^}]+\}\s*\n)')
+_TASK_MEDIA_INCLUDE_PATTERN = re.compile(r'\\includegraphics(\[[^\]]*\])?\{[^{}]*[a-f0-9\-]+_media[/\\]media[/\\]([^{}]+)\}')
+_TASK_MEDIA_PATH_PATTERN = re.compile(r'[a-f0-9\-]+_media[/\\]media[/\\]')
 
-        # Pattern for: Tmed=median{RRk}T_{\mathrm{med}}
-        re.compile(r'Tmed=median\{RRk\}\s*' +
-                   r'(?=T_{\\mathrm{med}}\s*=\s*\\mathrm{median}\\{RR_k\\})', re.UNICODE),
+def _scan_triggers(content: str) -> set:
+    """
+    Find which pass trigger tokens occur in the document, in one scan.
+    """
+    return set(_TRIGGER_PATTERN.findall(content))
 
-        # Pattern for: Tk=[tr,k-Tmed2, tr,k+Tmed2]\mathcal{T}_k
-        re.compile(r'Tk=\[tr,k-Tmed2,.*?tr,k\+Tmed2\]\s*' +
-                   r'(?=\\mathcal\{T\}_k\s*=\s*\\\[t_{r,k})', re.UNICODE | re.DOTALL),
+def _pass_groups(passes: list, scan: Callable):
+    """
+    Yield the passes to run as lists: consecutive visitor passes together,
+    any other pass on its own. Passes whose trigger is absent are skipped.
 
-        # Pattern for: h¯k=1|Ik|∑n∈Ikx[n]\bar h_k
-        re.compile(r'h¯k=1\|Ik\|∑n∈Ikx\[n\]\s*' +
-                   r'(?=\\bar\s*h_k\s*=\s*\\frac)', re.UNICODE),
+    scan returns the triggers the content contains. It is called once, when
+    the first pass with a trigger is reached; passes only remove or rewrite
+    markup, so an absent trigger does not appear later.
+    """
+    triggers = None
+    visitor_passes = []
+    for post_pass in passes:
+        if post_pass.trigger is not None:
+            if triggers is None:
+                triggers = scan()
+            if post_pass.trigger not in triggers:
+                continue
+        if post_pass.visitor is not None:
+            visitor_passes.append(post_pass)
+            continue
+        if visitor_passes:
+            yield visitor_passes
+            visitor_passes = []
+        yield [post_pass]
+    if visitor_passes:
+        yield visitor_passes
 
-        # Pattern for: Mrs=median{∆hr,s,k}M_{rs}
-        re.compile(r'Mrs=median\{∆hr,s,k\}\s*' +
-                   r'(?=M_{rs}\s*=\s*\\mathrm{median})', re.UNICODE),
-        
-        # Pattern for: ∆h¯k=h¯k-Mrs\Delta\bar h_k
-        re.compile(r'∆h¯k=h¯k-Mrs\s*' +
-                   r'(?=\\Delta\\bar\s*h_k\s*=\s*\\bar\s*h_k)', re.UNICODE),
-    ]
+def _run_passes(content: str, passes: list, triggers: set = None) -> str:
+    """
+    Run a list of passes without instrumentation, skipping those whose trigger is absent.
+    """
+    if triggers is None:
+        triggers = _scan_triggers(content)
+    for group in _pass_groups(passes, lambda: triggers):
+        if group[0].visitor is not None:
+            content = apply_visitors(content, [post_pass.visitor for post_pass in group])[0]
+        else:
+            content = group[0].apply(content, None, frozenset())[0]
+    return content
 
-    for pattern in patterns_to_remove:
-        processed_content = pattern.sub('', processed_content)
+def _fix_compilation_issues(content: str, triggers: set = None) -> str:
+    """
+    Fix common LaTeX compilation issues.
+    """
+    content = _add_missing_definitions(content)
     
-    return processed_content
+    # Fix figure/table references and placement
+    return _run_passes(content, _COMPILATION_PASSES, triggers)
 
-def _fix_compilation_issues(content: str) -> str:
+def _add_missing_definitions(content: str) -> str:
     """
-    Fix common LaTeX compilation issues.
+    Define the tightlist and euro commands if the document uses them without a definition.
     """
+    return _apply_preamble_pass(_missing_definitions_pass, content, _DEFINITION_TOKENS)
+
+def _missing_definitions_pass(preamble: Preamble, options: 'ConversionOptions', body_tokens: set) -> tuple[Preamble, int]:
+    """
+    Pipeline pass behind _add_missing_definitions().
+
+    body_tokens holds the _DEFINITION_TOKENS found in the body.
+    """
+    inserted = 0
+    
     # Fix \tightlist command if not defined
-    if r'\tightlist' in content and r'\providecommand{\tightlist}' not in content:
+    if r'\tightlist' in body_tokens and not preamble.defines(r'\tightlist') and preamble.complete:
         tightlist_def = r'''
 % Define \tightlist command for lists
 \providecommand{\tightlist}{%
   \setlength{\itemsep}{0pt}\setlength{\parskip}{0pt}}
 '''
         # Insert after packages but before \begin{document}
-        begin_doc_match = re.search(r'\\begin\{document\}', content)
-        if begin_doc_match:
-            insert_pos = begin_doc_match.start()
-            content = content[:insert_pos] + tightlist_def + '\n' + content[insert_pos:]
+        preamble.insert(len(preamble), tightlist_def + '\n')
+        inserted += 1
     
     # Fix \euro command if used but not defined
-    if r'\euro' in content and r'usepackage{eurosym}' not in content:
-        content = re.sub(
-            r'(\\usepackage\{[^}]+\}\s*\n)',
-            r'\1\\usepackage{eurosym}\n',
-            content,
-            count=1
-        )
-    
-    # Fix undefined references to figures/tables
-    content = re.sub(r'\\ref\{fig:([^}]+)\}', r'Figure~\\ref{fig:\1}', content)
-    content = re.sub(r'\\ref\{tab:([^}]+)\}', r'Table~\\ref{tab:\1}', content)
-    
-    # Ensure proper figure placement
-    if r'\begin{figure}' in content:
-        content = re.sub(
-            r'\\begin\{figure\}(?!\[)',
-            r'\\begin{figure}[htbp]',
-            content
-        )
-    
-    # Ensure proper table placement  
-    if r'\begin{table}' in content:
-        content = re.sub(
-            r'\\begin\{table\}(?!\[)',
-            r'\\begin{table}[htbp]',
-            content
-        )
+    if r'\euro' in body_tokens and not preamble.loads('eurosym'):
+        first_usepackage_match = _FIRST_USEPACKAGE_PATTERN.search(preamble.text)
+        if first_usepackage_match:
+            preamble.insert(first_usepackage_match.end(), '\\usepackage{eurosym}\n')
+            inserted += 1
     
-    return content
+    return preamble, inserted
 
 def _fix_image_paths_for_overleaf(content: str, extract_media_to_path: str = None) -> str:
     """
     Convert absolute image paths to relative paths for Overleaf compatibility.
     """
+    return _overleaf_image_paths_pass(content, ConversionOptions(extract_media_to_path=extract_media_to_path), frozenset())[0]
+
+def _overleaf_image_paths_pass(content: str, options: 'ConversionOptions', body_tokens: set) -> tuple[str, int]:
+    """
+    Pipeline pass behind _fix_image_paths_for_overleaf().
+    """
+    extract_media_to_path = options.extract_media_to_path
+    matches = 0
     if extract_media_to_path:
         # Extract the media directory name
         media_dir = os.path.basename(extract_media_to_path.rstrip('/'))
@@ -581,164 +2338,455 @@ def _fix_image_paths_for_overleaf(content: str, extract_media_to_path: str = Non
         # Fix paths with task IDs like: task_id_media/media/image.png -> media/image.png
         # Pattern: \includegraphics{any_path/task_id_media/media/image.ext}
         # Replace with: \includegraphics{media/image.ext}
-        pattern1 = r'\\includegraphics(\[[^\]]*\])?\{[^{}]*[a-f0-9\-]+_media[/\\]media[/\\]([^{}]+)\}'
-        replacement1 = r'\\includegraphics\1{media/\2}'
-        content = re.sub(pattern1, replacement1, content)
+        content, count = _TASK_MEDIA_INCLUDE_PATTERN.subn(r'\\includegraphics\1{media/\2}', content)
+        matches += count
         
         # Fix paths like: task_id_media/media/image.png -> media/image.png (without includegraphics)
-        pattern2 = r'[a-f0-9\-]+_media[/\\]media[/\\]'
-        replacement2 = r'media/'
-        content = re.sub(pattern2, replacement2, content)
+        content, count = _TASK_MEDIA_PATH_PATTERN.subn(r'media/', content)
+        matches += count
         
         # Also handle regular media paths: /absolute/path/to/media/image.ext -> media/image.ext
         pattern3 = r'\\includegraphics(\[[^\]]*\])?\{[^{}]*[/\\]' + re.escape(media_dir) + r'[/\\]([^{}]+)\}'
         replacement3 = r'\\includegraphics\1{' + media_dir + r'/\2}'
-        content = re.sub(pattern3, replacement3, content)
+        content, count = re.subn(pattern3, replacement3, content)
+        matches += count
     
-    return content
+    return content, matches
 
-def _remove_unwanted_formatting(content: str) -> str:
+def _remove_unwanted_formatting(content: str, triggers: set = None) -> str:
     """
     Remove unwanted highlighting and formatting that causes visual issues.
     """
-    # Remove highlighting commands
-    content = re.sub(r'\\colorbox\{[^}]*\}\{([^}]*)\}', r'\1', content)
-    content = re.sub(r'\\hl\{([^}]*)\}', r'\1', content)
-    content = re.sub(r'\\texthl\{([^}]*)\}', r'\1', content)
-    content = re.sub(r'\\hlc\[[^\]]*\]\{([^}]*)\}', r'\1', content)
-    
-    # Remove table cell coloring
-    content = re.sub(r'\\cellcolor\{[^}]*\}', '', content)
-    content = re.sub(r'\\rowcolor\{[^}]*\}', '', content)
-    content = re.sub(r'\\columncolor\{[^}]*\}', '', content)
-    
-    # Remove text background colors
-    content = re.sub(r'\\textcolor\{[^}]*\}\{([^}]*)\}', r'\1', content)
-    content = re.sub(r'\\color\{[^}]*\}', '', content)
-    
-    # Remove box formatting that might cause highlighting
-    content = re.sub(r'\\fcolorbox\{[^}]*\}\{[^}]*\}\{([^}]*)\}', r'\1', content)
-    content = re.sub(r'\\framebox\[[^\]]*\]\{([^}]*)\}', r'\1', content)
-    
-    # Remove soul package highlighting
-    content = re.sub(r'\\sethlcolor\{[^}]*\}', '', content)
-    content = re.sub(r'\\ul\{([^}]*)\}', r'\1', content)  # Remove underline if causing issues
-    
-    return content
+    return _run_passes(content, _FORMATTING_PASSES, triggers)
+
+# Essential packages for enhanced conversion
+_ENHANCEMENT_PACKAGES = [
+    r'\usepackage{graphicx}',      # For images - ensure it's included
+    r'\usepackage{longtable}',     # For tables
+    r'\usepackage{booktabs}',      # Better table formatting  
+    r'\usepackage{array}',         # Enhanced table formatting
+    r'\usepackage{calc}',          # For calculations
+    r'\usepackage{url}',           # For URLs
+]
+
+# Style enhancement packages
+_STYLE_PACKAGES = [
+    r'\usepackage{float}',         # Better float positioning
+    r'\usepackage{adjustbox}',     # For centering and scaling
+    r'\usepackage{caption}',       # Better caption formatting
+    r'\usepackage{subcaption}',    # For subfigures
+    r'\usepackage{tabularx}',      # Flexible table widths
+    r'\usepackage{enumitem}',      # Better list formatting
+    r'\usepackage{setspace}',      # Line spacing control
+    r'\usepackage{ragged2e}',      # Better text alignment
+    r'\usepackage{amsmath}',       # Mathematical formatting
+    r'\usepackage{amssymb}',       # Mathematical symbols
+    r'\usepackage{needspace}',     # Prevent orphaned lines and improve page breaks
+]
 
 def _inject_latex_packages(content: str) -> str:
     """
     Inject additional LaTeX packages needed for enhanced formatting.
     """
-    # Essential packages for enhanced conversion
-    essential_packages = [
-        r'\usepackage{graphicx}',      # For images - ensure it's included
-        r'\usepackage{longtable}',     # For tables
-        r'\usepackage{booktabs}',      # Better table formatting  
-        r'\usepackage{array}',         # Enhanced table formatting
-        r'\usepackage{calc}',          # For calculations
-        r'\usepackage{url}',           # For URLs
-    ]
-    
-    # Style enhancement packages
-    style_packages = [
-        r'\usepackage{float}',         # Better float positioning
-        r'\usepackage{adjustbox}',     # For centering and scaling
-        r'\usepackage{caption}',       # Better caption formatting
-        r'\usepackage{subcaption}',    # For subfigures
-        r'\usepackage{tabularx}',      # Flexible table widths
-        r'\usepackage{enumitem}',      # Better list formatting
-        r'\usepackage{setspace}',      # Line spacing control
-        r'\usepackage{ragged2e}',      # Better text alignment
-        r'\usepackage{amsmath}',       # Mathematical formatting
-        r'\usepackage{amssymb}',       # Mathematical symbols
-        r'\usepackage{needspace}',     # Prevent orphaned lines and improve page breaks
-    ]
-    
-    all_packages = essential_packages + style_packages
+    return _apply_preamble_pass(_style_packages_pass, content)
+
+def _style_packages_pass(preamble: Preamble, options: 'ConversionOptions', body_tokens: set) -> tuple[Preamble, int]:
+    """
+    Pipeline pass behind _inject_latex_packages().
+
+    Adds the _ENHANCEMENT_PACKAGES and _STYLE_PACKAGES the preamble does not load.
+    """
+    packages_to_insert = []
+    all_packages = _ENHANCEMENT_PACKAGES + _STYLE_PACKAGES
     
     # Find the position after \documentclass but before any existing \usepackage or \begin{document}
-    documentclass_pattern = r'\\documentclass(?:\[[^\]]*\])?\{[^}]+\}'
-    documentclass_match = re.search(documentclass_pattern, content)
+    insert_pos = preamble.documentclass_end()
     
-    if documentclass_match:
-        insert_pos = documentclass_match.end()
-        
+    if insert_pos >= 0:
         # Find the next significant LaTeX command to insert before it
-        # Look for existing \usepackage, \begin{document}, or other commands
-        remaining_content = content[insert_pos:]
-        next_command_match = re.search(r'\\(?:usepackage|begin\{document\}|title|author|date)', remaining_content)
+        # Look for existing \usepackage or other commands
+        next_command_match = _PREAMBLE_COMMAND_PATTERN.search(preamble.text, insert_pos)
         
         if next_command_match:
-            insert_pos += next_command_match.start()
+            insert_pos = next_command_match.start()
+        elif preamble.complete:
+            insert_pos = len(preamble)
         
         # Check which packages are not already included
-        packages_to_insert = []
-        for package in all_packages:
-            package_name = package.replace(r'\usepackage{', '').replace('}', '')
-            if f'usepackage{{{package_name}}}' not in content:
-                packages_to_insert.append(package)
+        packages_to_insert = [package for package in all_packages if not preamble.loads(_first_argument(package))]
         
         if packages_to_insert:
             # Add packages with proper spacing
-            package_block = '\n% Enhanced conversion packages\n' + '\n'.join(packages_to_insert) + '\n\n'
-            content = content[:insert_pos] + package_block + content[insert_pos:]
+            preamble.insert_block(insert_pos, '% Enhanced conversion packages', packages_to_insert, '\n')
     
-    return content
+    return preamble, len(packages_to_insert)
+
+# Commands, environments and characters that need each package the passes
+# above add. With minimal_preamble a package is kept only if the document
+# uses one of them; packages without an entry (the encodings) are always kept.
+_PACKAGE_USAGE = {
+    'graphicx': (
+        r'\includegraphics', r'\rotatebox', r'\scalebox', r'\resizebox', r'\reflectbox',
+        r'\graphicspath', r'\DeclareGraphicsExtensions',
+    ),
+    'longtable': (r'\begin{longtable}', r'\begin{longtable*}'),
+    'booktabs': (r'\toprule', r'\midrule', r'\bottomrule', r'\cmidrule', r'\addlinespace', r'\specialrule'),
+    'hyperref': (
+        r'\href', r'\url', r'\nolinkurl', r'\hyperref', r'\hyperlink', r'\hypertarget', r'\hypersetup',
+        r'\autoref', r'\nameref', r'\phantomsection', r'\pdfbookmark', r'\texorpdfstring',
+        r'\ref', r'\pageref', r'\eqref', r'\tableofcontents',
+    ),
+    'amsmath': (
+        r'\begin{align}', r'\begin{align*}', r'\begin{alignat}', r'\begin{alignat*}',
+        r'\begin{flalign}', r'\begin{flalign*}', r'\begin{gather}', r'\begin{gather*}',
+        r'\begin{multline}', r'\begin{multline*}', r'\begin{equation*}', r'\begin{split}',
+        r'\begin{aligned}', r'\begin{alignedat}', r'\begin{gathered}', r'\begin{cases}',
+        r'\begin{matrix}', r'\begin{pmatrix}', r'\begin{bmatrix}', r'\begin{Bmatrix}',
+        r'\begin{vmatrix}', r'\begin{Vmatrix}', r'\begin{smallmatrix}', r'\begin{subequations}',
+        r'\begin{subarray}', r'\text', r'\tfrac', r'\dfrac', r'\cfrac', r'\genfrac', r'\binom',
+        r'\dbinom', r'\tbinom', r'\operatorname', r'\DeclareMathOperator', r'\eqref', r'\tag',
+        r'\notag', r'\boldsymbol', r'\pmb', r'\overset', r'\underset', r'\sideset', r'\substack',
+        r'\xrightarrow', r'\xleftarrow', r'\overleftrightarrow', r'\underleftarrow',
+        r'\underrightarrow', r'\underleftrightarrow', r'\iint', r'\iiint', r'\iiiint', r'\idotsint',
+        r'\intertext', r'\numberwithin', r'\dotsc', r'\dotsb', r'\dotsm', r'\dotsi', r'\dotso',
+        r'\lvert', r'\rvert', r'\lVert', r'\rVert', r'\implies', r'\impliedby', r'\mspace',
+        r'\dddot', r'\ddddot', r'\varGamma', r'\varDelta', r'\varTheta', r'\varLambda', r'\varXi',
+        r'\varPi', r'\varSigma', r'\varUpsilon', r'\varPhi', r'\varPsi', r'\varOmega',
+        r'\allowdisplaybreaks', r'\hdotsfor', r'\pod', r'\leftroot', r'\uproot', r'\raisetag',
+    ),
+    'amssymb': (
+        r'\mathbb', r'\mathfrak', r'\Bbbk', r'\varnothing', r'\leqslant', r'\geqslant', r'\leqq',
+        r'\geqq', r'\nleq', r'\ngeq', r'\nless', r'\ngtr', r'\lneq', r'\gneq', r'\lneqq', r'\gneqq',
+        r'\lesssim', r'\gtrsim', r'\lessapprox', r'\gtrapprox', r'\lessgtr', r'\gtrless', r'\lll',
+        r'\ggg', r'\eqslantless', r'\eqslantgtr', r'\therefore', r'\because', r'\square',
+        r'\blacksquare', r'\Box', r'\Diamond', r'\checkmark', r'\nexists', r'\complement', r'\mho',
+        r'\beth', r'\gimel', r'\daleth', r'\digamma', r'\varkappa', r'\hslash', r'\eth', r'\Finv',
+        r'\Game', r'\backprime', r'\circledR', r'\circledS', r'\yen', r'\maltese', r'\lozenge',
+        r'\blacklozenge', r'\bigstar', r'\triangleq', r'\approxeq', r'\thicksim', r'\thickapprox',
+        r'\backsim', r'\backsimeq', r'\subsetneq', r'\supsetneq', r'\subsetneqq', r'\supsetneqq',
+        r'\varsubsetneq', r'\varsupsetneq', r'\subseteqq', r'\supseteqq', r'\nsubseteq',
+        r'\nsupseteq', r'\Subset', r'\Supset', r'\sqsubset', r'\sqsupset', r'\ncong', r'\nmid',
+        r'\nparallel', r'\nsim', r'\nvdash', r'\nvDash', r'\nVdash', r'\vDash', r'\Vdash',
+        r'\Vvdash', r'\vartriangleleft', r'\vartriangleright', r'\trianglelefteq',
+        r'\trianglerighteq', r'\ntriangleleft', r'\ntriangleright', r'\lhd', r'\rhd', r'\unlhd',
+        r'\unrhd', r'\ltimes', r'\rtimes', r'\leftleftarrows', r'\rightrightarrows',
+        r'\leftrightarrows', r'\rightleftarrows', r'\twoheadrightarrow', r'\twoheadleftarrow',
+        r'\rightsquigarrow', r'\leftrightsquigarrow', r'\leadsto', r'\Rrightarrow', r'\Lleftarrow',
+        r'\curvearrowright', r'\curvearrowleft', r'\circlearrowleft', r'\circlearrowright',
+        r'\upharpoonright', r'\upharpoonleft', r'\downharpoonright', r'\downharpoonleft',
+        r'\restriction', r'\multimap', r'\nleftarrow', r'\nrightarrow', r'\nLeftarrow',
+        r'\nRightarrow', r'\nleftrightarrow', r'\nLeftrightarrow', r'\dashrightarrow',
+        r'\dashleftarrow', r'\measuredangle', r'\sphericalangle', r'\blacktriangle',
+        r'\blacktriangledown', r'\blacktriangleleft', r'\blacktriangleright', r'\triangledown',
+        r'\vartriangle', r'\diagup', r'\diagdown', r'\ulcorner', r'\urcorner', r'\llcorner',
+        r'\lrcorner', r'\intercal', r'\divideontimes', r'\dotplus', r'\smallsetminus', r'\Cap',
+        r'\Cup', r'\barwedge', r'\veebar', r'\doublebarwedge', r'\curlywedge', r'\curlyvee',
+        r'\boxplus', r'\boxminus', r'\boxtimes', r'\boxdot', r'\circledast', r'\circledcirc',
+        r'\circleddash', r'\centerdot', r'\leftthreetimes', r'\rightthreetimes', r'\precsim',
+        r'\succsim', r'\precapprox', r'\succapprox', r'\preccurlyeq', r'\succcurlyeq',
+        r'\backepsilon', r'\varpropto', r'\between', r'\pitchfork', r'\shortmid', r'\shortparallel',
+        r'\smallsmile', r'\smallfrown', r'\fallingdotseq', r'\risingdotseq', r'\doteqdot',
+        r'\bumpeq', r'\Bumpeq', r'\eqcirc', r'\circeq', r'\lessdot', r'\gtrdot',
+    ),
+    'textcomp': (
+        r'\textdegree', r'\textcelsius', r'\texteuro', r'\textmu', r'\textohm', r'\textonehalf',
+        r'\textonequarter', r'\textthreequarters', r'\texttimes', r'\textdiv', r'\textpm',
+        r'\textminus', r'\textlnot', r'\textcent', r'\textyen', r'\textcurrency', r'\textperthousand',
+        r'\textpertenthousand', r'\textnumero', r'\textmusicalnote', r'\textestimated',
+        r'\textblank', r'\textrecipe', r'\textdiscount', r'\textlbrackdbl', r'\textrbrackdbl',
+        r'\textquotesingle', r'\textasciiacute', r'\textasciidieresis', r'\textasciimacron',
+        r'\textbigcircle', r'\textonesuperior', r'\texttwosuperior', r'\textthreesuperior',
+        r'\textsurd', r'\textfractionsolidus', r'\textinterrobang', r'\textlangle', r'\textrangle',
+        r'\textbaht', r'\textwon', r'\textnaira', r'\textpeso', r'\textlira', r'\textflorin',
+        r'\textdong', r'\textborn', r'\textdied', r'\textmarried', r'\textdivorced', r'\textleaf',
+        '°', '€', 'µ', '½', '¼', '¾', '×', '÷', '±', '¢', '¥', '¤', '‰', '‱', '№', '℃', '¹', '²', '³', '¬',
+    ),
+    'array': (r'\arraybackslash', r'\newcolumntype', r'\firsthline', r'\lasthline', r'\extrarowheight', '>{', '<{'),
+    'calc': (r'\widthof', r'\heightof', r'\depthof', r'\totalheightof', r'\settototalheight', r'\real', r'\ratio'),
+    'url': (r'\url', r'\urlstyle', r'\path', r'\urldef', r'\DeclareUrlCommand'),
+    'float': (
+        r'\floatstyle', r'\restylefloat', r'\newfloat', r'\floatname', r'\floatplacement', r'\listof',
+        r'\begin{figure}[H]', r'\begin{table}[H]',
+    ),
+    'adjustbox': (r'\adjustbox', r'\begin{adjustbox}', r'\adjincludegraphics', r'\adjustimage', r'\adjustboxset'),
+    'caption': (
+        r'\captionsetup', r'\captionof', r'\caption*', r'\DeclareCaptionFormat', r'\DeclareCaptionLabelFormat',
+        r'\DeclareCaptionStyle', r'\ContinuedFloat', r'\clearcaptionsetup',
+    ),
+    'subcaption': (r'\begin{subfigure}', r'\begin{subtable}', r'\subcaption', r'\subcaptionbox', r'\subref'),
+    'tabularx': (r'\begin{tabularx}', r'\tabularxcolumn'),
+    'enumitem': (
+        r'\setlist', r'\newlist', r'\setenumerate', r'\setitemize', r'\setdescription', r'\SetLabelAlign',
+        r'\AddEnumerateCounter', r'\begin{enumerate}[', r'\begin{itemize}[', r'\begin{description}[',
+    ),
+    'setspace': (
+        r'\singlespacing', r'\onehalfspacing', r'\doublespacing', r'\setstretch', r'\SetSinglespace',
+        r'\begin{spacing}', r'\begin{singlespace}', r'\begin{singlespace*}', r'\begin{onehalfspace}',
+        r'\begin{doublespace}',
+    ),
+    'ragged2e': (
+        r'\justifying', r'\RaggedRight', r'\RaggedLeft', r'\Centering', r'\begin{FlushLeft}',
+        r'\begin{FlushRight}', r'\begin{Center}', r'\begin{justify}',
+    ),
+    'needspace': (r'\needspace', r'\Needspace'),
+}
 
-def _add_centering_commands(content: str) -> str:
+def _unused_packages_pass(preamble: Preamble, options: 'ConversionOptions', body_tokens: set) -> tuple[Preamble, int]:
     """
-    Add centering commands to figures and tables.
+    Pipeline pass for minimal_preamble: removes the packages and Unicode
+    definitions added by the passes above that the document does not use.
+
+    body_tokens holds the _USAGE_TOKENS found in the body; the rest of the
+    preamble is searched as well. Returns the number of packages removed.
     """
-    # Add \centering to figure environments
-    content = re.sub(
-        r'(\\begin\{figure\}(?:\[[^\]]*\])?)\s*\n',
-        r'\1\n\\centering\n',
-        content
-    )
+    used = set(body_tokens)
+    _collect_tokens(preamble.text, _USAGE_TOKENS, used)
     
-    # Add \centering to table environments
-    content = re.sub(
-        r'(\\begin\{table\}(?:\[[^\]]*\])?)\s*\n',
-        r'\1\n\\centering\n',
-        content
-    )
+    unused = []
+    dropped = 0
+    for line in preamble.added_lines:
+        argument = _first_argument(line)
+        if line.startswith(r'\DeclareUnicodeCharacter'):
+            if chr(int(argument, 16)) not in used:
+                unused.append(line)
+        elif argument in _PACKAGE_USAGE and used.isdisjoint(_PACKAGE_USAGE[argument]):
+            unused.append(line)
+            dropped += 1
     
-    return content
+    if unused:
+        preamble.remove_lines(unused)
+    return preamble, dropped
+
+def _add_centering_commands(content: str, triggers: set = None) -> str:
+    """
+    Add centering commands to figures and tables.
+    """
+    return _run_passes(content, _CENTERING_PASSES, triggers)
 
-def _fix_line_breaks_and_spacing(content: str) -> str:
+def _fix_line_breaks_and_spacing(content: str, triggers: set = None) -> str:
     """
     Minimal fixes to preserve Word's original formatting and pagination.
+
+    Only critical spacing issues are fixed; Word's original line breaks and
+    spacing are preserved as much as possible. Highlighting and color removal
+    is left to _remove_unwanted_formatting(), which runs afterwards.
     """
-    # Remove unwanted highlighting and color commands
-    content = re.sub(r'\\colorbox\{[^}]*\}\{([^}]*)\}', r'\1', content)
-    content = re.sub(r'\\hl\{([^}]*)\}', r'\1', content)
-    content = re.sub(r'\\texthl\{([^}]*)\}', r'\1', content)
-    content = re.sub(r'\\cellcolor\{[^}]*\}', '', content)
-    content = re.sub(r'\\rowcolor\{[^}]*\}', '', content)
+    return _run_passes(content, _LINE_BREAK_PASSES, triggers)
+
+# --- Pass registry ---
+# Commands the missing definitions pass looks for in the body
+_DEFINITION_TOKENS = (r'\tightlist', r'\euro')
+_USAGE_TOKENS = tuple(dict.fromkeys(
+    [token for tokens in _PACKAGE_USAGE.values() for token in tokens]
+    + [chr(int(_first_argument(definition), 16)) for definition in _UNICODE_DEFINITIONS]
+))
+
+# All post-processing passes, in the order they run
+POST_PROCESSING_PASSES = [
+    # Always inject essential packages for compilation compatibility
+    PostProcessingPass('essential_packages', 'preamble', _essential_packages_pass),
     
-    # Only fix critical spacing issues that break compilation
-    # Preserve Word's original line breaks and spacing as much as possible
+    # Fix mixed mathematical expressions first to remove duplicated text
+    PostProcessingPass('mixed_math', 'body', _mixed_math_pass),
     
-    # Ensure proper spacing around lists but don't change internal spacing
-    content = re.sub(r'\n\\begin\{enumerate\}\n\n', r'\n\n\\begin{enumerate}\n', content)
-    content = re.sub(r'\n\n\\end\{enumerate\}\n', r'\n\\end{enumerate}\n\n', content)
-    content = re.sub(r'\n\\begin\{itemize\}\n\n', r'\n\n\\begin{itemize}\n', content)
-    content = re.sub(r'\n\n\\end\{itemize\}\n', r'\n\\end{itemize}\n\n', content)
+    # Apply overleaf compatibility fixes
+    PostProcessingPass('overleaf_image_paths', 'body', _overleaf_image_paths_pass, enabled=attrgetter('overleaf_compatible')),
     
-    # Minimal section spacing - preserve Word's pagination
-    content = re.sub(r'\n(\\(?:sub)*section\{[^}]+\})\n\n', r'\n\n\1\n\n', content)
+    # Apply style preservation packages
+    PostProcessingPass('style_packages', 'preamble', _style_packages_pass, enabled=attrgetter('preserve_styles')),
     
-    # Only remove excessive spacing (3+ line breaks) but preserve double breaks
-    content = re.sub(r'\n\n\n+', r'\n\n', content)
+    # Body passes: Unicode conversion, centering, line break fixes, formatting
+    # removal and compilation fixes. The visitor passes among them share a
+    # scan of the text, all of them without preserve_linebreaks; with it, the
+    # line break regexes run between the highlight removal and the rest.
+    PostProcessingPass('unicode', 'body', _unicode_pass, visitor=_UNICODE_VISITOR),
+    *_CENTERING_PASSES,
+    *_LINE_BREAK_PASSES,
+    *[
+        replace(formatting_pass, enabled=_without_linebreak_fixes)
+        if formatting_pass.name in _HIGHLIGHT_PASS_NAMES else formatting_pass
+        for formatting_pass in _FORMATTING_PASSES
+    ],
+    *_COMPILATION_PASSES,
     
-    # Ensure proper spacing around figures and tables
-    content = re.sub(r'\n\\begin\{figure\}', r'\n\n\\begin{figure}', content)
-    content = re.sub(r'\\end\{figure\}\n([A-Z])', r'\\end{figure}\n\n\1', content)
-    content = re.sub(r'\n\\begin\{table\}', r'\n\n\\begin{table}', content)
-    content = re.sub(r'\\end\{table\}\n([A-Z])', r'\\end{table}\n\n\1', content)
+    # Define commands the document uses but does not provide
+    PostProcessingPass('missing_definitions', 'preamble', _missing_definitions_pass, tokens=_DEFINITION_TOKENS),
     
-    return content
+    # With minimal_preamble, drop the packages added above that the document does not use
+    PostProcessingPass(
+        'drop_unused_packages', 'preamble', _unused_packages_pass,
+        enabled=attrgetter('minimal_preamble'), tokens=_USAGE_TOKENS
+    ),
+]
+
+# --- Streaming post-processing ---
+_ENVIRONMENT_PATTERN = re.compile(r'\\(begin|end)\{([^}]*)\}')
+_BRACE_PATTERN = re.compile(r'(?<!\\)[{}]')
+
+def _stream_post_processing(latex_path: str, overleaf_compatible: bool, preserve_styles: bool, preserve_linebreaks: bool, extract_media_to_path: str = None, chunk_size: int = STREAM_CHUNK_SIZE, workers: int = 1, pipeline: 'PostProcessingPipeline' = None, minimal_preamble: bool = False, ast_post_processing: bool = False):
+    """
+    Apply post-processing to a .tex file in bounded memory.
+
+    The document is read in chunks from _iter_document_chunks(). The body
+    passes run on each body chunk, which is then written to a temporary file
+    straight away. The preamble chunk is processed last with all passes, so
+    the preamble passes can take the whole body into account, and is then
+    joined with the body into latex_path.
+
+    With workers > 1 the body chunks are processed on a process pool and
+    written back in document order, so the output is the same as with one.
+    """
+    directory = os.path.dirname(os.path.abspath(latex_path))
+    options = ConversionOptions(
+        overleaf_compatible=overleaf_compatible,
+        preserve_styles=preserve_styles,
+        preserve_linebreaks=preserve_linebreaks,
+        extract_media_to_path=extract_media_to_path,
+        minimal_preamble=minimal_preamble,
+        ast_post_processing=ast_post_processing
+    )
+    if pipeline is None:
+        pipeline = PostProcessingPipeline()
+    body_tokens = {}
+    
+    body_fd, body_path = tempfile.mkstemp(suffix='.tex', dir=directory)
+    output_path = None
+    try:
+        with open(latex_path, 'r', encoding='utf-8') as source, os.fdopen(body_fd, 'w', encoding='utf-8') as body:
+            chunks = _iter_document_chunks(source, chunk_size)
+            preamble = next(chunks, '')
+            for chunk, chunk_tokens in _map_body_chunks(chunks, options, pipeline, workers):
+                for name, tokens in chunk_tokens.items():
+                    body_tokens.setdefault(name, set()).update(tokens)
+                body.write(chunk)
+        
+        preamble = pipeline.run(preamble, options, body_tokens)
+        
+        output_fd, output_path = tempfile.mkstemp(suffix='.tex', dir=directory)
+        with os.fdopen(output_fd, 'w', encoding='utf-8') as output, open(body_path, 'r', encoding='utf-8') as body:
+            output.write(preamble)
+            shutil.copyfileobj(body, output, chunk_size)
+        os.replace(output_path, latex_path)
+        output_path = None
+    finally:
+        os.remove(body_path)
+        if output_path:
+            os.remove(output_path)
+
+def _map_body_chunks(chunks, options: ConversionOptions, pipeline: 'PostProcessingPipeline', workers: int):
+    """
+    Yield (processed chunk, body tokens) for each body chunk, in order.
+    """
+    if workers <= 1 and not pipeline.needs_child_process():
+        for chunk in chunks:
+            yield pipeline.run_body(chunk, options)
+        return
+    
+    # Also used with one worker when the pass budget needs a process's main thread
+    with ProcessPoolExecutor(max_workers=max(workers, 1)) as executor:
+        # Bounded window of chunks in flight keeps memory bounded as well
+        in_flight = deque()
+        
+        def next_result():
+            chunk, chunk_tokens, stats = in_flight.popleft().result()
+            pipeline.merge_stats(stats)
+            return chunk, chunk_tokens
+        
+        for chunk in chunks:
+            in_flight.append(executor.submit(
+                _post_process_body_chunk, chunk, options, pipeline.passes, pipeline.disabled, pipeline.pass_budget
+            ))
+            if len(in_flight) >= workers * 2:
+                yield next_result()
+        while in_flight:
+            yield next_result()
+
+def _post_process_body_chunk(chunk: str, options: ConversionOptions, passes: list, disabled: set, pass_budget: float = None) -> tuple:
+    """
+    Process pool entry point: run the body passes on one chunk.
+
+    Returns the processed chunk, its body tokens and the pass statistics.
+    """
+    pipeline = PostProcessingPipeline(passes, disabled, pass_budget)
+    chunk, body_tokens = pipeline.run_body(chunk, options)
+    return chunk, body_tokens, list(pipeline.stats.values())
+
+def _post_process_document(content: str, options: ConversionOptions, passes: list, disabled: set, pass_budget: float, body_tokens: dict) -> tuple:
+    """
+    Process pool entry point: run all passes on a document or preamble chunk.
+
+    Returns the processed content and the pass statistics.
+    """
+    pipeline = PostProcessingPipeline(passes, disabled, pass_budget)
+    content = pipeline.run(content, options, body_tokens)
+    return content, list(pipeline.stats.values())
+
+# Commands, environments and non-ASCII characters, as _collect_tokens() scans for them
+_TOKEN_SCAN_PATTERN = re.compile(r'\\(?:begin\{[^{}\n]*\}|[A-Za-z]+)|[^\x00-\x7f]')
+# Searching for each token is faster for short token lists
+_TOKEN_SCAN_MIN_TOKENS = 16
+
+def _iter_document_chunks(lines, chunk_size: int = STREAM_CHUNK_SIZE):
+    r"""
+    Split a LaTeX document into chunks that can be post-processed separately.
+
+    The first chunk is the preamble, up to the first cut after
+    \begin{document}; later chunks are about chunk_size characters. Cuts are
+    only made where no pass can match across them: after a single blank line
+    outside any environment or brace group, before a line starting with a
+    letter or digit. Without \begin{document} the whole document is one chunk.
+    """
+    chunk = []
+    size = 0
+    limit = 0
+    in_body = False
+    environment_depth = 0
+    brace_depth = 0
+    previous_line = before_previous_line = ''
+    
+    for line in lines:
+        if (in_body and size >= limit and environment_depth == 0 and brace_depth == 0
+                and previous_line == '\n' and before_previous_line not in ('', '\n')
+                and line[:1].isalnum()):
+            yield ''.join(chunk)
+            chunk = []
+            size = 0
+            limit = chunk_size
+        
+        chunk.append(line)
+        size += len(line)
+        before_previous_line, previous_line = previous_line, line
+        
+        if '\\begin' in line or '\\end' in line:
+            for kind, name in _ENVIRONMENT_PATTERN.findall(line):
+                if name == 'document':
+                    in_body = in_body or kind == 'begin'
+                elif kind == 'begin':
+                    environment_depth += 1
+                elif environment_depth:
+                    environment_depth -= 1
+        if '{' in line or '}' in line:
+            for brace in _BRACE_PATTERN.findall(line):
+                brace_depth = brace_depth + 1 if brace == '{' else max(brace_depth - 1, 0)
+    
+    if chunk:
+        yield ''.join(chunk)
+
+def _collect_tokens(content: str, tokens: tuple, found: set):
+    """
+    Add the tokens that occur in content to found.
+
+    Long token lists (such as _USAGE_TOKENS) are matched in one scan for
+    commands, environments and non-ASCII characters, which matches command
+    tokens as whole names; other tokens are searched for as substrings.
+    """
+    missing = [token for token in tokens if token not in found]
+    if len(missing) >= _TOKEN_SCAN_MIN_TOKENS:
+        found.update(set(_TOKEN_SCAN_PATTERN.findall(content)).intersection(missing))
+        missing = [token for token in missing if not _TOKEN_SCAN_PATTERN.fullmatch(token)]
+    for token in missing:
+        if token in content:
+            found.add(token)
 
 if __name__ == '__main__':
     from docx import Document
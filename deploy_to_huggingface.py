@@ -18,6 +18,15 @@ def create_deployment_package():
         'app.py',
         'web_api.py', 
         'converter.py',
+        'pandoc_server.py',
+        'conversion_cache.py',
+        'docx_sections.py',
+        'latex_preamble.py',
+        'latex_tokens.py',
+        'docx_media.py',
+        'media_store.py',
+        'linebreak_filter.lua',
+        'postprocess_filter.lua',
         'requirements.txt',
         'README.md',
         'Dockerfile',
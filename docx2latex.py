@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Command-line DOCX to LaTeX converter.
+
+Converts a single document, or every document of a directory on a process
+pool. Each subcommand imports only the modules it needs, so the script is
+cheap to call from shell pipelines and cron jobs; --timings prints where
+the time went (to stderr).
+
+Usage:
+    python docx2latex.py convert thesis.docx [-o thesis.tex] [--overleaf] [--extract-media]
+    python docx2latex.py convert - -o - < thesis.docx > thesis.tex
+    python docx2latex.py convert thesis.docx --pandoc-workers 4
+    python docx2latex.py batch documents/ [-o latex/] [--recursive] [--workers N]
+    python docx2latex.py check
+
+Exit status is 0 on success, 1 if a conversion failed (or, for check, if
+pandoc or the Lua filters are unusable) and 2 for invalid arguments.
+"""
+
+import time
+
+# CPU time the interpreter took to start, and the wall clock from here on
+_INTERPRETER_SECONDS = time.process_time()
+_STARTED = time.perf_counter()
+
+import argparse
+import os
+import sys
+
+
+class Timings:
+    """
+    Phases of a run, printed to stderr with --timings.
+    """
+
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self.phases = [('interpreter', _INTERPRETER_SECONDS, 'CPU time before the script ran')]
+        self._last = _STARTED
+
+    def mark(self, phase: str, note: str = ''):
+        """Record the time since the previous mark as phase."""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last, note))
+        self._last = now
+
+    def report(self):
+        if not self.enabled:
+            return
+        self.phases.append(('total', _INTERPRETER_SECONDS + time.perf_counter() - _STARTED, ''))
+        for phase, seconds, note in self.phases:
+            print(f"{phase:<12} {seconds * 1000:>9.1f} ms  {note}".rstrip(), file=sys.stderr)
+
+
+def conversion_options(args):
+    """
+    The ConversionOptions the conversion arguments select.
+    """
+    from converter import ConversionOptions
+
+    return ConversionOptions(
+        generate_toc=args.toc,
+        overleaf_compatible=args.overleaf,
+        preserve_styles=not args.no_styles,
+        preserve_linebreaks=not args.no_linebreaks,
+        latex_template_path=os.path.abspath(args.template) if args.template else None,
+        minimal_preamble=args.minimal_preamble,
+        ast_post_processing=args.ast_post_processing,
+    )
+
+
+def media_optimizer(args):
+    if not args.optimize_images:
+        return None
+    from docx_media import MediaOptimizer
+
+    return MediaOptimizer()
+
+
+def media_path(latex_path: str) -> str:
+    """
+    Media directory of a .tex file: <name>_media next to it, as the web API names it.
+    """
+    return os.path.splitext(latex_path)[0] + '_media'
+
+
+def run_convert(args, timings: Timings) -> int:
+    if args.input != '-' and not os.path.isfile(args.input):
+        print(f"docx2latex: no such file: {args.input}", file=sys.stderr)
+        return 2
+    to_stdout = args.output == '-' or (args.output is None and args.input == '-')
+    if args.extract_media and to_stdout:
+        print("docx2latex: --extract-media needs an output file", file=sys.stderr)
+        return 2
+    if args.pandoc_workers > 1 and (to_stdout or args.input == '-'):
+        print("docx2latex: --pandoc-workers needs an input and an output file", file=sys.stderr)
+        return 2
+
+    from dataclasses import replace
+
+    from converter import Converter
+
+    timings.mark('imports', 'converter')
+    latex_path = None if to_stdout else args.output or os.path.splitext(args.input)[0] + '.tex'
+    options = conversion_options(args)
+    if args.extract_media:
+        options = replace(options, extract_media_to_path=os.path.abspath(media_path(latex_path)))
+
+    try:
+        converter = Converter(options, media_optimizer=media_optimizer(args), pandoc_workers=args.pandoc_workers)
+    except RuntimeError as e:
+        print(f"docx2latex: {e}", file=sys.stderr)
+        return 1
+    timings.mark('setup', f"pandoc {converter.pandoc_version}")
+
+    if args.input == '-' or to_stdout:
+        if args.input == '-':
+            data = sys.stdin.buffer.read()
+        else:
+            with open(args.input, 'rb') as f:
+                data = f.read()
+        result = converter.convert_bytes(data)
+        success, message = result.success, result.message
+        if success and latex_path:
+            with open(latex_path, 'w', encoding='utf-8') as f:
+                f.write(result.latex)
+        elif success:
+            sys.stdout.write(result.latex)
+            sys.stdout.flush()
+    else:
+        success, message = converter.convert(args.input, latex_path)
+
+    post_processing = sum(stats.seconds for stats in converter.pipeline.stats.values())
+    timings.mark('conversion', f"{args.input} (post-processing {post_processing * 1000:.1f} ms)")
+    if not success:
+        print(f"docx2latex: {args.input}: {message}", file=sys.stderr)
+    return 0 if success else 1
+
+
+def find_documents(directory: str, recursive: bool) -> list:
+    """
+    .docx files of directory, without Word's ~$ lock files.
+    """
+    documents = []
+    for root, dirs, names in os.walk(directory):
+        dirs.sort()
+        documents.extend(
+            os.path.join(root, name) for name in sorted(names)
+            if name.lower().endswith('.docx') and not name.startswith('~$')
+        )
+        if not recursive:
+            break
+    return documents
+
+
+def run_batch(args, timings: Timings) -> int:
+    if not os.path.isdir(args.directory):
+        print(f"docx2latex: not a directory: {args.directory}", file=sys.stderr)
+        return 2
+
+    from dataclasses import asdict
+
+    from converter import convert_many
+
+    timings.mark('imports', 'converter')
+    output_dir = args.output or args.directory
+    options = asdict(conversion_options(args))
+    optimizer = media_optimizer(args)
+
+    jobs = []
+    for docx_path in find_documents(args.directory, args.recursive):
+        latex_path = os.path.join(output_dir, os.path.splitext(os.path.relpath(docx_path, args.directory))[0] + '.tex')
+        os.makedirs(os.path.dirname(latex_path) or '.', exist_ok=True)
+        job = dict(options, docx_path=docx_path, latex_path=latex_path)
+        if args.extract_media:
+            job['extract_media_to_path'] = os.path.abspath(media_path(latex_path))
+        if optimizer:
+            job['media_optimizer'] = optimizer
+        jobs.append(job)
+
+    failed = 0
+    for job, success, message in convert_many(jobs, max_workers=args.workers):
+        if success:
+            print(f"ok      {job['docx_path']} -> {job['latex_path']}")
+        else:
+            failed += 1
+            print(f"FAILED  {job['docx_path']}: {message}")
+        sys.stdout.flush()
+
+    timings.mark('conversion', f"{len(jobs)} documents, {failed} failed")
+    return 1 if failed else 0
+
+
+def run_check(args, timings: Timings) -> int:
+    from converter import LINEBREAK_FILTER_PATH, POSTPROCESS_FILTER_PATH, Converter
+
+    timings.mark('imports', 'converter')
+    try:
+        converter = Converter()
+    except RuntimeError as e:
+        print(f"docx2latex: {e}", file=sys.stderr)
+        return 1
+    timings.mark('setup', f"pandoc {converter.pandoc_version}")
+    print(f"pandoc {converter.pandoc_version} at {converter.pandoc_path}")
+    for filter_path in (LINEBREAK_FILTER_PATH, POSTPROCESS_FILTER_PATH):
+        print(f"Lua filter {filter_path}")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--timings', action='store_true', help="print startup and conversion timing to stderr")
+
+    conversion = argparse.ArgumentParser(add_help=False)
+    conversion.add_argument('--toc', action='store_true', help="generate a table of contents")
+    conversion.add_argument('--overleaf', action='store_true', help="make the output Overleaf compatible")
+    conversion.add_argument('--no-styles', action='store_true', help="do not preserve document styles")
+    conversion.add_argument('--no-linebreaks', action='store_true', help="do not preserve line breaks")
+    conversion.add_argument('--template', metavar='PATH', help="custom LaTeX template")
+    conversion.add_argument('--minimal-preamble', action='store_true', help="keep only the added packages the document uses")
+    conversion.add_argument('--ast-post-processing', action='store_true', help="post-process with the Lua filter on pandoc's AST")
+    conversion.add_argument('--extract-media', action='store_true', help="write images to <output name>_media next to the .tex file")
+    conversion.add_argument('--optimize-images', action='store_true', help="downscale and recompress extracted images")
+
+    parser = argparse.ArgumentParser(prog='docx2latex', description=__doc__.strip().splitlines()[0])
+    subcommands = parser.add_subparsers(dest='command', required=True)
+
+    convert = subcommands.add_parser('convert', parents=[common, conversion], help="convert one document")
+    convert.add_argument('input', help=".docx file, or - for standard input")
+    convert.add_argument('-o', '--output', help=".tex file, or - for standard output (default: input name with .tex)")
+    convert.add_argument('--pandoc-workers', type=int, default=1, metavar='N',
+                         help="convert parts of the document with N pandoc processes in parallel")
+    convert.set_defaults(run=run_convert)
+
+    batch = subcommands.add_parser('batch', parents=[common, conversion], help="convert every document of a directory")
+    batch.add_argument('directory', help="directory with .docx files")
+    batch.add_argument('-o', '--output', metavar='DIRECTORY', help="directory for the .tex files (default: next to the documents)")
+    batch.add_argument('-r', '--recursive', action='store_true', help="include subdirectories")
+    batch.add_argument('--workers', type=int, help="worker processes (default: CPU count)")
+    batch.set_defaults(run=run_batch)
+
+    check = subcommands.add_parser('check', parents=[common], help="check that pandoc and the Lua filters are usable")
+    check.set_defaults(run=run_check)
+    return parser
+
+
+def main(argv: list = None) -> int:
+    args = build_parser().parse_args(argv)
+    timings = Timings(args.timings)
+    timings.mark('startup', 'arguments parsed')
+    try:
+        return args.run(args, timings)
+    finally:
+        timings.report()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,386 @@
+"""
+Media extraction straight from the DOCX archive.
+
+pandoc's --extract-media writes every image one after the other while the
+document is converted. Here the images a conversion references (pandoc names
+them after their archive member, e.g. ``media/image1.png`` for
+``word/media/image1.png``) are read from the archive and written by a thread
+pool; inflating releases the GIL, so large images are extracted in parallel.
+
+Targets come from the document, so they are normalized first; one that
+would land outside the extraction directory (absolute, or climbing out with
+``..``) is written under a hash of its name in ``media/`` instead, as pandoc
+does.
+
+Images with identical bytes are written once. Candidates are found from the
+CRC-32 and size in the archive's central directory, so only members that
+share both are read and hashed. The returned name map points every
+reference at the file that holds its bytes, so the LaTeX can be written
+with final image paths directly.
+
+MediaOptimizer is an optional second stage that downscales images to a
+maximum resolution at their printed size, recompresses them and converts
+formats pdflatex cannot include to PNG.
+"""
+
+import hashlib
+import io
+import os
+import posixpath
+import time
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+
+# Archive directory pandoc's media names are relative to
+_MEDIA_ROOT = 'word/'
+
+DEFAULT_MAX_DPI = 300
+DEFAULT_JPEG_QUALITY = 85
+
+# Formats MediaOptimizer rewrites; BMP and TIFF become PNG
+_OPTIMIZED_FORMATS = ('PNG', 'JPEG', 'BMP', 'TIFF')
+_PNG_MODES = ('1', 'L', 'LA', 'P', 'RGB', 'RGBA', 'I', 'I;16')
+
+# Resampling an image by less than this costs sharpness for little gain
+_MIN_DOWNSCALE = 0.9
+
+
+def extract_media(docx, targets, extract_media_to_path: str, max_workers: int = None) -> dict:
+    """
+    Write the referenced images below extract_media_to_path.
+
+    Files land where --extract-media would put them (e.g.
+    ``<extract_media_to_path>/media/image1.png``), except that duplicates of an
+    earlier image are not written.
+
+    Args:
+        docx: Path to the .docx file, or its contents as bytes.
+        targets: Image names as pandoc references them, e.g. "media/image1.png".
+        extract_media_to_path: Directory to write the images below.
+        max_workers: Number of writer threads; defaults to ThreadPoolExecutor's.
+
+    Returns:
+        A dict mapping each target to the name of the written file holding its
+        bytes (the normalized target, unless it duplicates an earlier one or is
+        unsafe to write).
+
+    Raises:
+        KeyError: If a target is missing from the archive.
+    """
+    name_map, _ = _collect_media(docx, targets, extract_media_to_path, False, max_workers)
+    return name_map
+
+
+def read_media(docx, targets, max_workers: int = None) -> tuple:
+    """
+    Read the referenced images into memory, with duplicates resolved as in extract_media().
+
+    Returns:
+        A tuple (name_map, media), where media maps every distinct name in
+        name_map's values to the image bytes.
+    """
+    return _collect_media(docx, targets, None, True, max_workers)
+
+
+def write_media(media: dict, extract_media_to_path: str, max_workers: int = None):
+    """
+    Write a media manifest (name -> bytes) below a directory, as extract_media() lays it out.
+
+    Raises:
+        ValueError: If a name is not a normalized path inside the directory.
+    """
+    for directory in {os.path.dirname(_destination(extract_media_to_path, name)) for name in media}:
+        os.makedirs(directory, exist_ok=True)
+
+    def write(item: tuple):
+        _write_file(_destination(extract_media_to_path, item[0]), item[1])
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(write, media.items()))
+
+
+def _collect_media(docx, targets, extract_media_to_path: str, keep_data: bool, max_workers: int) -> tuple:
+    targets = list(dict.fromkeys(targets))
+    if not targets:
+        return {}, {}
+
+    names, taken = {}, set()
+    for target in targets:
+        name = _safe_name(target)
+        # Targets such as media/a.png and media/./a.png must not share a file
+        if name in taken:
+            name = _hashed_name(target)
+        taken.add(name)
+        names[target] = name
+
+    source = io.BytesIO(docx) if isinstance(docx, (bytes, bytearray)) else docx
+    with zipfile.ZipFile(source) as archive:
+        groups = {}
+        for target in targets:
+            info = archive.getinfo(_MEDIA_ROOT + target)
+            groups.setdefault((info.CRC, info.file_size), []).append(target)
+
+        if extract_media_to_path:
+            for directory in {os.path.dirname(_destination(extract_media_to_path, name)) for name in names.values()}:
+                os.makedirs(directory, exist_ok=True)
+
+        def process(group: list) -> tuple:
+            return _process_group(archive, group, names, extract_media_to_path, keep_data)
+
+        if len(groups) == 1:
+            results = [process(group) for group in groups.values()]
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                results = list(executor.map(process, groups.values()))
+
+    name_map, media = {}, {}
+    for group_map, group_media in results:
+        name_map.update(group_map)
+        media.update(group_media)
+    return name_map, media
+
+
+def _process_group(archive: zipfile.ZipFile, group: list, names: dict, extract_media_to_path: str, keep_data: bool) -> tuple:
+    """
+    Extract the members of one (CRC-32, size) group; the first member with given bytes is kept.
+    """
+    name_map, media, written = {}, {}, {}
+    for target in group:
+        data = archive.read(_MEDIA_ROOT + target)
+        # A lone member cannot be a duplicate, so it is not hashed
+        digest = hashlib.sha256(data).digest() if len(group) > 1 else None
+        if digest in written:
+            name_map[target] = written[digest]
+            continue
+        name = names[target]
+        written[digest] = name
+        name_map[target] = name
+        if extract_media_to_path:
+            _write_file(_destination(extract_media_to_path, name), data)
+        if keep_data:
+            media[name] = data
+    return name_map, media
+
+
+def _safe_name(target: str) -> str:
+    """
+    Normalized target, or a hashed name if it would leave the extraction directory.
+    """
+    name = posixpath.normpath(target)
+    if posixpath.isabs(name) or name in ('.', '..') or name.startswith('../') or '\\' in name or ':' in name:
+        return _hashed_name(target)
+    return name
+
+
+def _hashed_name(target: str) -> str:
+    extension = posixpath.splitext(target)[1]
+    if not extension[1:].isalnum():
+        extension = ''
+    return 'media/' + hashlib.sha1(target.encode('utf-8')).hexdigest() + extension
+
+
+def _destination(extract_media_to_path: str, name: str) -> str:
+    if _safe_name(name) != name:
+        raise ValueError(f"Media name {name!r} is not a normalized path inside the extraction directory")
+    return os.path.join(extract_media_to_path, *name.split('/'))
+
+
+def _write_file(path: str, data: bytes):
+    # Replaced rather than overwritten: an existing file may be a hardlink shared
+    # with other directories (see media_store)
+    staging_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(staging_path, 'wb') as f:
+        f.write(data)
+    os.replace(staging_path, path)
+
+
+@dataclass
+class MediaOptimizationStats:
+    """Totals of one MediaOptimizer run, i.e. of one document."""
+    images: int = 0
+    optimized: int = 0
+    bytes_before: int = 0
+    bytes_after: int = 0
+    seconds: float = 0.0
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.bytes_before - self.bytes_after
+
+
+class MediaOptimizer:
+    """
+    Downscales and recompresses extracted images.
+
+    Images with more than max_dpi pixels per inch at the size they are printed
+    at are downscaled. PNG and JPEG images are recompressed and kept only if
+    that makes them smaller; BMP and TIFF images, which pdflatex cannot
+    include, are converted to PNG. Other formats are left alone. Images are
+    processed in a process pool; after each run the stats attribute holds the
+    totals for that document.
+    """
+
+    def __init__(self, max_dpi: int = DEFAULT_MAX_DPI, jpeg_quality: int = DEFAULT_JPEG_QUALITY, workers: int = None):
+        self.max_dpi = max_dpi
+        self.jpeg_quality = jpeg_quality
+        self.workers = workers
+        self.stats = MediaOptimizationStats()
+
+    @property
+    def key(self) -> list:
+        """The settings that affect the output, e.g. for cache keys."""
+        return [self.max_dpi, self.jpeg_quality]
+
+    def optimize(self, media: dict, printed_sizes: dict = None) -> tuple:
+        """
+        Optimize an in-memory media manifest.
+
+        Args:
+            media: Maps image names (e.g. "media/image1.png") to their bytes.
+            printed_sizes: Maps image names to a list with the printed
+                (width, height) in inches of each reference, either of which
+                may be None. Images with a reference of unknown size are
+                recompressed but not downscaled.
+
+        Returns:
+            A tuple (renamed, media): renamed maps the names of converted
+            images to their new names, media is the optimized manifest.
+        """
+        start = time.perf_counter()
+        printed_sizes = printed_sizes or {}
+        names = list(media)
+        jobs = [(media[name], printed_sizes.get(name, ()), self.max_dpi, self.jpeg_quality) for name in names]
+        if self.workers == 1 or len(jobs) < 2:
+            results = [_optimize_image(*job) for job in jobs]
+        else:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                results = list(executor.map(_optimize_image, *zip(*jobs)))
+
+        renamed, optimized = {}, {}
+        taken = set(names)
+        stats = MediaOptimizationStats(images=len(names))
+        for name, (image_format, data) in zip(names, results):
+            stats.bytes_before += len(media[name])
+            if data is None:
+                optimized[name] = media[name]
+            else:
+                stats.optimized += 1
+                new_name = _renamed(name, image_format, taken)
+                if new_name != name:
+                    renamed[name] = new_name
+                    taken.add(new_name)
+                optimized[new_name] = data
+        stats.bytes_after = sum(len(data) for data in optimized.values())
+        stats.seconds = time.perf_counter() - start
+        self.stats = stats
+        return renamed, optimized
+
+    def optimize_directory(self, extract_media_to_path: str, printed_sizes: dict) -> dict:
+        """
+        Optimize images written by extract_media(), in place.
+
+        printed_sizes is keyed by the written names, as in optimize(), and
+        selects the images to process. Returns the renamed map.
+        """
+        media = {}
+        for name in printed_sizes:
+            with open(_destination(extract_media_to_path, name), 'rb') as f:
+                media[name] = f.read()
+        renamed, optimized = self.optimize(media, printed_sizes)
+
+        write_media(
+            {name: data for name, data in optimized.items() if media.get(name) is not data},
+            extract_media_to_path
+        )
+        for name in renamed:
+            os.remove(_destination(extract_media_to_path, name))
+        return renamed
+
+
+def _renamed(name: str, image_format: str, taken: set) -> str:
+    """
+    Name of an optimized image; converted images get a .png name that is not taken yet.
+    """
+    stem, extension = posixpath.splitext(name)
+    if image_format != 'PNG' or extension.lower() == '.png':
+        return name
+    new_name = stem + '.png'
+    if new_name in taken:
+        new_name = f'{stem}-{extension[1:].lower()}.png'
+    return new_name
+
+
+def _downscale_factor(size: tuple, printed: list, max_dpi: int) -> float:
+    """
+    Scale that brings an image down to max_dpi at the largest size it is printed at.
+    """
+    if not printed:
+        return 1.0
+    width_px, height_px = size
+    factor = 0.0
+    for width, height in printed:
+        if width is None and height is None:
+            return 1.0
+        factor = max(
+            factor,
+            width * max_dpi / width_px if width else 0.0,
+            height * max_dpi / height_px if height else 0.0
+        )
+    return factor if factor < _MIN_DOWNSCALE else 1.0
+
+
+def _optimize_image(data: bytes, printed: list, max_dpi: int, jpeg_quality: int) -> tuple:
+    """
+    Process pool entry point for MediaOptimizer: returns (format, bytes), or
+    (None, None) if the image is best left unchanged.
+    """
+    # Imported here: PIL is only needed once there is an image to optimize
+    from PIL import Image
+
+    try:
+        image = Image.open(io.BytesIO(data))
+        source_format = image.format
+        if source_format not in _OPTIMIZED_FORMATS:
+            return None, None
+        image.load()
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None, None
+
+    image_format = 'JPEG' if source_format == 'JPEG' else 'PNG'
+    info = image.info
+    mode = image.mode
+    options = {'optimize': True}
+    if info.get('icc_profile'):
+        options['icc_profile'] = info['icc_profile']
+
+    factor = _downscale_factor(image.size, printed, max_dpi)
+    if factor < 1.0:
+        if image.mode in ('1', 'P'):
+            image = image.convert('RGBA' if 'transparency' in info else 'RGB')
+        image = image.resize(
+            (max(1, round(image.width * factor)), max(1, round(image.height * factor))),
+            Image.LANCZOS
+        )
+    if image_format == 'PNG' and image.mode not in _PNG_MODES:
+        image = image.convert('RGBA' if 'A' in image.mode else 'RGB')
+
+    if info.get('dpi'):
+        options['dpi'] = info['dpi']
+    if image_format == 'JPEG':
+        options.update(quality=jpeg_quality, progressive=True)
+        if info.get('exif'):
+            options['exif'] = info['exif']
+    elif image.mode == mode and 'transparency' in info:
+        options['transparency'] = info['transparency']
+
+    output = io.BytesIO()
+    try:
+        image.save(output, image_format, **options)
+    except (OSError, ValueError):
+        return None, None
+    optimized = output.getvalue()
+    if source_format == image_format and len(optimized) >= len(data):
+        return None, None
+    return image_format, optimized
@@ -0,0 +1,437 @@
+"""
+Section fingerprints of DOCX documents, for incremental conversion.
+
+The top-level blocks of ``word/document.xml`` are grouped into sections: a
+section starts at a top-level heading paragraph (together with bookmark-only
+paragraphs right before it) and runs up to the next one. Each section gets a
+fingerprint of its XML and of the list numbering it continues from earlier
+blocks, so a section converts to the same LaTeX whenever its fingerprint and
+the document's global fingerprint are unchanged.
+
+The global fingerprint covers everything a section's conversion can depend
+on besides its own blocks: the blocks before the first heading (which hold
+the title metadata), every section heading (heading identifiers and internal
+links), the body's section properties and the package parts pandoc reads.
+
+build_marked_docx() writes a DOCX with some sections wrapped in marker
+paragraphs, so their LaTeX can be cut out of pandoc's output. The other
+sections contribute only what those sections depend on: their headings and
+the list items numbered in the same lists, and the paragraphs that link to
+their bookmarks (pandoc drops bookmarks nothing links to).
+"""
+
+import hashlib
+import io
+import posixpath
+import re
+import zipfile
+from dataclasses import dataclass, field
+
+_MAIN_NAMESPACE = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+
+# Parts that do not affect pandoc's output, or that Word rewrites on every save
+_IGNORED_PARTS = ('word/document.xml', 'word/settings.xml', 'word/webSettings.xml', 'docProps/app.xml')
+_IGNORED_PREFIXES = ('word/media/', 'customXml/')
+
+# Revision ids change whenever Word saves a paragraph, without changing content
+_VOLATILE_ATTRIBUTE_PATTERN = re.compile(r'\s[\w-]+:(?:rsid\w*|paraId|textId)="[^"]*"')
+_VOLATILE_CORE_PATTERN = re.compile(r'<(dcterms:modified|cp:revision|cp:lastModifiedBy)\b[^>]*>.*?</\1>', re.S)
+
+# Start, end and empty tags; comments, processing instructions and CDATA match without a name
+_TAG_PATTERN = re.compile(
+    r'<(?:!--.*?--|!\[CDATA\[.*?\]\]|\?.*?\?|(/?)([^\s/>!?]+)(?:[^>"\']|"[^"]*"|\'[^\']*\')*?(/?))>',
+    re.S
+)
+_ATTRIBUTE_PATTERN = re.compile(r'([\w:.-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+_HEADING_NAME_PATTERN = re.compile(r'heading [1-9]$', re.I)
+_RELATIONSHIP_PATTERN = re.compile(r'<Relationship\b[^>]*>')
+_RELATIONSHIP_ID_PATTERN = re.compile(r'\br:(?:embed|id|link|pict)="([^"]+)"')
+_BOOKMARK_PATTERN = re.compile(r':bookmarkStart\b[^>]*?\s[\w-]+:name="([^"]+)"')
+# Internal hyperlinks, and fields that refer to a bookmark
+_BOOKMARK_REFERENCE_PATTERN = re.compile(r'\s[\w-]+:anchor="([^"]+)"|\b(?:PAGEREF|REF|HYPERLINK\s+\\l)\s+"?([^\s"\\<]+)')
+
+
+@dataclass
+class Block:
+    """A top-level element of the document body."""
+    xml: str
+    heading: bool = False
+    # Bookmark-only paragraph, which pandoc merges into a following heading
+    anchor: bool = False
+    # (num_id, level) of each list item in the block
+    list_items: list = field(default_factory=list)
+    # Open minus closed complex fields
+    field_balance: int = 0
+    # Names of the bookmarks the block sets and of those it links to
+    bookmarks: set = field(default_factory=set)
+    references: set = field(default_factory=set)
+
+
+@dataclass
+class Section:
+    """Blocks from one heading up to the next one."""
+    blocks: list
+    # Leading blocks that belong to the global fingerprint
+    head_length: int
+    fingerprint: str = ''
+    num_ids: set = field(default_factory=set)
+
+    @property
+    def head(self) -> list:
+        return self.blocks[:self.head_length]
+
+
+@dataclass
+class DocxSections:
+    """A DOCX body split into sections."""
+    prefix: str
+    front: list
+    sections: list
+    suffix: str
+    # Element name of the main namespace, e.g. 'w'
+    namespace: str
+    global_fingerprint: str
+
+
+def split_docx(docx_bytes: bytes) -> DocxSections:
+    """
+    Split a DOCX document into sections and fingerprint them.
+
+    Raises ValueError for documents whose body cannot be split, e.g. when the
+    main document part is missing or uses an unexpected namespace.
+    """
+    try:
+        with zipfile.ZipFile(io.BytesIO(docx_bytes)) as archive:
+            document_xml = archive.read('word/document.xml').decode('utf-8')
+            styles_xml = _read_optional(archive, 'word/styles.xml')
+            package_hash = _package_hash(archive)
+    except (KeyError, zipfile.BadZipFile, UnicodeDecodeError) as e:
+        raise ValueError(f"Not a readable DOCX document: {e}")
+
+    namespace_match = re.search(r'xmlns:([\w-]+)="' + re.escape(_MAIN_NAMESPACE) + '"', document_xml)
+    if not namespace_match:
+        raise ValueError("Main document part does not use the WordprocessingML namespace")
+    w = namespace_match.group(1)
+
+    body_open = re.search(f'<{w}:body\\b[^>]*>', document_xml)
+    body_close = document_xml.rfind(f'</{w}:body>')
+    if not body_open or body_close < body_open.end():
+        raise ValueError("Main document part has no body")
+
+    styles = _paragraph_styles(styles_xml, w)
+    blocks = [
+        _classify(xml, w, styles)
+        for xml in _top_level_elements(document_xml, body_open.end(), body_close)
+    ]
+
+    # The final section properties stay in place after the last section
+    trailer = []
+    while blocks and blocks[-1].xml.startswith(f'<{w}:sectPr'):
+        trailer.insert(0, blocks.pop())
+
+    front, sections = _group_sections(blocks)
+    _fingerprint_sections(front, sections)
+
+    global_hash = hashlib.sha256(package_hash.encode('ascii'))
+    for xml in [document_xml[:body_open.end()], document_xml[body_close:]]:
+        global_hash.update(_normalize(xml).encode('utf-8'))
+    for block in front + [block for section in sections for block in section.head] + trailer:
+        global_hash.update(b'\x00' + _normalize(block.xml).encode('utf-8'))
+
+    return DocxSections(
+        prefix=document_xml[:body_open.end()],
+        front=front,
+        sections=sections,
+        suffix=''.join(block.xml for block in trailer) + document_xml[body_close:],
+        namespace=w,
+        global_fingerprint=global_hash.hexdigest()
+    )
+
+
+def document_marker(docx_bytes: bytes) -> str:
+    """
+    Prefix of the section markers of a document. Derived from the document
+    itself, so its text cannot contain the marker.
+    """
+    return 'docxsection' + hashlib.sha256(docx_bytes).hexdigest()[:16]
+
+
+def section_marker(marker: str, index: int, end: bool = False) -> str:
+    """Text of the marker paragraph before (or after) section ``index``."""
+    return f"{marker}{'E' if end else 'S'}{index}"
+
+
+def build_marked_docx(
+    docx_bytes: bytes,
+    split: DocxSections,
+    marker: str,
+    selected: list = None,
+    keep_front: bool = False
+) -> bytes:
+    """
+    Write a DOCX in which the selected sections are wrapped in marker paragraphs.
+
+    With selected=None all sections are marked and nothing else is left out,
+    so pandoc's output is the full document plus the marker paragraphs. With a
+    list of section indexes, the other sections keep only their headings, the
+    list items that the selected sections continue numbering from and the
+    blocks that link to bookmarks in the selected sections, and media no
+    longer referenced is dropped from the package. keep_front keeps the
+    blocks before the first section (the front matter) in full all the same.
+    """
+    w = split.namespace
+    selected = set(range(len(split.sections)) if selected is None else selected)
+    full = len(selected) == len(split.sections)
+    num_ids = set().union(*(split.sections[i].num_ids for i in selected)) if selected else set()
+    bookmarks = {name for i in selected for block in split.sections[i].blocks for name in block.bookmarks}
+
+    def context(blocks: list) -> list:
+        return [
+            block.xml for block in blocks
+            if block.heading or block.anchor or not block.references.isdisjoint(bookmarks)
+            or any(num_id in num_ids for num_id, _ in block.list_items)
+        ]
+
+    parts = [split.prefix]
+    if full or keep_front:
+        parts.extend(block.xml for block in split.front)
+    else:
+        parts.extend(context(split.front))
+    for index, section in enumerate(split.sections):
+        if index in selected:
+            parts.append(_marker_paragraph(w, section_marker(marker, index)))
+            parts.extend(block.xml for block in section.blocks)
+            parts.append(_marker_paragraph(w, section_marker(marker, index, end=True)))
+        else:
+            parts.extend(block.xml for block in section.head)
+            parts.extend(context(section.blocks[section.head_length:]))
+    parts.append(split.suffix)
+    document_xml = ''.join(parts)
+
+    with zipfile.ZipFile(io.BytesIO(docx_bytes)) as source:
+        referenced = None if full else _referenced_media(source, document_xml)
+        output = io.BytesIO()
+        # Stored rather than deflated: the archive is read once, straight away
+        with zipfile.ZipFile(output, 'w', zipfile.ZIP_STORED) as target:
+            for info in source.infolist():
+                if info.filename == 'word/document.xml':
+                    data = document_xml.encode('utf-8')
+                elif referenced is not None and info.filename.startswith('word/media/') and info.filename not in referenced:
+                    continue
+                else:
+                    data = source.read(info.filename)
+                # Fixed timestamps keep the output identical for identical input
+                target.writestr(zipfile.ZipInfo(info.filename, date_time=(1980, 1, 1, 0, 0, 0)), data)
+    return output.getvalue()
+
+
+def _read_optional(archive: zipfile.ZipFile, name: str) -> str:
+    try:
+        return archive.read(name).decode('utf-8')
+    except KeyError:
+        return ''
+
+
+def _package_hash(archive: zipfile.ZipFile) -> str:
+    digest = hashlib.sha256()
+    for name in sorted(archive.namelist()):
+        if name in _IGNORED_PARTS or name.startswith(_IGNORED_PREFIXES) or name.endswith('/'):
+            continue
+        data = archive.read(name)
+        if name == 'docProps/core.xml':
+            data = _VOLATILE_CORE_PATTERN.sub('', data.decode('utf-8')).encode('utf-8')
+        digest.update(name.encode('utf-8') + b'\x00' + hashlib.sha256(data).digest())
+    return digest.hexdigest()
+
+
+def _normalize(xml: str) -> str:
+    return _VOLATILE_ATTRIBUTE_PATTERN.sub('', xml)
+
+
+def _top_level_elements(xml: str, start: int, end: int) -> list:
+    """
+    Return the source text of each top-level element between start and end.
+    """
+    elements = []
+    depth = 0
+    element_start = None
+    for match in _TAG_PATTERN.finditer(xml, start, end):
+        if match.group(2) is None:
+            continue
+        if match.group(1):
+            depth -= 1
+            if depth == 0:
+                elements.append(xml[element_start:match.end()])
+            elif depth < 0:
+                raise ValueError("Unbalanced tags in the document body")
+        elif match.group(3):
+            if depth == 0:
+                elements.append(match.group(0))
+        else:
+            if depth == 0:
+                element_start = match.start()
+            depth += 1
+    if depth != 0:
+        raise ValueError("Unbalanced tags in the document body")
+    return elements
+
+
+def _paragraph_styles(styles_xml: str, w: str) -> dict:
+    """
+    Map paragraph style ids to (is_heading, num_id, level), following basedOn.
+    """
+    raw = {}
+    for match in re.finditer(f'<{w}:style\\b([^>]*)>(.*?)</{w}:style>', styles_xml, re.S):
+        attributes = _attributes(match.group(1))
+        if attributes.get(f'{w}:type') != 'paragraph':
+            continue
+        body = match.group(2)
+        name = re.search(f'<{w}:name {w}:val="([^"]*)"', body)
+        based_on = re.search(f'<{w}:basedOn {w}:val="([^"]*)"', body)
+        num_id, level = _numbering(body, w)
+        raw[attributes.get(f'{w}:styleId')] = (
+            name.group(1) if name else '', based_on.group(1) if based_on else None, num_id, level
+        )
+
+    styles = {}
+    for style_id in raw:
+        heading, num_id, level = False, None, None
+        seen = set()
+        current = style_id
+        while current in raw and current not in seen:
+            seen.add(current)
+            name, based_on, style_num_id, style_level = raw[current]
+            heading = heading or bool(_HEADING_NAME_PATTERN.match(name))
+            if num_id is None:
+                num_id, level = style_num_id, style_level
+            current = based_on
+        styles[style_id] = (heading, num_id, level or '0')
+    return styles
+
+
+def _attributes(text: str) -> dict:
+    return {match.group(1): match.group(2) if match.group(2) is not None else match.group(3)
+            for match in _ATTRIBUTE_PATTERN.finditer(text)}
+
+
+def _numbering(properties: str, w: str) -> tuple:
+    num_id = re.search(f'<{w}:numId {w}:val="([^"]*)"', properties)
+    level = re.search(f'<{w}:ilvl {w}:val="([^"]*)"', properties)
+    return (num_id.group(1) if num_id else None), (level.group(1) if level else None)
+
+
+def _classify(xml: str, w: str, styles: dict) -> Block:
+    block = Block(
+        xml=xml,
+        field_balance=xml.count('fldCharType="begin"') - xml.count('fldCharType="end"'),
+        bookmarks=set(_BOOKMARK_PATTERN.findall(xml)),
+        references={anchor or field for anchor, field in _BOOKMARK_REFERENCE_PATTERN.findall(xml)}
+    )
+    if not re.match(f'<{w}:p[\\s>/]', xml):
+        # Tables and content controls: list items numbered directly in nested paragraphs
+        for nested in re.finditer(f'<{w}:numPr>(.*?)</{w}:numPr>', xml, re.S):
+            num_id, level = _numbering(nested.group(1), w)
+            if num_id not in (None, '0'):
+                block.list_items.append((num_id, level or '0'))
+        return block
+
+    properties_match = re.match(f'<{w}:p\\b[^>]*>\\s*<{w}:pPr>(.*?)</{w}:pPr>', xml, re.S)
+    properties = properties_match.group(1) if properties_match else ''
+    style = re.search(f'<{w}:pStyle {w}:val="([^"]*)"', properties)
+    heading, num_id, level = styles.get(style.group(1) if style else None, (False, None, '0'))
+
+    direct_num_id, direct_level = _numbering(properties, w)
+    if direct_num_id is not None:
+        num_id, level = direct_num_id, direct_level or level
+    block.heading = heading
+    if num_id not in (None, '0'):
+        block.list_items.append((num_id, level or '0'))
+
+    content = xml[properties_match.end():] if properties_match else xml
+    block.anchor = (
+        not heading
+        and f'<{w}:bookmarkStart' in content
+        and not re.search(f'<{w}:(?:r|hyperlink|fldSimple|smartTag|sdt|ins|del|customXml)[\\s>/]|<m:oMath', content)
+    )
+    return block
+
+
+def _group_sections(blocks: list) -> tuple:
+    """
+    Cut the blocks into sections at headings outside of open fields.
+    """
+    starts = []
+    balance = 0
+    for index, block in enumerate(blocks):
+        if block.heading and balance == 0:
+            start = index
+            while start > 0 and blocks[start - 1].anchor and (not starts or start - 1 > starts[-1]):
+                start -= 1
+            starts.append(start)
+        balance += block.field_balance
+    # Fields still open at the end of the body cannot be cut safely
+    if balance != 0:
+        starts = []
+
+    if not starts:
+        return blocks, []
+    front = blocks[:starts[0]]
+    sections = []
+    for position, start in enumerate(starts):
+        end = starts[position + 1] if position + 1 < len(starts) else len(blocks)
+        section_blocks = blocks[start:end]
+        head_length = next(i for i, block in enumerate(section_blocks) if block.heading) + 1
+        sections.append(Section(blocks=section_blocks, head_length=head_length))
+    return front, sections
+
+
+def _fingerprint_sections(front: list, sections: list):
+    """
+    Fingerprint each section with the list levels its numbering continues from.
+    """
+    # num_id -> levels of the list items seen so far
+    list_history = {}
+    for block in front:
+        for num_id, level in block.list_items:
+            list_history.setdefault(num_id, []).append(level)
+
+    for section in sections:
+        digest = hashlib.sha256()
+        for block in section.blocks:
+            digest.update(b'\x00' + _normalize(block.xml).encode('utf-8'))
+        section.num_ids = {num_id for block in section.blocks for num_id, _ in block.list_items}
+        for num_id in sorted(section.num_ids):
+            digest.update(f'\x01{num_id}:{",".join(list_history.get(num_id, []))}'.encode('utf-8'))
+        section.fingerprint = digest.hexdigest()
+
+        for block in section.blocks:
+            for num_id, level in block.list_items:
+                list_history.setdefault(num_id, []).append(level)
+
+
+def _marker_paragraph(w: str, text: str) -> str:
+    return f'<{w}:p><{w}:r><{w}:t>{text}</{w}:t></{w}:r></{w}:p>'
+
+
+def _referenced_media(archive: zipfile.ZipFile, document_xml: str) -> set:
+    """
+    Return the media parts still used: those referenced from the given body
+    and everything referenced by other parts (footnotes, headers, ...).
+    """
+    used_ids = set(_RELATIONSHIP_ID_PATTERN.findall(document_xml))
+    referenced = set()
+    for name in archive.namelist():
+        if not name.endswith('.rels') or not name.startswith('word/'):
+            continue
+        rels_xml = archive.read(name).decode('utf-8')
+        # word/_rels/document.xml.rels describes word/document.xml
+        source_dir = posixpath.dirname(posixpath.dirname(name))
+        is_document = name == 'word/_rels/document.xml.rels'
+        for match in _RELATIONSHIP_PATTERN.finditer(rels_xml):
+            attributes = _attributes(match.group(0))
+            if attributes.get('TargetMode') == 'External' or 'Target' not in attributes:
+                continue
+            if is_document and attributes.get('Id') not in used_ids:
+                continue
+            referenced.add(posixpath.normpath(posixpath.join(source_dir, attributes['Target'])))
+    return referenced
@@ -8,6 +8,8 @@ interface ConversionOptions {
   overleafCompatible: boolean;
   preserveStyles: boolean;
   preserveLineBreaks: boolean;
+  optimizeImages: boolean;
+  minimalPreamble: boolean;
 }
 
 export default function Home() {
@@ -27,6 +29,8 @@ export default function Home() {
     overleafCompatible: true,
     preserveStyles: true,
     preserveLineBreaks: true,
+    optimizeImages: false,
+    minimalPreamble: false,
   });
 
   const handleFileSelect = (event: React.ChangeEvent<HTMLInputElement>) => {
@@ -139,6 +143,8 @@ export default function Home() {
           overleafCompatible: options.overleafCompatible,
           preserveStyles: options.preserveStyles,
           preserveLineBreaks: options.preserveLineBreaks,
+          optimizeImages: options.optimizeImages,
+          minimalPreamble: options.minimalPreamble,
           extractMedia: true,
         },
       }),
@@ -322,6 +328,30 @@ export default function Home() {
                         📝 Preserve Line Breaks
                       </span>
                     </label>
+
+                    <label className="flex items-center space-x-3 cursor-pointer">
+                      <input
+                        type="checkbox"
+                        checked={options.optimizeImages}
+                        onChange={() => toggleOption('optimizeImages')}
+                        className="w-5 h-5 text-indigo-600 rounded focus:ring-indigo-500"
+                      />
+                      <span className="text-orange-600 dark:text-orange-400">
+                        🖼️ Optimize Images
+                      </span>
+                    </label>
+
+                    <label className="flex items-center space-x-3 cursor-pointer">
+                      <input
+                        type="checkbox"
+                        checked={options.minimalPreamble}
+                        onChange={() => toggleOption('minimalPreamble')}
+                        className="w-5 h-5 text-indigo-600 rounded focus:ring-indigo-500"
+                      />
+                      <span className="text-teal-600 dark:text-teal-400">
+                        ✂️ Minimal Preamble
+                      </span>
+                    </label>
                   </div>
 
                   <div className="mt-4 p-4 bg-blue-50 dark:bg-blue-900/20 rounded-lg">
@@ -0,0 +1,176 @@
+r"""
+Parsed model of a LaTeX document's preamble.
+
+split_document() cuts a document at \begin{document} once. The Preamble it
+returns holds the text before that point together with an index of what
+the preamble sets up: the packages it loads with \usepackage, the
+characters it declares with \DeclareUnicodeCharacter and the commands it
+defines with \providecommand or \newcommand.
+
+The post-processing passes that add packages and definitions look these up
+and insert text through the model, so their cost depends on the size of the
+preamble and not on the size of the body. Lines added as a block with
+insert_block() can be taken out again with remove_lines().
+"""
+
+import re
+
+BEGIN_DOCUMENT = '\\begin{document}'
+
+_DOCUMENTCLASS_PATTERN = re.compile(r'\\documentclass(?:\[[^\]]*\])?\{[^}]+\}')
+_USEPACKAGE_PATTERN = re.compile(r'\\usepackage\s*(?:\[([^\]]*)\])?\s*\{([^}]*)\}')
+_UNICODE_CHARACTER_PATTERN = re.compile(r'\\DeclareUnicodeCharacter\{([0-9A-Fa-f]+)\}')
+_COMMAND_DEFINITION_PATTERN = re.compile(r'\\(?:providecommand|newcommand)\*?\s*\{?\s*(\\[A-Za-z@]+)')
+_COMMENT_PATTERN = re.compile(r'(?<!\\)%.*')
+
+# Packages that load other packages themselves
+_IMPLIED_PACKAGES = {
+    'bookmark': ('hyperref',),
+}
+
+
+def split_document(content: str) -> tuple:
+    r"""
+    Split a document into its Preamble and its body.
+
+    The body starts with \begin{document}. Without \begin{document} the
+    whole document is the preamble and the body is empty.
+    """
+    position = content.find(BEGIN_DOCUMENT)
+    if position < 0:
+        return Preamble(content, complete=False), ''
+    return Preamble(content[:position]), content[position:]
+
+
+class Preamble:
+    r"""
+    The text before \begin{document}, indexed by what it loads and defines.
+
+    Attributes:
+        text: The preamble text.
+        complete: Whether \begin{document} follows the text. Without it the
+            text is a whole document that has no body.
+        packages: Maps the names of loaded packages to their options (None
+            without an option list). Packages loaded by other packages in
+            the index are included.
+        unicode_characters: Code points declared with
+            \DeclareUnicodeCharacter, as upper-case hex strings.
+        commands: Commands defined with \providecommand or \newcommand.
+        blocks: (comment, lines, trailer) of each block added with
+            insert_block() that still has lines.
+
+    Usage:
+        preamble, body = split_document(content)
+        if not preamble.loads('graphicx'):
+            preamble.insert(preamble.documentclass_end(), '\n\\usepackage{graphicx}')
+        content = preamble.text + body
+    """
+
+    def __init__(self, text: str, complete: bool = True):
+        self.text = text
+        self.complete = complete
+        self.packages = {}
+        self.unicode_characters = set()
+        self.commands = set()
+        self.blocks = []
+        self._index(text)
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+    def copy(self) -> 'Preamble':
+        preamble = Preamble.__new__(Preamble)
+        preamble.text = self.text
+        preamble.complete = self.complete
+        preamble.packages = dict(self.packages)
+        preamble.unicode_characters = set(self.unicode_characters)
+        preamble.commands = set(self.commands)
+        preamble.blocks = [(comment, list(lines), trailer) for comment, lines, trailer in self.blocks]
+        return preamble
+
+    def loads(self, package: str) -> bool:
+        return package in self.packages
+
+    def declares(self, code_point: str) -> bool:
+        return code_point.upper() in self.unicode_characters
+
+    def defines(self, command: str) -> bool:
+        return command in self.commands
+
+    def documentclass_end(self) -> int:
+        r"""Position right after \documentclass, or -1 without one."""
+        match = _DOCUMENTCLASS_PATTERN.search(self.text)
+        return match.end() if match else -1
+
+    def insert(self, position: int, text: str):
+        """
+        Insert text at position and add what it loads and defines to the index.
+        """
+        self.text = self.text[:position] + text + self.text[position:]
+        self._index(text)
+
+    def insert_block(self, position: int, comment: str, lines: list, trailer: str = ''):
+        """
+        Insert lines under a comment line, followed by trailer.
+        """
+        self.insert(position, '\n' + comment + '\n' + ''.join(line + '\n' for line in lines) + trailer)
+        self.blocks.append((comment, list(lines), trailer))
+
+    @property
+    def added_lines(self) -> list:
+        """The lines of the blocks added with insert_block(), in insertion order."""
+        return [line for _, lines, _ in self.blocks for line in lines]
+
+    def remove_lines(self, removed):
+        """
+        Remove lines added with insert_block(). A block left without lines is
+        removed with its comment, as if it had never been inserted.
+        """
+        removed = set(removed)
+        text = self.text
+        blocks = []
+        for comment, lines, trailer in self.blocks:
+            header = '\n' + comment + '\n'
+            start = text.find(header)
+            kept = [line for line in lines if line not in removed]
+            if start < 0 or len(kept) == len(lines):
+                blocks.append((comment, lines, trailer))
+                continue
+            for line in lines:
+                if line not in removed:
+                    continue
+                position = text.find('\n' + line + '\n', start)
+                if position >= 0:
+                    text = text[:position + 1] + text[position + len(line) + 2:]
+            if kept:
+                blocks.append((comment, kept, trailer))
+                continue
+            end = start + len(header)
+            if text.startswith(trailer, end):
+                end += len(trailer)
+            text = text[:start] + text[end:]
+        self.update(text)
+        self.blocks = blocks
+
+    def update(self, text: str):
+        """
+        Replace the text, e.g. after a pass rewrote part of it, and rebuild the index.
+        """
+        self.text = text
+        self.packages = {}
+        self.unicode_characters = set()
+        self.commands = set()
+        self._index(text)
+
+    def _index(self, text: str):
+        text = _COMMENT_PATTERN.sub('', text)
+        for options, names in _USEPACKAGE_PATTERN.findall(text):
+            for name in names.split(','):
+                name = name.strip()
+                if not name:
+                    continue
+                self.packages.setdefault(name, options or None)
+                for implied in _IMPLIED_PACKAGES.get(name, ()):
+                    self.packages.setdefault(implied, None)
+        self.unicode_characters.update(code_point.upper() for code_point in _UNICODE_CHARACTER_PATTERN.findall(text))
+        self.commands.update(_COMMAND_DEFINITION_PATTERN.findall(text))
@@ -0,0 +1,302 @@
+r"""
+Single-scan tokenizer for the post-processing passes that edit LaTeX markup.
+
+apply_visitors() scans a text once for the tokens a list of TokenVisitors
+subscribe to (commands, the \begin of environments and single characters),
+calls each visitor for its tokens in document order and applies the edits
+they make in a single rendering of the text.
+
+Only subscribed tokens are materialized; the text between them is skipped by
+the regular expression engine. The scan also reads what is needed to
+interpret them: escaped characters (\\, \$, \%), comments and the math
+delimiters \( \), \[ \], $ $, $$ $$ and math environments, so every token
+knows whether it is inside math. As in TeX, math does not continue past a
+blank line, so an unmatched delimiter only affects its own paragraph.
+
+Brace groups are matched on demand with TokenDocument.group_end(), which
+respects escaped braces and comments and remembers every group it passes
+over, so each brace of the text is read at most once.
+
+Visitors edit through the TokenDocument they are called with. Edits refer to
+positions in the original text and are applied together; an edit that
+overlaps one applied before it (such as a change inside a command that
+another visitor deletes) is dropped.
+"""
+
+import re
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, NamedTuple
+
+# Environments whose content is math
+MATH_ENVIRONMENTS = frozenset([
+    'math', 'displaymath', 'equation', 'equation*', 'align', 'align*', 'alignat', 'alignat*',
+    'flalign', 'flalign*', 'gather', 'gather*', 'multline', 'multline*', 'eqnarray', 'eqnarray*',
+])
+
+_MATH_CLOSERS = {'\\(': '\\)', '\\[': '\\]', '$': '$', '$$': '$$'}
+
+# Groups of the token pattern, as match.lastindex reports them (6 is a character)
+_SKIPPED, _DELIMITER, _ENVIRONMENT, _COMMAND = 1, 2, 4, 5
+
+_GROUP_PATTERN = re.compile(r'\\[\\{}%]|%[^\n]*|[{}]')
+_OPTIONAL_ARGUMENT_PATTERN = re.compile(r'\[[^\[\]{}]*(?:\{[^{}]*\}[^\[\]{}]*)*\]')
+_BLANK_LINE_PATTERN = re.compile(r'\n[ \t]*\n')
+
+
+class Token(NamedTuple):
+    r"""
+    A token of the scanned text.
+
+    Attributes:
+        kind: "command", "begin" or "end" (of an environment), or "character".
+        name: Command name without the backslash, environment name, or the
+            character.
+        start: Position of the token in the text.
+        end: Position after the token.
+        math: Whether the token is inside math.
+    """
+    kind: str
+    name: str
+    start: int
+    end: int
+    math: bool
+
+
+@dataclass(frozen=True)
+class TokenVisitor:
+    r"""
+    A set of subscribed tokens and the function called for each of them.
+
+    Attributes:
+        visit: Function (document, token, options) -> matches. Edits the
+            text through the TokenDocument and returns the number of changes.
+        commands: Names of the commands to visit, without the backslash.
+            Only whole command names match.
+        environments: Names of the environments whose \begin is visited.
+        characters: Characters to visit.
+    """
+    visit: Callable
+    commands: tuple = ()
+    environments: tuple = ()
+    characters: str = ''
+
+
+@dataclass
+class VisitorResult:
+    """
+    What one visitor did during apply_visitors().
+
+    Attributes:
+        matches: Sum of the values its visit function returned.
+        seconds: Time spent in its visit function, plus an equal share of
+            the scan and the rendering.
+        growth: Characters its applied edits added (negative if they removed more).
+    """
+    matches: int = 0
+    seconds: float = 0.0
+    growth: int = 0
+
+
+class TokenDocument:
+    """
+    A scanned text and the edits made to it.
+
+    Usage:
+        document = TokenDocument(text, token_pattern(visitors))
+        for token in document.tokens:
+            if token.kind == 'command' and document.group_end(token.end) > 0:
+                document.delete(token.start, token.end)
+        text = document.render()[0]
+    """
+
+    def __init__(self, text: str, pattern: re.Pattern):
+        self.text = text
+        self.tokens = _scan(text, pattern)
+        self.owner = 0
+        self._edits = []
+        # Position of each '{' read so far -> position after its group, or -1 if it is not closed
+        self._group_ends = {}
+
+    def group_end(self, position: int) -> int:
+        """
+        Position after the brace group that opens at position, or -1 if no
+        group opens there or it is not closed.
+        """
+        if not self.text.startswith('{', position):
+            return -1
+        end = self._group_ends.get(position)
+        if end is None:
+            self._match_groups(position)
+            end = self._group_ends[position]
+        return end
+
+    def optional_end(self, position: int) -> int:
+        """
+        Position after the optional argument ([...]) that opens at position, or -1.
+        """
+        match = _OPTIONAL_ARGUMENT_PATTERN.match(self.text, position)
+        return match.end() if match else -1
+
+    def replace(self, start: int, end: int, text: str):
+        self._edits.append((start, end, len(self._edits), text, self.owner))
+
+    def insert(self, position: int, text: str):
+        self.replace(position, position, text)
+
+    def delete(self, start: int, end: int):
+        self.replace(start, end, '')
+
+    def render(self) -> tuple:
+        """
+        Apply the edits; returns the new text and the growth of the text per owner.
+
+        Edits are applied by position, insertions before replacements that
+        start at the same position and otherwise in the order they were made.
+        """
+        parts = []
+        growth = {}
+        position = 0
+        for start, end, _, text, owner in sorted(self._edits):
+            if start < position:
+                continue
+            parts.append(self.text[position:start])
+            parts.append(text)
+            position = end
+            growth[owner] = growth.get(owner, 0) + len(text) - (end - start)
+        if not parts:
+            return self.text, growth
+        parts.append(self.text[position:])
+        return ''.join(parts), growth
+
+    def _match_groups(self, position: int):
+        ends = self._group_ends
+        open_groups = []
+        for match in _GROUP_PATTERN.finditer(self.text, position):
+            brace = match.group()
+            if brace == '{':
+                open_groups.append(match.start())
+            elif brace == '}':
+                ends[open_groups.pop()] = match.end()
+                if not open_groups:
+                    return
+        for start in open_groups:
+            ends[start] = -1
+
+
+def token_pattern(visitors) -> re.Pattern:
+    """
+    The pattern that scans for the tokens of all visitors.
+    """
+    commands = frozenset(name for visitor in visitors for name in visitor.commands)
+    environments = frozenset(name for visitor in visitors for name in visitor.environments)
+    characters = frozenset(char for visitor in visitors for char in visitor.characters)
+    return _compile_token_pattern(commands, environments | MATH_ENVIRONMENTS, characters)
+
+
+@lru_cache(maxsize=64)
+def _compile_token_pattern(commands: frozenset, environments: frozenset, characters: frozenset) -> re.Pattern:
+    never = '(?!)'
+    # Longest names first, so that one name does not match the start of another
+    command_names = '|'.join(re.escape(name) for name in sorted(commands, key=lambda name: (-len(name), name)))
+    environment_names = '|'.join(re.escape(name) for name in sorted(environments, key=lambda name: (-len(name), name)))
+    characters = ''.join(re.escape(char) for char in sorted(characters))
+    # The leading class of every first character lets the regex engine skip
+    # ahead to candidates instead of trying each alternative at every position
+    return re.compile(
+        r'(?=[\\%$' + characters + r'])(?:'
+        r'(\\[\\$%]|%[^\n]*)'
+        r'|(\\[()\[\]]|\$\$?)'
+        r'|\\(begin|end)\{(' + environment_names + r')\}'
+        r'|\\(' + (command_names or never) + r')(?![A-Za-z])'
+        r'|(' + ('[' + characters + ']' if characters else never) + '))'
+    )
+
+
+def _scan(text: str, pattern: re.Pattern) -> list:
+    """
+    Tokenize text with a pattern from token_pattern().
+    """
+    tokens = []
+    closer = None       # Delimiter that ends the open math span
+    opening = None      # Delimiter that opened it
+    opening_end = 0     # Position after that delimiter
+    opening_token = 0   # Number of tokens before it
+    blank_line = None   # First blank line after it
+    paragraph_end = -1  # End of that blank line, or the end of the text (-1 before the first span)
+    unclosed = {}       # Delimiter -> end of a paragraph in which it has no closer
+    matches = pattern.finditer(text)
+    while True:
+        match = next(matches, None)
+        start = match.start() if match else len(text)
+        if closer is not None and (paragraph_end <= start or match is None):
+            # The span is not closed in its paragraph: its opening
+            # delimiter is plain text and the text after it is rescanned
+            unclosed[opening] = paragraph_end
+            del tokens[opening_token:]
+            closer = None
+            matches = pattern.finditer(text, opening_end)
+            continue
+        if match is None:
+            return tokens
+        kind = match.lastindex
+        if kind == _SKIPPED:
+            continue
+        if kind == _DELIMITER or (kind == _ENVIRONMENT and match.group(4) in MATH_ENVIRONMENTS):
+            delimiter = match.group()
+            if closer is None:
+                opens = delimiter in _MATH_CLOSERS if kind == _DELIMITER else match.group(3) == 'begin'
+                if opens and unclosed.get(delimiter, -1) <= start:
+                    closer = _MATH_CLOSERS.get(delimiter) or '\\end' + delimiter[6:]
+                    opening = delimiter
+                    opening_end = match.end()
+                    opening_token = len(tokens)
+                    # The blank line found for an earlier span is still the next one if it is after this one starts
+                    if paragraph_end < 0 or (blank_line and blank_line.start() < opening_end):
+                        blank_line = _BLANK_LINE_PATTERN.search(text, opening_end)
+                        paragraph_end = blank_line.end() if blank_line else len(text)
+            elif delimiter == closer:
+                closer = None
+            if kind == _DELIMITER:
+                continue
+        if kind == _ENVIRONMENT:
+            tokens.append(Token(match.group(3), match.group(4), start, match.end(), closer is not None))
+        elif kind == _COMMAND:
+            tokens.append(Token('command', match.group(5), start, match.end(), closer is not None))
+        else:
+            tokens.append(Token('character', match.group(), start, match.end(), closer is not None))
+
+
+def apply_visitors(text: str, visitors: list, options=None) -> tuple:
+    """
+    Scan text once and run the visitors on its tokens.
+
+    Returns the edited text and a VisitorResult per visitor. An exception
+    raised by a visitor propagates and no edit is applied.
+    """
+    start = time.perf_counter()
+    document = TokenDocument(text, token_pattern(visitors))
+    handlers = {}
+    for index, visitor in enumerate(visitors):
+        for name in visitor.commands:
+            handlers.setdefault(('command', name), []).append(index)
+        for name in visitor.environments:
+            handlers.setdefault(('begin', name), []).append(index)
+        for char in visitor.characters:
+            handlers.setdefault(('character', char), []).append(index)
+
+    results = [VisitorResult() for _ in visitors]
+    for token in document.tokens:
+        for index in handlers.get((token.kind, token.name), ()):
+            document.owner = index
+            visit_start = time.perf_counter()
+            results[index].matches += visitors[index].visit(document, token, options)
+            results[index].seconds += time.perf_counter() - visit_start
+
+    text, growth = document.render()
+    shared = (time.perf_counter() - start - sum(result.seconds for result in results)) / max(len(visitors), 1)
+    for index, result in enumerate(results):
+        result.seconds += shared
+        result.growth = growth.get(index, 0)
+    return text, results
@@ -0,0 +1,56 @@
+-- linebreak_filter.lua
+-- Preserves Word's line breaks and strips highlighting styles.
+-- Used by converter.py when preserve_linebreaks is enabled.
+
+function Para(elem)
+  -- Preserve all line breaks exactly as they appear in Word
+  -- This maintains Word's original pagination and formatting
+  local new_content = {}
+  
+  for i, item in ipairs(elem.content) do
+    if item.t == "SoftBreak" then
+      -- Convert all soft breaks to line breaks to match Word's formatting
+      table.insert(new_content, pandoc.LineBreak())
+    else
+      table.insert(new_content, item)
+    end
+  end
+  
+  elem.content = new_content
+  return elem
+end
+
+function LineBlock(elem)
+  -- Preserve line blocks exactly as they are
+  return elem
+end
+
+function Span(elem)
+  -- Remove unwanted highlighting and formatting
+  if elem.attributes and elem.attributes.style then
+    -- Remove background colors and highlighting
+    local style = elem.attributes.style
+    if string.find(style, "background") or string.find(style, "highlight") then
+      elem.attributes.style = nil
+    end
+  end
+  return elem
+end
+
+function Div(elem)
+  -- Remove unwanted div formatting that causes highlighting
+  if elem.attributes and elem.attributes.style then
+    local style = elem.attributes.style
+    if string.find(style, "background") or string.find(style, "highlight") then
+      elem.attributes.style = nil
+    end
+  end
+  return elem
+end
+
+function RawBlock(elem)
+  -- Preserve raw LaTeX blocks
+  if elem.format == "latex" then
+    return elem
+  end
+end
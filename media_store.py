@@ -0,0 +1,162 @@
+"""
+Content-addressed store for extracted media, shared by all conversions.
+
+Each distinct image is kept once, named after its SHA-256, and the
+directories that use it (task media directories, conversion cache entries)
+hold hardlinks to it. Identical images from repeated uploads and
+re-conversions take the disk space of one, and "copying" them is creating
+a link.
+
+The link count of a stored file is its reference count: once only the
+store's own link is left, nothing uses the image. release() removes a media
+directory and deletes the images it was the last user of; collect_garbage()
+sweeps the whole store, e.g. after directories were removed by other means.
+
+Files linked into the store are shared and must be replaced, never modified
+in place. Where the filesystem does not support hardlinks, files are kept as
+separate copies.
+"""
+
+import hashlib
+import os
+import shutil
+import uuid
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class MediaStore:
+    """
+    Deduplicates media directories against a store directory.
+
+    Usage:
+        store = MediaStore('temp/media_store')
+        store.ingest(media_dir)     # after writing the images
+        store.release(media_dir)    # instead of shutil.rmtree(media_dir)
+    """
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def ingest(self, directory: str) -> int:
+        """
+        Replace every file below directory by a link to its stored copy,
+        adding images the store does not have yet.
+
+        Returns:
+            The number of bytes saved by linking to images already stored.
+        """
+        saved = 0
+        for path in _files(directory):
+            saved += self._ingest_file(path)
+        return saved
+
+    def release(self, directory: str):
+        """
+        Remove a directory and delete stored images no one else links to.
+        """
+        if not os.path.isdir(directory):
+            return
+        orphans = []
+        for path in _files(directory):
+            # Two links left: this file and the store's own
+            if os.stat(path).st_nlink == 2:
+                orphans.append(self._blob_path(_file_digest(path)))
+        shutil.rmtree(directory)
+        for blob in orphans:
+            self._remove_if_unused(blob)
+
+    def collect_garbage(self) -> int:
+        """
+        Delete every stored image no one links to. Returns the number deleted.
+        """
+        removed = 0
+        for blob in _files(self.root):
+            removed += self._remove_if_unused(blob)
+        return removed
+
+    def stats(self) -> dict:
+        """Return the number and total size of stored images."""
+        images = size = 0
+        for blob in _files(self.root):
+            images += 1
+            size += os.path.getsize(blob)
+        return {'images': images, 'size_bytes': size}
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+    def _remove_if_unused(self, blob: str) -> int:
+        try:
+            if os.stat(blob).st_nlink == 1:
+                os.remove(blob)
+                return 1
+        except FileNotFoundError:
+            pass
+        return 0
+
+    def _ingest_file(self, path: str) -> int:
+        blob = self._blob_path(_file_digest(path))
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        while True:
+            try:
+                # A new image: the file itself becomes the stored copy
+                os.link(path, blob)
+                return 0
+            except FileExistsError:
+                pass
+            except OSError as e:
+                print(f"Warning: Cannot link {path} into the media store, keeping a copy: {e}")
+                return 0
+
+            try:
+                if os.path.samefile(blob, path):
+                    return 0
+                _replace_with_link(blob, path)
+                return os.path.getsize(path)
+            except FileNotFoundError:
+                # Collected in the meantime; store this file instead
+                continue
+
+
+def link_tree(source: str, destination: str):
+    """
+    Make every file below source available at the same place below
+    destination, as hardlinks where possible and copies otherwise. Existing
+    files are replaced, not written to.
+    """
+    for path in _files(source):
+        target = os.path.join(destination, os.path.relpath(path, source))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            _replace_with_link(path, target)
+        except OSError:
+            staging_path = f'{target}.{uuid.uuid4().hex}.tmp'
+            shutil.copyfile(path, staging_path)
+            os.replace(staging_path, target)
+
+
+def _replace_with_link(source: str, target: str):
+    # Linked under a unique name and renamed, so target is never missing or partial
+    staging_path = f'{target}.{uuid.uuid4().hex}.tmp'
+    os.link(source, staging_path)
+    try:
+        os.replace(staging_path, target)
+    except OSError:
+        os.remove(staging_path)
+        raise
+
+
+def _files(directory: str):
+    for root, _, names in os.walk(directory):
+        for name in names:
+            yield os.path.join(root, name)
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
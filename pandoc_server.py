@@ -0,0 +1,261 @@
+"""
+Persistent ``pandoc server`` backend for the DOCX to LaTeX converter.
+
+Starting a fresh pandoc process for every conversion means loading the Haskell
+runtime, the docx reader and the Lua engine each time. This module keeps one
+long-lived ``pandoc server`` process listening on localhost and sends
+conversions to it over HTTP instead.
+
+The server runs sandboxed, so it cannot run Lua filters or write extracted
+media. Both are reproduced here in Python: the document is fetched as a pandoc
+JSON AST, the line-break filter is applied to the AST, image targets are
+pointed at the extraction directory and the AST is rendered to LaTeX by a
+second request. Media files are copied straight out of the DOCX archive by
+docx_media.
+"""
+
+import atexit
+import base64
+import json
+import os
+import posixpath
+import shutil
+import socket
+import subprocess
+import threading
+import time
+
+from docx_media import extract_media
+
+
+class PandocServerError(Exception):
+    """Raised when the pandoc server cannot be started or a request fails."""
+
+
+class PandocServer:
+    """
+    Manages a local ``pandoc server`` process and talks to it over HTTP.
+
+    The process is started lazily on the first request and stopped with
+    ``stop()`` (or automatically at interpreter exit for the shared instance).
+    """
+
+    def __init__(self, pandoc_path: str = None, host: str = '127.0.0.1', port: int = None,
+                 request_timeout: int = 300, startup_timeout: float = 10.0):
+        self.pandoc_path = pandoc_path or os.environ.get('PYPANDOC_PANDOC') or shutil.which('pandoc') or 'pandoc'
+        self.host = host
+        self.port = port
+        self.request_timeout = request_timeout
+        self.startup_timeout = startup_timeout
+        self._process = None
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f'http://{self.host}:{self.port}'
+
+    def is_running(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    def start(self):
+        """Start the server process if it is not already running."""
+        # urllib.request (with http.client, ssl and email) is imported only
+        # when the server is used, so importing this module stays cheap
+        import urllib.error
+        import urllib.request
+
+        with self._lock:
+            if self.is_running():
+                return
+            if self.port is None:
+                self.port = _find_free_port(self.host)
+            try:
+                # pandoc server aborts requests after --timeout seconds (2 by
+                # default), which is far too short for long theses.
+                self._process = subprocess.Popen(
+                    [self.pandoc_path, 'server', f'--port={self.port}', f'--timeout={self.request_timeout}'],
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL
+                )
+            except OSError as e:
+                raise PandocServerError(f"Could not start pandoc server: {e}")
+
+            deadline = time.monotonic() + self.startup_timeout
+            while time.monotonic() < deadline:
+                if self._process.poll() is not None:
+                    break
+                try:
+                    with urllib.request.urlopen(self.url + '/version', timeout=1) as response:
+                        response.read()
+                    return
+                except (urllib.error.URLError, OSError):
+                    time.sleep(0.05)
+
+            self._terminate()
+            raise PandocServerError("pandoc server did not become ready (is this pandoc built with server support?)")
+
+    def stop(self):
+        """Stop the server process."""
+        with self._lock:
+            self._terminate()
+
+    def _terminate(self):
+        if self._process is not None:
+            if self._process.poll() is None:
+                self._process.terminate()
+                try:
+                    self._process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    self._process.kill()
+            self._process = None
+
+    def request(self, params: dict) -> str:
+        """
+        Send a single conversion request and return the output text.
+        """
+        import urllib.error
+        import urllib.request
+
+        if not self.is_running():
+            self.start()
+
+        body = json.dumps(params).encode('utf-8')
+        req = urllib.request.Request(
+            self.url + '/',
+            data=body,
+            headers={'Content-Type': 'application/json', 'Accept': 'application/json'}
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=self.request_timeout) as response:
+                payload = response.read()
+        except urllib.error.HTTPError as e:
+            raise PandocServerError(f"pandoc server returned HTTP {e.code}: {e.read()[:500]!r}")
+        except (urllib.error.URLError, OSError) as e:
+            raise PandocServerError(f"pandoc server request failed: {e}")
+
+        try:
+            result = json.loads(payload)
+        except ValueError:
+            # Plain-text error message instead of a JSON result
+            raise PandocServerError(f"pandoc server error: {payload[:500]!r}")
+
+        if result.get('base64'):
+            return base64.b64decode(result['output']).decode('utf-8')
+        return result['output']
+
+    def convert_docx(
+        self,
+        docx_bytes: bytes,
+        from_format: str = 'docx',
+        options: dict = None,
+        preserve_linebreaks: bool = False,
+        extract_media_to_path: str = None
+    ) -> str:
+        """
+        Convert DOCX bytes to LaTeX.
+
+        Args:
+            docx_bytes: Raw contents of the .docx file.
+            from_format: Pandoc reader name, e.g. ``docx`` or ``docx+styles``.
+            options: Extra server options (``standalone``, ``wrap``, ...).
+            preserve_linebreaks: If True, applies the same transformation as the
+                converter's line-break Lua filter.
+            extract_media_to_path: If specified, images are written below this
+                directory exactly where ``--extract-media`` would put them.
+
+        Returns:
+            The LaTeX output as a string.
+        """
+        encoded = base64.b64encode(docx_bytes).decode('ascii')
+        ast_json = self.request({'text': encoded, 'from': from_format, 'to': 'json'})
+        ast = json.loads(ast_json)
+
+        if preserve_linebreaks:
+            _walk_ast(ast, _apply_linebreak_filter)
+
+        if extract_media_to_path:
+            targets = _collect_media_targets(ast)
+            if targets:
+                try:
+                    name_map = extract_media(docx_bytes, targets, extract_media_to_path)
+                except KeyError as e:
+                    raise PandocServerError(f"Media file not found in the DOCX archive: {e}")
+                _walk_ast(ast, lambda node: _retarget_image(node, name_map, extract_media_to_path))
+
+        params = dict(options or {})
+        params.update({'text': json.dumps(ast), 'from': 'json', 'to': 'latex'})
+        return self.request(params)
+
+
+_default_server = None
+_default_server_lock = threading.Lock()
+
+
+def get_default_server() -> PandocServer:
+    """Return the process-wide shared server, creating it on first use."""
+    global _default_server
+    with _default_server_lock:
+        if _default_server is None:
+            _default_server = PandocServer()
+            atexit.register(_default_server.stop)
+        return _default_server
+
+
+def _find_free_port(host: str) -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+
+
+def _walk_ast(node, visit):
+    """
+    Call ``visit`` on every element dict of a pandoc JSON AST, children first.
+    """
+    if isinstance(node, list):
+        for item in node:
+            _walk_ast(item, visit)
+    elif isinstance(node, dict):
+        for value in node.values():
+            if isinstance(value, (list, dict)):
+                _walk_ast(value, visit)
+        if 't' in node:
+            visit(node)
+
+
+def _apply_linebreak_filter(node: dict):
+    """
+    Python equivalent of the converter's line-break Lua filter.
+    """
+    kind = node['t']
+    if kind == 'Para':
+        node['c'] = [{'t': 'LineBreak'} if item.get('t') == 'SoftBreak' else item for item in node['c']]
+    elif kind in ('Span', 'Div'):
+        # Remove background colors and highlighting
+        attributes = node['c'][0][2]
+        for key, value in attributes:
+            if key == 'style' and ('background' in value or 'highlight' in value):
+                node['c'][0][2] = [pair for pair in attributes if pair[0] != 'style']
+                break
+
+
+def _collect_media_targets(ast: dict) -> list:
+    """
+    Image targets below media/, in document order.
+    """
+    targets = {}
+
+    def visit(node):
+        if node['t'] == 'Image':
+            target = node['c'][2][0]
+            if target.startswith('media/'):
+                targets[target] = None
+
+    _walk_ast(ast, visit)
+    return list(targets)
+
+
+def _retarget_image(node: dict, name_map: dict, extract_media_to_path: str):
+    if node['t'] == 'Image':
+        target = node['c'][2][0]
+        if target in name_map:
+            node['c'][2][0] = posixpath.join(extract_media_to_path, name_map[target])
@@ -0,0 +1,268 @@
+-- postprocess_filter.lua
+-- Does the work of the markup post-processing passes on the document AST.
+-- Used by converter.py when ast_post_processing is enabled; the passes that
+-- edit LaTeX markup (the token visitors) are then skipped, and Python only
+-- runs the preamble passes and the remaining body passes.
+--
+-- Unicode symbols follow the rules of _visit_unicode_character() in
+-- converter.py, with the replacements of _UNICODE_REPLACEMENTS. Text and
+-- math are separate elements here, so no math tracking is needed.
+
+-- Math symbols, as commands without $ delimiters
+local MATH = {
+  ['Δ'] = '\\Delta', ['δ'] = '\\delta', ['∑'] = '\\sum', ['∏'] = '\\prod',
+  ['∫'] = '\\int', ['∂'] = '\\partial', ['∇'] = '\\nabla', ['√'] = '\\sqrt{}',
+  ['∞'] = '\\infty', ['≈'] = '\\approx', ['≠'] = '\\neq', ['≤'] = '\\leq',
+  ['≥'] = '\\geq', ['±'] = '\\pm', ['∓'] = '\\mp', ['×'] = '\\times',
+  ['÷'] = '\\div', ['⋅'] = '\\cdot', ['∈'] = '\\in', ['∉'] = '\\notin',
+  ['⊂'] = '\\subset', ['⊃'] = '\\supset', ['⊆'] = '\\subseteq', ['⊇'] = '\\supseteq',
+  ['∪'] = '\\cup', ['∩'] = '\\cap', ['∅'] = '\\emptyset', ['∀'] = '\\forall',
+  ['∃'] = '\\exists', ['∣'] = '|', ['∥'] = '\\parallel', ['⊥'] = '\\perp',
+  ['∠'] = '\\angle', ['°'] = '^\\circ', ['→'] = '\\rightarrow', ['←'] = '\\leftarrow',
+  ['↔'] = '\\leftrightarrow', ['⇒'] = '\\Rightarrow', ['⇐'] = '\\Leftarrow', ['⇔'] = '\\Leftrightarrow',
+  ['ˉ'] = '\\bar{}', ['ˆ'] = '\\hat{}', ['ˇ'] = '\\check{}', ['˜'] = '\\tilde{}',
+  ['˙'] = '\\dot{}', ['¨'] = '\\ddot{}', ['α'] = '\\alpha', ['β'] = '\\beta',
+  ['γ'] = '\\gamma', ['Γ'] = '\\Gamma', ['ε'] = '\\varepsilon', ['ζ'] = '\\zeta',
+  ['η'] = '\\eta', ['θ'] = '\\theta', ['Θ'] = '\\Theta', ['ι'] = '\\iota',
+  ['κ'] = '\\kappa', ['λ'] = '\\lambda', ['Λ'] = '\\Lambda', ['μ'] = '\\mu',
+  ['ν'] = '\\nu', ['ξ'] = '\\xi', ['Ξ'] = '\\Xi', ['π'] = '\\pi',
+  ['Π'] = '\\Pi', ['ρ'] = '\\rho', ['σ'] = '\\sigma', ['Σ'] = '\\Sigma',
+  ['τ'] = '\\tau', ['υ'] = '\\upsilon', ['Υ'] = '\\Upsilon', ['φ'] = '\\varphi',
+  ['Φ'] = '\\Phi', ['χ'] = '\\chi', ['ψ'] = '\\psi', ['Ψ'] = '\\Psi',
+  ['ω'] = '\\omega', ['Ω'] = '\\Omega',
+}
+
+-- Spaces and dashes
+local TEXT = {
+  ['−'] = '-', [utf8.char(0x2003)] = ' ', [utf8.char(0x2009)] = ' ', [utf8.char(0x2002)] = ' ',
+  [utf8.char(0x2004)] = ' ', [utf8.char(0x2005)] = ' ', [utf8.char(0x2006)] = ' ', [utf8.char(0x2008)] = ' ',
+  [utf8.char(0x200A)] = ' ', [utf8.char(0x202F)] = ' ', [utf8.char(0x2000)] = ' ', [utf8.char(0x2001)] = ' ',
+  [utf8.char(0x2007)] = ' ', [utf8.char(0x200B)] = ' ', [utf8.char(0x200C)] = ' ', [utf8.char(0x200D)] = ' ',
+  [utf8.char(0x200E)] = ' ', [utf8.char(0x200F)] = ' ', [utf8.char(0x2028)] = ' ', [utf8.char(0x2029)] = ' ',
+  [utf8.char(0x202A)] = ' ', [utf8.char(0x202B)] = ' ', [utf8.char(0x202C)] = ' ', [utf8.char(0x202D)] = ' ',
+  [utf8.char(0x202E)] = ' ', [utf8.char(0x205F)] = ' ', [utf8.char(0x3000)] = ' ', ['‐'] = '-',
+  ['‑'] = '-', ['‒'] = '-', ['–'] = '-', ['—'] = '-',
+  ['―'] = '-', [utf8.char(0x00A0)] = ' ', [utf8.char(0x1680)] = ' ',
+}
+
+-- Characters the LaTeX writer already converts in text (~, \hspace{0pt}, \,, --, ---)
+local WRITTEN = {
+  [utf8.char(0x00A0)] = true, [utf8.char(0x200B)] = true, [utf8.char(0x202F)] = true,
+  ['–'] = true, ['—'] = true,
+}
+
+local MACRON = 'ˉ'
+
+-- Highlighting and cell coloring are dropped; their content is kept
+local HIGHLIGHT_CLASSES = { 'mark', 'highlight' }
+
+-- Label prefixes of cross-references and the name put before them
+local REFERENCE_PREFIXES = { ['fig:'] = 'Figure~', ['tab:'] = 'Table~' }
+
+local function is_letter(char)
+  return char ~= nil and char:find('^[A-Za-z]$') ~= nil
+end
+
+-- Code points of the characters above, for a quick check before a text is split
+local CODE_POINTS = {}
+for char in pairs(MATH) do
+  CODE_POINTS[utf8.codepoint(char)] = true
+end
+for char in pairs(TEXT) do
+  CODE_POINTS[utf8.codepoint(char)] = true
+end
+
+local function has_symbols(text)
+  -- Every character to convert is outside ASCII
+  if not text:find('[\128-\255]') then
+    return false
+  end
+  for _, code in utf8.codes(text) do
+    if CODE_POINTS[code] then
+      return true
+    end
+  end
+  return false
+end
+
+local function characters(text)
+  local chars = {}
+  for _, code in utf8.codes(text) do
+    chars[#chars + 1] = utf8.char(code)
+  end
+  return chars
+end
+
+-- A bar over the letter next to a macron at index i: (command, first, last)
+-- of the characters it replaces, or nil without such a letter
+local function bar(chars, i)
+  if is_letter(chars[i + 1]) then
+    return '\\bar{' .. chars[i + 1] .. '}', i, i + 1
+  elseif is_letter(chars[i - 1]) and chars[i - 2] ~= MACRON then
+    return '\\bar{' .. chars[i - 1] .. '}', i - 1, i
+  end
+end
+
+-- Inlines for the text of a Str, or nil if it has nothing to convert.
+-- Math symbols are put in $...$, and a run of adjacent symbols shares one
+-- pair of dollars.
+local function convert_text(text)
+  local chars = characters(text)
+  local inlines, plain = {}, {}
+  local changed = false
+
+  local function raw(latex)
+    if #plain > 0 then
+      inlines[#inlines + 1] = pandoc.Str(table.concat(plain))
+      plain = {}
+    end
+    inlines[#inlines + 1] = pandoc.RawInline('latex', latex)
+    changed = true
+  end
+
+  local i = 1
+  while i <= #chars do
+    local char = chars[i]
+    local command = MATH[char]
+    local first, last = i, i
+    if command == nil then
+      if TEXT[char] and not WRITTEN[char] then
+        raw(TEXT[char])
+      else
+        plain[#plain + 1] = char
+      end
+    else
+      if char == MACRON then
+        local barred, barred_first, barred_last = bar(chars, i)
+        if barred then
+          command, first, last = barred, barred_first, barred_last
+          if first < i then
+            -- The letter before is already in the plain text
+            plain[#plain] = nil
+          end
+        end
+      end
+      -- Open math unless the symbol before this one left it open, and close
+      -- it unless the symbol after this one continues it. Symbols that took
+      -- a letter for a bar neither continue nor are continued.
+      local before, after = chars[first - 1], chars[last + 1]
+      if not (first == i and MATH[before]) then
+        -- "{}" keeps the dollar from joining one that closes math before it into $$
+        local closes_before = MATH[before] or (is_letter(before) and chars[first - 2] == MACRON)
+        command = (closes_before and '{}$' or '$') .. command
+      end
+      if not (last == i and MATH[after]) then
+        command = command .. '$'
+      end
+      raw(command)
+    end
+    i = last + 1
+  end
+
+  if not changed then
+    return nil
+  end
+  if #plain > 0 then
+    inlines[#inlines + 1] = pandoc.Str(table.concat(plain))
+  end
+  return inlines
+end
+
+-- The text of a Math element with its symbols as commands, or nil if it has
+-- nothing to convert
+local function convert_math(text)
+  local chars = characters(text)
+  local out = {}
+  local changed = false
+  local i = 1
+  while i <= #chars do
+    local char = chars[i]
+    local command = MATH[char]
+    local last = i
+    if command == nil then
+      out[#out + 1] = TEXT[char] or char
+      changed = changed or TEXT[char] ~= nil
+    else
+      if char == MACRON then
+        local barred, first, barred_last = bar(chars, i)
+        if barred then
+          command, last = barred, barred_last
+          if first < i then
+            out[#out] = nil
+          end
+        end
+      end
+      -- Keep a command name from running into a letter that follows it;
+      -- other non-ASCII characters count as letters, a space does no harm
+      local next_char = chars[last + 1]
+      if command:find('%a$') and (is_letter(next_char) or (next_char ~= nil and #next_char > 1 and not TEXT[next_char])) then
+        command = command .. ' '
+      end
+      out[#out + 1] = command
+      changed = true
+    end
+    i = last + 1
+  end
+  if changed then
+    return table.concat(out)
+  end
+end
+
+function Str(elem)
+  if has_symbols(elem.text) then
+    return convert_text(elem.text)
+  end
+end
+
+function Math(elem)
+  if has_symbols(elem.text) then
+    local text = convert_math(elem.text)
+    if text then
+      elem.text = text
+      return elem
+    end
+  end
+end
+
+function Span(elem)
+  for _, class in ipairs(HIGHLIGHT_CLASSES) do
+    if elem.classes:includes(class) then
+      return elem.content
+    end
+  end
+end
+
+function Underline(elem)
+  return elem.content
+end
+
+function Link(elem)
+  -- A \ref, as the LaTeX reader gives it
+  if elem.attributes['reference-type'] ~= 'ref' then
+    return nil
+  end
+  local label = elem.attributes['reference'] or elem.target:gsub('^#', '')
+  for label_prefix, prefix in pairs(REFERENCE_PREFIXES) do
+    if label:sub(1, #label_prefix) == label_prefix then
+      return { pandoc.RawInline('latex', prefix), elem }
+    end
+  end
+end
+
+function Figure(elem)
+  -- Written out to add the placement, as one paragraph of raw LaTeX around
+  -- the content and the caption; the writer still sees the images
+  local inlines = pandoc.List({ pandoc.RawInline('latex', '\\begin{figure}[htbp]\n\\centering\n') })
+  inlines:extend(pandoc.utils.blocks_to_inlines(elem.content))
+  local caption = pandoc.utils.blocks_to_inlines(elem.caption.long)
+  if #caption > 0 then
+    inlines:insert(pandoc.RawInline('latex', '\n\\caption{'))
+    inlines:extend(caption)
+    inlines:insert(pandoc.RawInline('latex', '}'))
+  end
+  if elem.identifier ~= '' then
+    inlines:insert(pandoc.RawInline('latex', '\\label{' .. elem.identifier .. '}'))
+  end
+  inlines:insert(pandoc.RawInline('latex', '\n\\end{figure}'))
+  return pandoc.Plain(inlines)
+end
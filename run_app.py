@@ -6,7 +6,6 @@ This script automatically finds the correct directories and starts both services
 
 import subprocess
 import sys
-import os
 import time
 import threading
 import webbrowser
@@ -48,37 +47,28 @@ def find_frontend_dir(project_root):
 def run_flask_api(project_root):
     """Run the Flask API server"""
     print("🚀 Starting Flask API server...")
-    original_dir = os.getcwd()
     try:
-        os.chdir(project_root)
-        subprocess.run([sys.executable, 'web_api.py'], check=True)
+        subprocess.run([sys.executable, 'web_api.py'], check=True, cwd=project_root)
     except KeyboardInterrupt:
         print("Flask API server stopped")
     except Exception as e:
         print(f"❌ Error running Flask API: {e}")
-    finally:
-        os.chdir(original_dir)
 
 def run_nextjs_frontend(frontend_dir):
     """Run the Next.js frontend"""
     print("🎨 Starting Next.js frontend...")
-    original_dir = os.getcwd()
     try:
-        os.chdir(frontend_dir)
-        
         # Check if node_modules exists, if not run npm install
         if not (frontend_dir / 'node_modules').exists():
             print("📦 Installing Node.js dependencies...")
-            subprocess.run(['npm', 'install'], check=True)
+            subprocess.run(['npm', 'install'], check=True, cwd=frontend_dir)
         
         # Start the development server
-        subprocess.run(['npm', 'run', 'dev'], check=True)
+        subprocess.run(['npm', 'run', 'dev'], check=True, cwd=frontend_dir)
     except KeyboardInterrupt:
         print("Next.js frontend stopped")
     except Exception as e:
         print(f"❌ Error running Next.js frontend: {e}")
-    finally:
-        os.chdir(original_dir)
 
 def open_browser():
     """Open the web browser after a delay"""
@@ -6,7 +6,6 @@ Separate Flask API server launcher
 
 import subprocess
 import sys
-import os
 from pathlib import Path
 
 def find_project_root():
@@ -67,10 +66,6 @@ def main():
     if not check_requirements():
         sys.exit(1)
     
-    # Change to project directory
-    original_dir = os.getcwd()
-    os.chdir(project_root)
-    
     try:
         print("\n🔧 Starting backend server...")
         print("- API Server: http://localhost:5000")
@@ -78,14 +73,12 @@ def main():
         print("\nPress Ctrl+C to stop\n")
         
         # Run Flask API
-        subprocess.run([sys.executable, 'web_api.py'], check=True)
+        subprocess.run([sys.executable, 'web_api.py'], check=True, cwd=project_root)
         
     except KeyboardInterrupt:
         print("\n🛑 Backend stopped")
     except Exception as e:
         print(f"❌ Error running backend: {e}")
-    finally:
-        os.chdir(original_dir)
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file
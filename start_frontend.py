@@ -6,7 +6,6 @@ Separate Next.js development server launcher
 
 import subprocess
 import sys
-import os
 import time
 import webbrowser
 import threading
@@ -84,10 +83,6 @@ def main():
     
     print(f"✅ Frontend directory: {frontend_dir}")
     
-    # Change to frontend directory
-    original_dir = os.getcwd()
-    os.chdir(frontend_dir)
-    
     try:
         print("\n🔧 Starting frontend server...")
         print("- Web Interface: http://localhost:3000")
@@ -97,14 +92,14 @@ def main():
         # Check node_modules and install dependencies
         if not (frontend_dir / 'node_modules').exists():
             print("📦 Installing Node.js dependencies...")
-            subprocess.run(['npm', 'install'], check=True)
+            subprocess.run(['npm', 'install'], check=True, cwd=frontend_dir)
         
         # Open browser in separate thread
         browser_thread = threading.Thread(target=open_browser, daemon=True)
         browser_thread.start()
         
         # Run Next.js server
-        subprocess.run(['npm', 'run', 'dev'], check=True)
+        subprocess.run(['npm', 'run', 'dev'], check=True, cwd=frontend_dir)
         
     except KeyboardInterrupt:
         print("\n🛑 Frontend stopped")
@@ -112,8 +107,6 @@ def main():
         print(f"❌ Error running frontend: {e}")
         if "npm" in str(e):
             print("Please install npm and Node.js")
-    finally:
-        os.chdir(original_dir)
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file
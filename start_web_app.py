@@ -6,7 +6,6 @@ This script runs both the Flask API backend and Next.js frontend
 
 import subprocess
 import sys
-import os
 import time
 import threading
 import webbrowser
@@ -56,16 +55,13 @@ def run_flask_api():
         
         if not web_api_path.exists():
             # Try parent directory
-            parent_dir = current_dir.parent
-            web_api_path = parent_dir / 'web_api.py'
-            if web_api_path.exists():
-                os.chdir(parent_dir)
+            web_api_path = current_dir.parent / 'web_api.py'
         
         if not web_api_path.exists():
             print("Error: web_api.py not found!")
             return
-            
-        subprocess.run([sys.executable, 'web_api.py'], check=True)
+        
+        subprocess.run([sys.executable, 'web_api.py'], check=True, cwd=web_api_path.parent)
     except KeyboardInterrupt:
         print("Flask API server stopped")
     except Exception as e:
@@ -93,16 +89,14 @@ def run_nextjs_frontend():
                 print(f"Also looked in: {parent_dir / 'docx_to_latex'}")
                 return
     
-    os.chdir(frontend_dir)
-    
     try:
         # Check if node_modules exists, if not run npm install
-        if not Path('node_modules').exists():
+        if not (frontend_dir / 'node_modules').exists():
             print("Installing Node.js dependencies...")
-            subprocess.run(['npm', 'install'], check=True)
+            subprocess.run(['npm', 'install'], check=True, cwd=frontend_dir)
         
         # Start the development server
-        subprocess.run(['npm', 'run', 'dev'], check=True)
+        subprocess.run(['npm', 'run', 'dev'], check=True, cwd=frontend_dir)
     except KeyboardInterrupt:
         print("Next.js frontend stopped")
     except Exception as e:
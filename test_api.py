@@ -5,7 +5,6 @@ Test script to run just the Flask API for debugging
 
 import subprocess
 import sys
-import os
 from pathlib import Path
 
 def find_project_root():
@@ -41,20 +40,14 @@ def main():
     
     print(f"✅ Project root: {project_root}")
     
-    # Change to project root
-    original_dir = os.getcwd()
-    os.chdir(project_root)
-    
     try:
         print("🚀 Starting Flask API on http://localhost:5000")
         print("Press Ctrl+C to stop\n")
-        subprocess.run([sys.executable, 'web_api.py'], check=True)
+        subprocess.run([sys.executable, 'web_api.py'], check=True, cwd=project_root)
     except KeyboardInterrupt:
         print("\n🛑 Flask API stopped")
     except Exception as e:
         print(f"❌ Error running Flask API: {e}")
-    finally:
-        os.chdir(original_dir)
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file
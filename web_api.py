@@ -1,10 +1,16 @@
 from flask import Flask, request, jsonify, send_file
 from flask_cors import CORS
+import hashlib
 import os
 import tempfile
+import threading
 import uuid
+import zipfile
 from werkzeug.utils import secure_filename
-from converter import convert_docx_to_latex
+from conversion_cache import ConversionCache
+from converter import PostProcessingPipeline
+from docx_media import DEFAULT_MAX_DPI, MediaOptimizer
+from media_store import MediaStore
 import shutil
 
 app = Flask(__name__)
@@ -12,21 +18,60 @@ CORS(app)  # Enable CORS for all routes
 
 # Configuration
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
-UPLOAD_FOLDER = 'temp/uploads'
-OUTPUT_FOLDER = 'temp/outputs'
+# All working files live below the application directory, whatever the working directory
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+UPLOAD_FOLDER = os.path.join(BASE_DIR, 'temp', 'uploads')
+OUTPUT_FOLDER = os.path.join(BASE_DIR, 'temp', 'outputs')
+# 'server' keeps a warm `pandoc server` process instead of starting pandoc per request
+PANDOC_BACKEND = os.environ.get('PANDOC_BACKEND', 'pypandoc')
+CACHE_FOLDER = os.path.join(BASE_DIR, 'temp', 'cache')
+CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES', 512 * 1024 * 1024))
+# Section LaTeX of earlier conversions, so re-uploads of an edited document only convert what changed
+INCREMENTAL_FOLDER = os.path.join(BASE_DIR, 'temp', 'incremental')
+# Comma-separated post-processing pass names to skip, e.g. "remove_ul,center_tables"
+DISABLED_POST_PROCESSING_PASSES = {
+    name.strip() for name in os.environ.get('DISABLED_POST_PROCESSING_PASSES', '').split(',') if name.strip()
+}
+# Seconds a post-processing pass may run before it is aborted and the conversion goes on without it
+POST_PROCESSING_PASS_BUDGET = float(os.environ.get('POST_PROCESSING_PASS_BUDGET', 10))
+# Every distinct image once; task media directories and cache entries hold hardlinks
+MEDIA_STORE_FOLDER = os.path.join(BASE_DIR, 'temp', 'media_store')
+# Resolution images are downscaled to when a conversion asks for optimizeImages
+MEDIA_MAX_DPI = int(os.environ.get('MEDIA_MAX_DPI', DEFAULT_MAX_DPI))
 
 # Ensure directories exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+os.makedirs(INCREMENTAL_FOLDER, exist_ok=True)
+
+media_store = MediaStore(MEDIA_STORE_FOLDER)
+
+# Re-uploads of the same document with the same options are served from here
+conversion_cache = ConversionCache(CACHE_FOLDER, max_bytes=CACHE_MAX_BYTES, media_store=media_store)
 
 # Store conversion tasks
 conversion_tasks = {}
+# Requests are handled on several threads; a task's status is checked and
+# changed under this lock, so a task is never converted twice at once
+tasks_lock = threading.Lock()
+
+def incremental_state_path(filename):
+    """State file for a logical document, identified by its upload filename"""
+    # Sections are only reused when their content matches, so a shared name is harmless
+    return os.path.join(INCREMENTAL_FOLDER, hashlib.sha256(filename.encode('utf-8')).hexdigest() + '.json.gz')
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({'status': 'healthy', 'message': 'DOCX to LaTeX API is running'})
 
+@app.route('/api/cache-stats', methods=['GET'])
+def cache_stats():
+    """Conversion cache hit/miss counters and size"""
+    stats = conversion_cache.stats()
+    stats['media_store'] = media_store.stats()
+    return jsonify(stats)
+
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
     """Handle file upload"""
@@ -54,6 +99,8 @@ def upload_file():
             'status': 'uploaded',
             'original_filename': filename,
             'file_path': file_path,
+            # Parsed document, reused when the upload is converted again with other options
+            'ast_cache_dir': os.path.join(UPLOAD_FOLDER, f"{task_id}_ast"),
             'output_filename': filename.replace('.docx', '.tex'),
             'created_at': os.path.getctime(file_path)
         }
@@ -71,36 +118,47 @@ def upload_file():
 @app.route('/api/convert', methods=['POST'])
 def convert_document():
     """Convert DOCX to LaTeX"""
+    task_id = None
     try:
         data = request.get_json()
         
         if not data or 'task_id' not in data:
             return jsonify({'error': 'Task ID is required'}), 400
         
-        task_id = data['task_id']
-        
-        if task_id not in conversion_tasks:
-            return jsonify({'error': 'Invalid task ID'}), 404
-        
-        task = conversion_tasks[task_id]
-        
-        if task['status'] != 'uploaded':
-            return jsonify({'error': 'Task is not in uploadable state'}), 400
+        with tasks_lock:
+            if data['task_id'] not in conversion_tasks:
+                return jsonify({'error': 'Invalid task ID'}), 404
+            
+            task = conversion_tasks[data['task_id']]
+            
+            # Finished tasks can be converted again with other options
+            if task['status'] not in ('uploaded', 'completed', 'failed'):
+                return jsonify({'error': 'Task is not in uploadable state'}), 400
+            
+            # Update task status
+            task_id = data['task_id']
+            task['status'] = 'converting'
         
         # Get conversion options
         options = data.get('options', {})
         output_filename = data.get('output_filename', task['output_filename'])
-        
-        # Update task status
-        task['status'] = 'converting'
         task['output_filename'] = output_filename
         
         # Prepare output paths
         output_path = os.path.join(OUTPUT_FOLDER, f"{task_id}_{output_filename}")
         media_path = os.path.join(OUTPUT_FOLDER, f"{task_id}_media")
         
+        # Drop the results of an earlier conversion of this upload
+        if task.get('output_path') and task['output_path'] != output_path and os.path.exists(task['output_path']):
+            os.remove(task['output_path'])
+        media_store.release(media_path)
+        if os.path.exists(media_path + '.zip'):
+            os.remove(media_path + '.zip')
+        
         # Perform conversion
-        success, message = convert_docx_to_latex(
+        pipeline = PostProcessingPipeline(disabled=DISABLED_POST_PROCESSING_PASSES, pass_budget=POST_PROCESSING_PASS_BUDGET)
+        media_optimizer = MediaOptimizer(max_dpi=MEDIA_MAX_DPI) if options.get('optimizeImages', False) else None
+        success, message = conversion_cache.convert(
             docx_path=task['file_path'],
             latex_path=output_path,
             generate_toc=options.get('generateToc', False),
@@ -108,25 +166,54 @@ def convert_document():
             latex_template_path=None,  # Could be added later for custom templates
             overleaf_compatible=options.get('overleafCompatible', True),
             preserve_styles=options.get('preserveStyles', True),
-            preserve_linebreaks=options.get('preserveLineBreaks', True)
+            preserve_linebreaks=options.get('preserveLineBreaks', True),
+            backend=PANDOC_BACKEND,
+            pipeline=pipeline,
+            media_optimizer=media_optimizer,
+            ast_cache_dir=task['ast_cache_dir'],
+            incremental_state_path=incremental_state_path(task['original_filename']),
+            minimal_preamble=options.get('minimalPreamble', False),
+            ast_post_processing=options.get('astPostProcessing', False)
         )
         
+        # Empty on a cache hit, since no post-processing ran
+        slowest = sorted(pipeline.stats.values(), key=lambda stats: stats.seconds, reverse=True)[:3]
+        if slowest:
+            print(f"Slowest post-processing passes for {task_id}: " + ", ".join(
+                f"{stats.name} {stats.seconds * 1000:.1f}ms" for stats in slowest
+            ))
+        if pipeline.timed_out_passes:
+            print(f"Post-processing passes aborted for {task_id} after {POST_PROCESSING_PASS_BUDGET}s: "
+                  + ", ".join(pipeline.timed_out_passes))
+        if media_optimizer and media_optimizer.stats.images:
+            media_stats = media_optimizer.stats
+            print(f"Optimized {media_stats.optimized} of {media_stats.images} images for {task_id}: "
+                  f"{media_stats.bytes_before / 1024:.0f} KB -> {media_stats.bytes_after / 1024:.0f} KB "
+                  f"in {media_stats.seconds:.2f}s")
+        # None on a cache hit; the cached message still reports the count
+        dropped_stats = pipeline.stats.get('drop_unused_packages')
+        if dropped_stats:
+            print(f"Minimal preamble for {task_id}: dropped {dropped_stats.matches} unused packages")
+        
         if success:
-            task['status'] = 'completed'
             task['output_path'] = output_path
             task['media_path'] = media_path if os.path.exists(media_path) else None
             task['conversion_message'] = message
+            # Set last, so other requests never see a completed task without its paths
+            task['status'] = 'completed'
             
             return jsonify({
                 'task_id': task_id,
                 'status': 'completed',
                 'message': message,
                 'output_filename': output_filename,
-                'has_media': os.path.exists(media_path)
+                'has_media': os.path.exists(media_path),
+                'media_bytes_saved': media_optimizer.stats.bytes_saved if media_optimizer else 0,
+                'packages_dropped': dropped_stats.matches if dropped_stats else None
             })
         else:
-            task['status'] = 'failed'
             task['error_message'] = message
+            task['status'] = 'failed'
             
             return jsonify({
                 'task_id': task_id,
@@ -136,9 +223,9 @@ def convert_document():
             
     except Exception as e:
         # Update task status if possible
-        if 'task_id' in locals() and task_id in conversion_tasks:
-            conversion_tasks[task_id]['status'] = 'failed'
+        if task_id in conversion_tasks:
             conversion_tasks[task_id]['error_message'] = str(e)
+            conversion_tasks[task_id]['status'] = 'failed'
         
         return jsonify({'error': f'Conversion failed: {str(e)}'}), 500
 
@@ -211,58 +298,19 @@ def download_complete_package(task_id):
         if not os.path.exists(task['output_path']):
             return jsonify({'error': 'Output file not found'}), 404
         
-        # Create a temporary directory for the complete package
-        import tempfile
         base_name = task['output_filename'].replace('.tex', '')
         
-        with tempfile.TemporaryDirectory() as temp_dir:
-            package_dir = os.path.join(temp_dir, base_name)
-            os.makedirs(package_dir, exist_ok=True)
-            
-            # Copy and fix LaTeX file for Overleaf compatibility
-            latex_dest = os.path.join(package_dir, task['output_filename'])
-            
-            # Read the original LaTeX file
-            with open(task['output_path'], 'r', encoding='utf-8') as f:
-                latex_content = f.read()
-            
-            # Fix image paths to use relative paths suitable for Overleaf
-            # Convert paths like: task_id_media/media/image.png -> media/image.png
-            import re
-            
-            # Fix paths with task IDs
-            latex_content = re.sub(
-                r'\\includegraphics(\[[^\]]*\])?\{[^{}]*[a-f0-9\-]+_media[/\\]media[/\\]([^{}]+)\}',
-                r'\\includegraphics\1{media/\2}',
-                latex_content
-            )
-            
-            # Fix any remaining absolute paths
-            latex_content = re.sub(
-                r'\\includegraphics(\[[^\]]*\])?\{[^{}]*[/\\]media[/\\]([^{}]+)\}',
-                r'\\includegraphics\1{media/\2}',
-                latex_content
-            )
-            
-            # Write the fixed LaTeX file
-            with open(latex_dest, 'w', encoding='utf-8') as f:
-                f.write(latex_content)
-            
-            # Copy media files if they exist
-            if task.get('media_path') and os.path.exists(task['media_path']):
-                media_dest = os.path.join(package_dir, 'media')
-                
-                # Check if there's a nested media folder structure
-                inner_media = os.path.join(task['media_path'], 'media')
-                if os.path.exists(inner_media):
-                    # Copy from the inner media folder to avoid media/media/ nesting
-                    shutil.copytree(inner_media, media_dest)
-                else:
-                    # Copy the media_path directly if no nesting
-                    shutil.copytree(task['media_path'], media_dest)
-            
-            # Create README file
-            readme_content = f"""# {base_name} - DOCX to LaTeX Conversion
+        # Read the original LaTeX file
+        with open(task['output_path'], 'r', encoding='utf-8') as f:
+            latex_content = f.read()
+        
+        # Images are referenced below the task's media directory (or already
+        # relative with Overleaf compatibility); make them relative to the package
+        if task.get('media_path'):
+            latex_content = latex_content.replace(task['media_path'] + '/', '')
+        
+        # Create README file
+        readme_content = f"""# {base_name} - DOCX to LaTeX Conversion
 
 ## Package Contents:
 
@@ -304,21 +352,27 @@ pdflatex {task['output_filename']}
 DOCX to LaTeX Web Converter
 https://github.com/your-username/docx-to-latex
 """
-            
-            readme_path = os.path.join(package_dir, 'README.txt')
-            with open(readme_path, 'w', encoding='utf-8') as f:
-                f.write(readme_content)
-            
-            # Create ZIP file
-            zip_path = os.path.join(temp_dir, f"{base_name}_complete.zip")
-            shutil.make_archive(zip_path.replace('.zip', ''), 'zip', package_dir)
-            
-            return send_file(
-                zip_path,
-                as_attachment=True,
-                download_name=f"{base_name}_complete.zip",
-                mimetype='application/zip'
-            )
+        
+        # The ZIP is written straight from the task's files; nothing is copied first
+        package = tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024)
+        with zipfile.ZipFile(package, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr(task['output_filename'], latex_content)
+            # Media files are always written below media/
+            media_dir = os.path.join(task['media_path'], 'media') if task.get('media_path') else None
+            if media_dir and os.path.isdir(media_dir):
+                for root, _, files in os.walk(media_dir):
+                    for name in sorted(files):
+                        path = os.path.join(root, name)
+                        archive.write(path, os.path.join('media', os.path.relpath(path, media_dir)))
+            archive.writestr('README.txt', readme_content)
+        package.seek(0)
+        
+        return send_file(
+            package,
+            as_attachment=True,
+            download_name=f"{base_name}_complete.zip",
+            mimetype='application/zip'
+        )
         
     except Exception as e:
         return jsonify({'error': f'Complete package download failed: {str(e)}'}), 500
@@ -354,31 +408,37 @@ def get_task_status(task_id):
 def cleanup_task(task_id):
     """Clean up task files"""
     try:
-        if task_id not in conversion_tasks:
-            return jsonify({'error': 'Invalid task ID'}), 404
-        
-        task = conversion_tasks[task_id]
+        with tasks_lock:
+            if task_id not in conversion_tasks:
+                return jsonify({'error': 'Invalid task ID'}), 404
+            
+            # Removing the files of a running conversion would leave it half written
+            if conversion_tasks[task_id]['status'] == 'converting':
+                return jsonify({'error': 'Task is being converted'}), 409
+            
+            task = conversion_tasks.pop(task_id)
         
         # Remove uploaded file
         if os.path.exists(task['file_path']):
             os.remove(task['file_path'])
         
+        # Remove cached document AST
+        if os.path.exists(task['ast_cache_dir']):
+            shutil.rmtree(task['ast_cache_dir'])
+        
         # Remove output file
         if task.get('output_path') and os.path.exists(task['output_path']):
             os.remove(task['output_path'])
         
-        # Remove media directory
-        if task.get('media_path') and os.path.exists(task['media_path']):
-            shutil.rmtree(task['media_path'])
+        # Remove media directory, and the stored images no other task uses
+        if task.get('media_path'):
+            media_store.release(task['media_path'])
         
         # Remove media ZIP if it exists
-        media_zip = task.get('media_path', '') + '.zip'
-        if os.path.exists(media_zip):
+        media_zip = (task.get('media_path') or '') + '.zip'
+        if task.get('media_path') and os.path.exists(media_zip):
             os.remove(media_zip)
         
-        # Remove task from memory
-        del conversion_tasks[task_id]
-        
         return jsonify({'message': 'Task cleaned up successfully'})
         
     except Exception as e:
@@ -389,7 +449,8 @@ def list_tasks():
     """List all conversion tasks (for debugging)"""
     try:
         tasks_summary = {}
-        for task_id, task in conversion_tasks.items():
+        # Copied, as other requests may add or remove tasks meanwhile
+        for task_id, task in list(conversion_tasks.items()):
             tasks_summary[task_id] = {
                 'status': task['status'],
                 'original_filename': task['original_filename'],
@@ -410,7 +471,7 @@ def cleanup_old_files():
         current_time = time.time()
         cutoff_time = current_time - (24 * 60 * 60)  # 24 hours ago
         
-        for folder in [UPLOAD_FOLDER, OUTPUT_FOLDER]:
+        for folder in [UPLOAD_FOLDER, OUTPUT_FOLDER, INCREMENTAL_FOLDER]:
             if os.path.exists(folder):
                 for filename in os.listdir(folder):
                     file_path = os.path.join(folder, filename)
@@ -422,6 +483,9 @@ def cleanup_old_files():
                         dir_time = os.path.getctime(file_path)
                         if dir_time < cutoff_time:
                             shutil.rmtree(file_path)
+        
+        # Stored images whose task directories were removed above
+        media_store.collect_garbage()
     except Exception as e:
         print(f"Warning: Failed to cleanup old files: {e}")
 
@@ -439,5 +503,6 @@ if __name__ == '__main__':
     print("  GET /api/status/<task_id> - Get conversion status")
     print("  DELETE /api/cleanup/<task_id> - Cleanup task files")
     print("  GET /api/health - Health check")
+    print("  GET /api/cache-stats - Conversion cache statistics")
     
-    app.run(debug=True, host='0.0.0.0', port=5000) 
\ No newline at end of file
+    app.run(debug=True, host='0.0.0.0', port=5000, threaded=True) 
\ No newline at end of file